@@ -0,0 +1,142 @@
+import os
+import warnings
+import numpy as np
+from .scoring import ATTRIBUTES
+
+# What calibration looks at: the total and every cupping attribute
+METRICS = ("total_score",) + ATTRIBUTES
+# A score further than this many robust standard deviations from its sample's
+# consensus is flagged as an outlier
+OUTLIER_Z = float(os.getenv("CALIBRATION_OUTLIER_Z", "3.0"))
+# Floor for the robust standard deviation: the form's smallest step, so a table that
+# agrees perfectly does not flag a cupper a quarter point off
+MIN_SCALE = 0.25
+# 1.4826 x median absolute deviation estimates the standard deviation of normal data
+MAD_TO_STD = 1.4826
+
+def number(value):
+    value = float(value)
+    return None if np.isnan(value) or np.isinf(value) else round(value, 4)
+
+def metric_values(values):
+    return {metric: number(value) for metric, value in zip(METRICS, values)}
+
+def score_cube(sheets):
+    # (cuppers, samples, metrics) array of the scores, NaN where a cupper did not score
+    # a sample or left an attribute out, plus the cupper and sample labels
+    cuppers, cupper_index = np.unique([sheet["cupper"] for sheet in sheets], return_inverse=True)
+    samples, sample_index = np.unique([sheet["roast_id"] for sheet in sheets], return_inverse=True)
+    cube = np.full((len(cuppers), len(samples), len(METRICS)), np.nan)
+    cube[cupper_index, sample_index] = np.array(
+        [[sheet[metric] for metric in METRICS] for sheet in sheets], dtype=float
+    )
+    return cube, cuppers, samples
+
+def icc(complete):
+    """Intraclass correlations of (samples, cuppers, metrics) scores without gaps.
+
+    Returns ICC(2,1), absolute agreement: cuppers give the same scores, and ICC(3,1),
+    consistency: cuppers rank the samples alike whatever their own level. One value per
+    metric, NaN when it is undefined (fewer than 2 samples or cuppers, no variance).
+    """
+    n, k = complete.shape[:2]
+    if n < 2 or k < 2:
+        return np.full(complete.shape[2], np.nan), np.full(complete.shape[2], np.nan)
+    grand = complete.mean(axis=(0, 1))
+    ss_samples = k * ((complete.mean(axis=1) - grand) ** 2).sum(axis=0)
+    ss_cuppers = n * ((complete.mean(axis=0) - grand) ** 2).sum(axis=0)
+    ss_error = ((complete - grand) ** 2).sum(axis=(0, 1)) - ss_samples - ss_cuppers
+    ms_samples = ss_samples / (n - 1)
+    ms_cuppers = ss_cuppers / (k - 1)
+    ms_error = ss_error / ((n - 1) * (k - 1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        absolute = (ms_samples - ms_error) / (ms_samples + (k - 1) * ms_error + k * (ms_cuppers - ms_error) / n)
+        consistency = (ms_samples - ms_error) / (ms_samples + (k - 1) * ms_error)
+    return absolute, consistency
+
+def calibrate(sheets, outlier_z=OUTLIER_Z):
+    """Calibration statistics of a cupping session.
+
+    sheets are dicts with cupper, roast_id, score_id and the METRICS, one per cupper
+    and sample. The consensus of a sample is the median of its cuppers; a cupper's bias
+    is their mean deviation from it. Outliers are scores more than outlier_z robust
+    standard deviations (pooled over the session, per metric) from the consensus.
+    """
+    cube, cuppers, samples = score_cube(sheets)
+    scored = ~np.isnan(cube)
+    # Samples or metrics nobody scored give NaN ("mean of empty slice") rather than warnings
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        consensus = np.nanmedian(cube, axis=0)
+        spread = np.nanstd(cube, axis=0, ddof=1)
+        deviation = cube - consensus
+        bias = np.nanmean(deviation, axis=1)
+        mean_abs = np.nanmean(np.abs(deviation), axis=1)
+        scale = np.fmax(MAD_TO_STD * np.nanmedian(np.abs(deviation), axis=(0, 1)), MIN_SCALE)
+    z = deviation / scale
+    outlier = np.abs(np.nan_to_num(z)) > outlier_z
+
+    # Correlation of each cupper's totals with the consensus over the samples they scored
+    totals, reference = cube[:, :, 0], np.broadcast_to(consensus[:, 0], cube.shape[:2])
+    mask = scored[:, :, 0]
+    count = mask.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_mean = np.where(mask, totals, 0).sum(axis=1) / count
+        y_mean = np.where(mask, reference, 0).sum(axis=1) / count
+        x = np.where(mask, totals - x_mean[:, None], 0)
+        y = np.where(mask, reference - y_mean[:, None], 0)
+        correlation = (x * y).sum(axis=1) / np.sqrt((x * x).sum(axis=1) * (y * y).sum(axis=1))
+
+    # Agreement is measured on the samples every cupper scored
+    complete = scored[:, :, 0].all(axis=0)
+    absolute, consistency = icc(np.nan_to_num(cube[:, complete].transpose(1, 0, 2)))
+    rated_by_all = scored[:, complete].all(axis=(0, 1))
+    absolute, consistency = np.where(rated_by_all, absolute, np.nan), np.where(rated_by_all, consistency, np.nan)
+
+    score_ids = {(sheet["cupper"], sheet["roast_id"]): sheet.get("score_id") for sheet in sheets}
+    outliers = [
+        {
+            "cupper": str(cuppers[c]),
+            "roast_id": str(samples[s]),
+            "score_id": score_ids.get((cuppers[c], samples[s])),
+            "metric": METRICS[m],
+            "value": number(cube[c, s, m]),
+            "consensus": number(consensus[s, m]),
+            "deviation": number(deviation[c, s, m]),
+            "z": number(z[c, s, m]),
+        }
+        for c, s, m in zip(*np.nonzero(outlier))
+    ]
+    return {
+        "sheets": int(scored[:, :, 0].sum()),
+        "cuppers": len(cuppers),
+        "samples": len(samples),
+        "complete_samples": int(complete.sum()),
+        "outlier_z": outlier_z,
+        "agreement": {
+            metric: {"icc_absolute": number(a), "icc_consistency": number(c)}
+            for metric, a, c in zip(METRICS, absolute, consistency)
+        },
+        "cupper_bias": [
+            {
+                "cupper": str(cuppers[c]),
+                "samples": int(count[c]),
+                "bias": metric_values(bias[c]),
+                "mean_abs_deviation": number(mean_abs[c, 0]),
+                "correlation": number(correlation[c]),
+                "outliers": int(outlier[c].sum()),
+            }
+            for c in range(len(cuppers))
+        ],
+        "sample_consensus": [
+            {
+                "roast_id": str(samples[s]),
+                "cuppers": int(scored[:, s, 0].sum()),
+                "consensus": metric_values(consensus[s]),
+                "std": number(spread[s, 0]),
+                "outliers": int(outlier[:, s].sum()),
+            }
+            for s in range(len(samples))
+        ],
+        "outliers": outliers,
+    }
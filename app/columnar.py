@@ -0,0 +1,66 @@
+import sqlalchemy
+
+# pyarrow is imported on first use: it is only needed when a client asks for Arrow or
+# Parquet, and importing it would add ~200ms to every cold start
+
+# Media types list endpoints can answer with besides JSON, chosen from the Accept header
+ARROW_STREAM_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_TYPE = "application/vnd.apache.parquet"
+JSON_TYPE = "application/json"
+MEDIA_TYPE_ALIASES = {"application/x-parquet": PARQUET_TYPE}
+PARQUET_COMPRESSION = "zstd"
+
+def negotiate(accept):
+    # Pick the best supported media type from an Accept header; JSON unless the client
+    # prefers Arrow or Parquet
+    choices = []
+    for position, item in enumerate((accept or "").split(",")):
+        media_type, *options = [part.strip() for part in item.split(";")]
+        media_type = MEDIA_TYPE_ALIASES.get(media_type.lower(), media_type.lower())
+        if media_type not in (ARROW_STREAM_TYPE, PARQUET_TYPE, JSON_TYPE):
+            continue
+        quality = 1.0
+        for option in options:
+            name, _, value = option.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            choices.append((-quality, position, media_type))
+    return min(choices)[2] if choices else JSON_TYPE
+
+def arrow_type(sql_type):
+    import pyarrow as pa
+    if isinstance(sql_type, sqlalchemy.Integer):
+        return pa.int64()
+    if isinstance(sql_type, sqlalchemy.Float):
+        return pa.float64()
+    if isinstance(sql_type, sqlalchemy.Boolean):
+        return pa.bool_()
+    return pa.string()
+
+def schema_for(columns):
+    # Arrow schema from the (labelled) SQLAlchemy columns of a query, in select order
+    import pyarrow as pa
+    return pa.schema([pa.field(column.name, arrow_type(column.type)) for column in columns])
+
+def to_table(rows, schema):
+    # Build each column straight from the rows, without going through dicts
+    import pyarrow as pa
+    return pa.Table.from_arrays(
+        [pa.array([row[field.name] for row in rows], type=field.type) for field in schema],
+        schema=schema,
+    )
+
+def encode(table, media_type):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    sink = pa.BufferOutputStream()
+    if media_type == PARQUET_TYPE:
+        pq.write_table(table, sink, compression=PARQUET_COMPRESSION)
+    else:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue().to_pybytes()
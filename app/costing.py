@@ -0,0 +1,206 @@
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timezone
+import sqlalchemy
+from .db import coffee_roasts, green_beans, green_bean_costs, green_bean_stock_movements, table_versions
+
+logger = logging.getLogger(__name__)
+
+# "fifo" consumes the oldest stock first; "average" keeps one layer at the weighted
+# average cost of everything received
+METHODS = ("fifo", "average")
+# Method for beans without cost layers yet; existing beans keep theirs until rebuilt
+# with another one (python -m app.rebuild_costs --method average)
+DEFAULT_METHOD = os.getenv("COSTING_METHOD", "fifo")
+# Layers at or below this are used up; absorbs float rounding in the ledger
+EPSILON_KG = 1e-9
+# Replayed and stored amounts further apart than this count as a mismatch
+TOLERANCE = 1e-6
+
+class CostLayers:
+    """Stock of one green bean as cost layers, oldest first: [remaining kg, unit cost].
+
+    Stock received without a price is valued at 0.
+    """
+
+    def __init__(self, method, layers=(), sequence=0):
+        self.method = method
+        self.layers = [list(layer) for layer in layers]
+        # Position of the last movement applied, so replays follow the same order
+        self.sequence = sequence
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row["method"], json.loads(row["layers"]), row["sequence"])
+
+    @property
+    def quantity_kg(self):
+        return sum(quantity for quantity, _ in self.layers)
+
+    @property
+    def value(self):
+        return sum(quantity * unit_cost for quantity, unit_cost in self.layers)
+
+    def receive(self, quantity_kg, unit_cost):
+        unit_cost = unit_cost or 0.0
+        if self.method == "average" and self.layers:
+            quantity, average = self.layers[0]
+            total = quantity + quantity_kg
+            self.layers[0] = [total, (quantity * average + quantity_kg * unit_cost) / total]
+        else:
+            self.layers.append([quantity_kg, unit_cost])
+        return quantity_kg * unit_cost
+
+    def consume(self, quantity_kg):
+        # Cost of the stock taken; anything beyond the layers is taken at no cost
+        cost = 0.0
+        remaining = quantity_kg
+        while remaining > EPSILON_KG and self.layers:
+            layer = self.layers[0]
+            taken = min(layer[0], remaining)
+            cost += taken * layer[1]
+            layer[0] -= taken
+            remaining -= taken
+            if layer[0] <= EPSILON_KG:
+                self.layers.pop(0)
+        return cost
+
+    def apply(self, movement):
+        # Sets the movement's sequence and cost: what it added to (+) or took from (-)
+        # the inventory value
+        self.sequence += 1
+        change = movement["change_kg"] or 0.0
+        if change > 0:
+            cost = self.receive(change, movement["unit_cost"])
+        else:
+            cost = -self.consume(-change)
+        movement.update(sequence=self.sequence, cost=cost)
+        return cost
+
+    def row(self, bean_id):
+        return {
+            "bean_id": bean_id,
+            "method": self.method,
+            "quantity_kg": self.quantity_kg,
+            "value": self.value,
+            "layers": json.dumps(self.layers),
+            "sequence": self.sequence,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+def differs(a, b):
+    if a is None or b is None:
+        return a is not b
+    return abs(a - b) > TOLERANCE
+
+def replay_ledger(connection, method=None, default_method=DEFAULT_METHOD):
+    # Cost the whole stock ledger from scratch, bean by bean in ledger order. Receipts
+    # recorded without a unit cost are priced at the bean's price_per_kg.
+    # Returns (states by bean, replayed movements, green cost by roast).
+    methods = {row.bean_id: row.method for row in connection.execute(
+        sqlalchemy.select(green_bean_costs.c.bean_id, green_bean_costs.c.method)
+    )}
+    query = sqlalchemy.select(
+        green_bean_stock_movements.c.movement_id,
+        green_bean_stock_movements.c.bean_id,
+        green_bean_stock_movements.c.roast_id,
+        green_bean_stock_movements.c.change_kg,
+        green_bean_stock_movements.c.unit_cost,
+        green_bean_stock_movements.c.cost,
+        green_bean_stock_movements.c.sequence,
+        green_beans.c.price_per_kg,
+    ).select_from(
+        green_bean_stock_movements.outerjoin(green_beans, green_beans.c.bean_id == green_bean_stock_movements.c.bean_id)
+    ).where(green_bean_stock_movements.c.bean_id.isnot(None)).order_by(
+        green_bean_stock_movements.c.bean_id,
+        green_bean_stock_movements.c.sequence.asc().nullslast(),
+        green_bean_stock_movements.c.created_at,
+        green_bean_stock_movements.c.movement_id,
+    )
+    states = {}
+    movements = []
+    roast_costs = defaultdict(float)
+    for row in connection.execute(query):
+        state = states.get(row.bean_id)
+        if state is None:
+            state = states[row.bean_id] = CostLayers(method or methods.get(row.bean_id, default_method))
+        movement = dict(row._mapping)
+        stored = (movement["sequence"], movement["cost"], movement["unit_cost"])
+        if movement["change_kg"] and movement["change_kg"] > 0 and movement["unit_cost"] is None:
+            movement["unit_cost"] = movement["price_per_kg"]
+        state.apply(movement)
+        movement["stored"] = stored
+        movements.append(movement)
+        if movement["roast_id"]:
+            roast_costs[movement["roast_id"]] -= movement["cost"]
+    return states, movements, roast_costs
+
+def rebuild(connection, method=None, default_method=DEFAULT_METHOD, check_only=False):
+    """Replay the ledger and compare with the incrementally maintained costs.
+
+    Writes the replayed state unless check_only. With method, every bean is switched to
+    it; otherwise each bean keeps its own. Returns counts of what was checked and of
+    what disagreed with the stored state.
+    """
+    states, movements, roast_costs = replay_ledger(connection, method, default_method)
+
+    stored_states = {row.bean_id: row for row in connection.execute(green_bean_costs.select())}
+    bean_mismatches = []
+    for bean_id in set(states) | set(stored_states):
+        state = states.get(bean_id, CostLayers(method or default_method))
+        stored = stored_states.get(bean_id)
+        if (stored is None or stored.method != state.method or differs(stored.quantity_kg, state.quantity_kg)
+                or differs(stored.value, state.value)):
+            bean_mismatches.append(bean_id)
+
+    movement_updates = [
+        {"movement_id": m["movement_id"], "sequence": m["sequence"], "cost": m["cost"], "unit_cost": m["unit_cost"]}
+        for m in movements
+        if m["stored"][0] != m["sequence"] or differs(m["stored"][1], m["cost"]) or m["stored"][2] != m["unit_cost"]
+    ]
+
+    roast_updates = []
+    query = sqlalchemy.select(coffee_roasts.c.roast_id, coffee_roasts.c.green_cost).where(
+        sqlalchemy.or_(coffee_roasts.c.bean_id.isnot(None), coffee_roasts.c.green_cost.isnot(None))
+    )
+    for row in connection.execute(query):
+        cost = roast_costs.get(row.roast_id)
+        if differs(row.green_cost, cost):
+            roast_updates.append({"roast_id": row.roast_id, "green_cost": cost})
+
+    report = {
+        "beans": len(states),
+        "movements": len(movements),
+        "roasts": len(roast_costs),
+        "bean_mismatches": len(bean_mismatches),
+        "movement_mismatches": len(movement_updates),
+        "roast_mismatches": len(roast_updates),
+        "examples": sorted(bean_mismatches)[:10],
+    }
+    if check_only:
+        return report
+
+    if movement_updates:
+        connection.execute(green_bean_stock_movements.update().where(
+            green_bean_stock_movements.c.movement_id == sqlalchemy.bindparam("b_movement_id")
+        ).values(
+            sequence=sqlalchemy.bindparam("sequence"),
+            cost=sqlalchemy.bindparam("cost"),
+            unit_cost=sqlalchemy.bindparam("unit_cost"),
+        ), [dict(update, b_movement_id=update.pop("movement_id")) for update in movement_updates])
+    if roast_updates:
+        connection.execute(coffee_roasts.update().where(
+            coffee_roasts.c.roast_id == sqlalchemy.bindparam("b_roast_id")
+        ).values(green_cost=sqlalchemy.bindparam("green_cost")),
+            [{"b_roast_id": update["roast_id"], "green_cost": update["green_cost"]} for update in roast_updates])
+    connection.execute(green_bean_costs.delete())
+    if states:
+        connection.execute(green_bean_costs.insert(), [state.row(bean_id) for bean_id, state in states.items()])
+    # Costs show under these tables' ETags; bumped in this transaction, as the API's writes do
+    cost_tables = (coffee_roasts, green_beans, green_bean_stock_movements)
+    connection.execute(table_versions.update().where(
+        table_versions.c.table_name.in_([table.name for table in cost_tables])
+    ).values(version=table_versions.c.version + 1, updated_at=datetime.now(timezone.utc).isoformat()))
+    return report
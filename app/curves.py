@@ -0,0 +1,66 @@
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+
+# Curves are stored as fixed-point integers (value * scale), delta-encoded so that
+# slowly changing temperatures become small numbers, packed little-endian into a
+# 32-bit array and zlib-compressed
+CURVE_ENCODING = "i32-delta-zlib-v1"
+TEMP_SCALE = 100  # 0.01 degree resolution
+TIME_SCALE = 1000  # millisecond resolution for burner event times
+MIN_SAMPLE_RATE_HZ = 1.0
+MAX_SAMPLE_RATE_HZ = 10.0
+
+def encode_series(values, scale):
+    fixed = [round(value * scale) for value in values]
+    deltas = array("i", fixed[:1] + [b - a for a, b in zip(fixed, fixed[1:])])
+    if sys.byteorder == "big":
+        deltas.byteswap()
+    return zlib.compress(deltas.tobytes())
+
+def decode_series(blob, scale):
+    if blob is None:
+        return None
+    deltas = array("i")
+    deltas.frombytes(zlib.decompress(blob))
+    if sys.byteorder == "big":
+        deltas.byteswap()
+    return [value / scale for value in accumulate(deltas)]
+
+def lttb(times, values, threshold):
+    # Largest-Triangle-Three-Buckets: keep the first and last points and, from each of
+    # threshold - 2 buckets in between, the point forming the largest triangle with the
+    # previously kept point and the average of the next bucket. Preserves peaks and turns.
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return list(times), list(values)
+
+    kept_times = [times[0]]
+    kept_values = [values[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_start = end
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        avg_t = sum(times[next_start:next_end]) / (next_end - next_start)
+        avg_v = sum(values[next_start:next_end]) / (next_end - next_start)
+
+        at, av = times[a], values[a]
+        best = start
+        best_area = -1.0
+        for j in range(start, end):
+            area = abs((at - avg_t) * (values[j] - av) - (at - times[j]) * (avg_v - av))
+            if area > best_area:
+                best_area = area
+                best = j
+        kept_times.append(times[best])
+        kept_values.append(values[best])
+        a = best
+    kept_times.append(times[-1])
+    kept_values.append(values[-1])
+    return kept_times, kept_values
@@ -0,0 +1,339 @@
+import os
+import sqlalchemy
+import logging
+from .pool import InstrumentedDatabase
+from .sqlitepool import SQLiteConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Used when DATABASE_URL is not set, e.g. for local development
+DEFAULT_DATABASE_URL = "sqlite:///./coffee_scores.db"
+
+# Get database URL from environment variables
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+if not DATABASE_URL:
+    logger.warning(f"DATABASE_URL is not set, using {DEFAULT_DATABASE_URL}")
+    DATABASE_URL = DEFAULT_DATABASE_URL
+
+# If using PostgreSQL, convert the URL format
+if DATABASE_URL.startswith("postgres://"):
+    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+
+# Optional replica (a streaming standby, or any copy such as a SQLite snapshot) that
+# list, export, search and stats reads go to; see app/replica.py
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+if DATABASE_READ_URL and DATABASE_READ_URL.startswith("postgres://"):
+    DATABASE_READ_URL = DATABASE_READ_URL.replace("postgres://", "postgresql://", 1)
+
+# Connection pool. Min/max size and the statement cache apply to the asyncpg pool
+# (set DB_STATEMENT_CACHE_SIZE=0 behind pgbouncer in transaction mode); SQLite opens a
+# connection per use and only uses the statement cache size.
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "10"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+# Requests waiting longer than this for a connection fail with 503 instead of queueing
+DB_ACQUIRE_TIMEOUT_S = float(os.getenv("DB_ACQUIRE_TIMEOUT_S", "10"))
+# Server-side statement_timeout (Postgres only), 0 for none
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+# Per-statement timings for /db/stats, and the threshold for logging slow queries
+DB_QUERY_STATS = os.getenv("DB_QUERY_STATS", "true").lower() in ("1", "true", "yes")
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "500"))
+
+# SQLite profile for small single-server deployments. "wal" puts the database in WAL
+# mode with the pragmas below and keeps its connections open: every write goes through
+# one writer connection, reads on the REPLICA_ROUTES use SQLITE_READ_POOL_SIZE read-only
+# connections that WAL lets run alongside it. "default" leaves SQLite's defaults and a
+# new connection per use.
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "default").lower()
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# NORMAL is durable in WAL mode except for the last commits before a power loss
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", "4"))
+
+def uses_sqlite_profile(url):
+    return SQLITE_PROFILE == "wal" and url.startswith("sqlite") and ":memory:" not in url
+
+def sqlite_pragmas(read_only=False):
+    pragmas = [f"busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}", f"mmap_size = {SQLITE_MMAP_SIZE}"]
+    if read_only:
+        return pragmas + ["query_only = ON"]
+    return ["journal_mode = WAL", f"synchronous = {SQLITE_SYNCHRONOUS}"] + pragmas
+
+def pool_options(url):
+    if url.startswith("sqlite"):
+        return {"cached_statements": DB_STATEMENT_CACHE_SIZE}
+    if not url.startswith("postgresql"):
+        return {}
+    options = {
+        "min_size": min(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+        "max_size": DB_POOL_MAX_SIZE,
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+    }
+    if DB_STATEMENT_TIMEOUT_MS:
+        options["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+    return options
+
+def connect_database(url, read_only=False):
+    connection = InstrumentedDatabase(
+        url,
+        acquire_timeout=DB_ACQUIRE_TIMEOUT_S or None,
+        query_stats=DB_QUERY_STATS,
+        slow_query_s=DB_SLOW_QUERY_MS / 1000 if DB_SLOW_QUERY_MS else None,
+        **pool_options(url),
+    )
+    if uses_sqlite_profile(url):
+        connection._backend._pool = SQLiteConnectionPool(
+            connection.url.database,
+            size=SQLITE_READ_POOL_SIZE if read_only else 1,
+            read_only=read_only,
+            pragmas=sqlite_pragmas(read_only),
+            **pool_options(url),
+        )
+    return connection
+
+# Create database connection; the replica gets a pool of its own, sized the same. With
+# the SQLite profile and no replica, reads get a read-only pool on the same file.
+database = connect_database(DATABASE_URL)
+if DATABASE_READ_URL:
+    read_database = connect_database(DATABASE_READ_URL)
+elif uses_sqlite_profile(DATABASE_URL):
+    read_database = connect_database(DATABASE_URL, read_only=True)
+else:
+    read_database = database
+metadata = sqlalchemy.MetaData()
+
+# Define tables
+coffee_roasts = sqlalchemy.Table(
+    "coffee_roasts",
+    metadata,
+    sqlalchemy.Column("roast_id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("bean_id", sqlalchemy.String),
+    sqlalchemy.Column("date", sqlalchemy.String),
+    sqlalchemy.Column("coffee_name", sqlalchemy.String),
+    sqlalchemy.Column("agtron_whole", sqlalchemy.Integer),
+    sqlalchemy.Column("agtron_ground", sqlalchemy.Integer),
+    sqlalchemy.Column("drop_temp", sqlalchemy.Float),
+    sqlalchemy.Column("development_time", sqlalchemy.Float),
+    sqlalchemy.Column("total_time", sqlalchemy.Float),
+    sqlalchemy.Column("dtr_ratio", sqlalchemy.Float),
+    sqlalchemy.Column("amount_used_kg", sqlalchemy.Float),
+    sqlalchemy.Column("notes", sqlalchemy.String),
+    # Cost of the green beans used, from the bean's cost layers (see app/costing.py)
+    sqlalchemy.Column("green_cost", sqlalchemy.Float),
+)
+
+# Indexes backing the filters and keyset pagination on GET /roasts/
+sqlalchemy.Index("ix_coffee_roasts_date", coffee_roasts.c.date, coffee_roasts.c.roast_id)
+sqlalchemy.Index("ix_coffee_roasts_coffee_name", coffee_roasts.c.coffee_name)
+sqlalchemy.Index("ix_coffee_roasts_bean_id", coffee_roasts.c.bean_id)
+
+coffee_scores = sqlalchemy.Table(
+    "coffee_scores",
+    metadata,
+    sqlalchemy.Column("score_id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("roast_id", sqlalchemy.String),
+    sqlalchemy.Column("date", sqlalchemy.String),
+    sqlalchemy.Column("fragrance_aroma", sqlalchemy.Float),
+    sqlalchemy.Column("flavor", sqlalchemy.Float),
+    sqlalchemy.Column("aftertaste", sqlalchemy.Float),
+    sqlalchemy.Column("acidity", sqlalchemy.Float),
+    sqlalchemy.Column("body", sqlalchemy.Float),
+    sqlalchemy.Column("uniformity", sqlalchemy.Float),
+    sqlalchemy.Column("clean_cup", sqlalchemy.Float),
+    sqlalchemy.Column("sweetness", sqlalchemy.Float),
+    sqlalchemy.Column("overall", sqlalchemy.Float),
+    sqlalchemy.Column("defects", sqlalchemy.Integer),
+    sqlalchemy.Column("total_score", sqlalchemy.Float),
+    sqlalchemy.Column("notes", sqlalchemy.String),
+    # Defective cups and their kind ("taint", "fault"); defects holds the resulting points
+    sqlalchemy.Column("defect_cups", sqlalchemy.Integer),
+    sqlalchemy.Column("defect_type", sqlalchemy.String),
+    # Scoring template total_score was computed with; NULL for totals saved as entered
+    sqlalchemy.Column("template_id", sqlalchemy.String),
+    sqlalchemy.Column("template_version", sqlalchemy.Integer),
+    # Who filled in the sheet, and the cupping session it was part of
+    sqlalchemy.Column("cupper", sqlalchemy.String),
+    sqlalchemy.Column("session_id", sqlalchemy.String),
+)
+
+# Indexes backing the roast join and keyset pagination on GET /scores/
+sqlalchemy.Index("ix_coffee_scores_date", coffee_scores.c.date, coffee_scores.c.score_id)
+sqlalchemy.Index("ix_coffee_scores_roast_id", coffee_scores.c.roast_id)
+sqlalchemy.Index("ix_coffee_scores_session_id", coffee_scores.c.session_id)
+
+# A cupping table: every cupper's sheet for every sample, saved together. calibration
+# caches the session's calibration statistics as JSON (see app/calibration.py); it is
+# cleared when the session's totals change and recomputed on the next read.
+cupping_sessions = sqlalchemy.Table(
+    "cupping_sessions",
+    metadata,
+    sqlalchemy.Column("session_id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("name", sqlalchemy.String),
+    sqlalchemy.Column("date", sqlalchemy.String),
+    sqlalchemy.Column("notes", sqlalchemy.String),
+    sqlalchemy.Column("cupper_count", sqlalchemy.Integer),
+    sqlalchemy.Column("sample_count", sqlalchemy.Integer),
+    sqlalchemy.Column("sheet_count", sqlalchemy.Integer),
+    sqlalchemy.Column("created_at", sqlalchemy.String),
+    sqlalchemy.Column("calibration", sqlalchemy.String),
+)
+
+sqlalchemy.Index("ix_cupping_sessions_date", cupping_sessions.c.date, cupping_sessions.c.session_id)
+
+green_beans = sqlalchemy.Table(
+    "green_beans",
+    metadata,
+    sqlalchemy.Column("bean_id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("name", sqlalchemy.String),
+    sqlalchemy.Column("origin", sqlalchemy.String),
+    sqlalchemy.Column("processing", sqlalchemy.String),
+    sqlalchemy.Column("variety", sqlalchemy.String),
+    sqlalchemy.Column("altitude", sqlalchemy.String),
+    sqlalchemy.Column("purchase_date", sqlalchemy.String),
+    sqlalchemy.Column("initial_stock_kg", sqlalchemy.Float),
+    sqlalchemy.Column("current_stock_kg", sqlalchemy.Float),
+    sqlalchemy.Column("price_per_kg", sqlalchemy.Float),
+    sqlalchemy.Column("supplier", sqlalchemy.String),
+    sqlalchemy.Column("notes", sqlalchemy.String),
+)
+
+# Append-only ledger of stock changes; green_beans.current_stock_kg is its running total
+green_bean_stock_movements = sqlalchemy.Table(
+    "green_bean_stock_movements",
+    metadata,
+    sqlalchemy.Column("movement_id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("bean_id", sqlalchemy.String),
+    sqlalchemy.Column("roast_id", sqlalchemy.String),
+    sqlalchemy.Column("change_kg", sqlalchemy.Float),
+    sqlalchemy.Column("reason", sqlalchemy.String),
+    sqlalchemy.Column("created_at", sqlalchemy.String),
+    # Price of stock received; cost is what the movement added to (+) or took from (-)
+    # the inventory value, and sequence its position in the bean's ledger
+    sqlalchemy.Column("unit_cost", sqlalchemy.Float),
+    sqlalchemy.Column("cost", sqlalchemy.Float),
+    sqlalchemy.Column("sequence", sqlalchemy.Integer),
+)
+
+sqlalchemy.Index(
+    "ix_green_bean_stock_movements_bean_id",
+    green_bean_stock_movements.c.bean_id,
+    green_bean_stock_movements.c.created_at,
+)
+
+# Cost layers per green bean, updated with every stock movement so roast costs and the
+# inventory value never need a replay of the ledger; see app/costing.py
+green_bean_costs = sqlalchemy.Table(
+    "green_bean_costs",
+    metadata,
+    sqlalchemy.Column("bean_id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("method", sqlalchemy.String),
+    sqlalchemy.Column("quantity_kg", sqlalchemy.Float),
+    sqlalchemy.Column("value", sqlalchemy.Float),
+    sqlalchemy.Column("layers", sqlalchemy.String),
+    sqlalchemy.Column("sequence", sqlalchemy.Integer),
+    sqlalchemy.Column("updated_at", sqlalchemy.String),
+)
+
+# One row per table, bumped in the same transaction as every write; list endpoints
+# derive their ETag and Last-Modified headers from it
+table_versions = sqlalchemy.Table(
+    "table_versions",
+    metadata,
+    sqlalchemy.Column("table_name", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("version", sqlalchemy.Integer),
+    sqlalchemy.Column("updated_at", sqlalchemy.String),
+)
+
+# Running per-coffee and per-bean statistics, merged in the same transaction as each
+# roast or score; see app/stats.py
+coffee_stats = sqlalchemy.Table(
+    "coffee_stats",
+    metadata,
+    sqlalchemy.Column("group_type", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("group_key", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("metric", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("count", sqlalchemy.Integer),
+    sqlalchemy.Column("total", sqlalchemy.Float),
+    sqlalchemy.Column("total_sq", sqlalchemy.Float),
+    sqlalchemy.Column("min_value", sqlalchemy.Float),
+    sqlalchemy.Column("max_value", sqlalchemy.Float),
+)
+
+coffee_stats_bins = sqlalchemy.Table(
+    "coffee_stats_bins",
+    metadata,
+    sqlalchemy.Column("group_type", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("group_key", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("metric", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("bin", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("count", sqlalchemy.Integer),
+)
+
+# Roast profile time series, one row per roast; each series is a compact binary blob
+# (see app/curves.py) rather than one row per sample
+roast_curves = sqlalchemy.Table(
+    "roast_curves",
+    metadata,
+    sqlalchemy.Column("roast_id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("sample_rate_hz", sqlalchemy.Float),
+    sqlalchemy.Column("sample_count", sqlalchemy.Integer),
+    sqlalchemy.Column("encoding", sqlalchemy.String),
+    sqlalchemy.Column("bean_temp", sqlalchemy.LargeBinary),
+    sqlalchemy.Column("env_temp", sqlalchemy.LargeBinary),
+    sqlalchemy.Column("burner_times", sqlalchemy.LargeBinary),
+    sqlalchemy.Column("burner_values", sqlalchemy.LargeBinary),
+    sqlalchemy.Column("updated_at", sqlalchemy.String),
+)
+
+# Phase metrics derived from each roast curve by app/phases.py. A row is valid while
+# curve_updated_at matches roast_curves.updated_at.
+roast_phase_metrics = sqlalchemy.Table(
+    "roast_phase_metrics",
+    metadata,
+    sqlalchemy.Column("roast_id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("curve_updated_at", sqlalchemy.String),
+    sqlalchemy.Column("turning_point_s", sqlalchemy.Float),
+    sqlalchemy.Column("turning_point_temp", sqlalchemy.Float),
+    sqlalchemy.Column("dry_end_s", sqlalchemy.Float),
+    sqlalchemy.Column("first_crack_s", sqlalchemy.Float),
+    sqlalchemy.Column("development_time_s", sqlalchemy.Float),
+    sqlalchemy.Column("total_time_s", sqlalchemy.Float),
+    sqlalchemy.Column("dtr_ratio", sqlalchemy.Float),
+    sqlalchemy.Column("max_ror", sqlalchemy.Float),
+)
+
+# Scoring templates (see app/scoring.py). A version is never changed once stored; edits
+# are saved as the next version.
+scoring_templates = sqlalchemy.Table(
+    "scoring_templates",
+    metadata,
+    sqlalchemy.Column("template_id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("version", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("definition", sqlalchemy.String),
+    sqlalchemy.Column("created_at", sqlalchemy.String),
+)
+
+# Scores recomputed with a template version by the rescoring job. Cupping attributes are
+# never edited, so a cached result stays valid for as long as the score exists.
+score_results = sqlalchemy.Table(
+    "score_results",
+    metadata,
+    sqlalchemy.Column("template_id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("template_version", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("score_id", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("total_score", sqlalchemy.Float),
+    sqlalchemy.Column("defects", sqlalchemy.Integer),
+)
+
+VERSIONED_TABLES = (coffee_roasts, coffee_scores, green_beans, green_bean_stock_movements, coffee_stats)
+
+# Applied migrations, see app/migrations.py
+schema_migrations = sqlalchemy.Table(
+    "schema_migrations",
+    metadata,
+    sqlalchemy.Column("version", sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column("description", sqlalchemy.String),
+    sqlalchemy.Column("applied_at", sqlalchemy.String),
+)
@@ -1,42 +1,282 @@
 import streamlit as st
 import requests
-from datetime import datetime
-import uuid
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from urllib.parse import urlencode
 import json
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import altair as alt
 
 # Set page title
 st.set_page_config(page_title="Coffee Roasting & Cupping App", page_icon="☕")
 
+logger = logging.getLogger(__name__)
+
 # Update this at the top of your frontend.py
 BACKEND_URL = os.getenv('BACKEND_URL', 'http://localhost:8080')
+# Address the browser uses for download links, when it differs from the internal one
+PUBLIC_BACKEND_URL = os.getenv('PUBLIC_BACKEND_URL', BACKEND_URL)
 
-# Add error handling for API calls
-def api_call(endpoint, method='get', data=None):
+# Seconds a cached GET is reused without asking the backend; after that it is
+# revalidated with its ETag, which costs a 304 when nothing changed
+CACHE_TTL_SECONDS = float(os.getenv('FRONTEND_CACHE_TTL', '10'))
+CACHE_MAX_ENTRIES = int(os.getenv('FRONTEND_CACHE_MAX_ENTRIES', '256'))
+
+# Writes to a resource also change the joined views built from it
+CACHE_INVALIDATES = {
+    '/roasts/': ('/roasts/', '/scores/enriched', '/green-beans/'),
+    '/scores/': ('/scores/',),
+    '/green-beans/': ('/green-beans/', '/roasts/enriched', '/scores/enriched'),
+}
+
+class ResponseCache:
+    # Least-recently-used cache of GET responses, shared by all sessions of this process
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        # Returns (response, is_fresh); a stale response can still be revalidated
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            self._entries.move_to_end(key)
+            response, stored_at = entry
+            return response, time.monotonic() - stored_at < self.ttl
+    
+    def put(self, key, response):
+        with self._lock:
+            self._entries[key] = (response, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, endpoint):
+        prefixes = next((affected for prefix, affected in CACHE_INVALIDATES.items()
+                         if endpoint.startswith(prefix)), (endpoint,))
+        with self._lock:
+            for key in [key for key in self._entries if key[0].startswith(prefixes)]:
+                del self._entries[key]
+
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES)
+
+def cache_key(endpoint, params, accept=None):
+    return endpoint, json.dumps(params or {}, sort_keys=True, default=str), accept
+
+# Tables are fetched as Arrow IPC streams (or Parquet) and read straight into pandas;
+# set FRONTEND_TABLE_FORMAT=json to fall back to JSON
+TABLE_MEDIA_TYPES = {
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+    'json': 'application/json',
+}
+TABLE_ACCEPT = TABLE_MEDIA_TYPES.get(os.getenv('FRONTEND_TABLE_FORMAT', 'arrow'), TABLE_MEDIA_TYPES['arrow'])
+
+# Connection pool, timeouts and retries for backend calls
+BACKEND_CONNECT_TIMEOUT = float(os.getenv('BACKEND_CONNECT_TIMEOUT', '3.05'))
+BACKEND_READ_TIMEOUT = float(os.getenv('BACKEND_READ_TIMEOUT', '30'))
+BACKEND_RETRIES = int(os.getenv('BACKEND_RETRIES', '3'))
+BACKEND_RETRY_BACKOFF = float(os.getenv('BACKEND_RETRY_BACKOFF', '0.3'))
+BACKEND_POOL_SIZE = int(os.getenv('BACKEND_POOL_SIZE', '20'))
+BACKEND_FANOUT_WORKERS = int(os.getenv('BACKEND_FANOUT_WORKERS', '8'))
+# Calls slower than this are logged as warnings
+SLOW_CALL_MS = float(os.getenv('BACKEND_SLOW_CALL_MS', '500'))
+
+@st.cache_resource
+def get_http_session():
+    # One keep-alive connection pool shared by every session of this process.
+    # POST is not retried so a write that timed out is never applied twice.
+    retry = Retry(
+        total=BACKEND_RETRIES,
+        backoff_factor=BACKEND_RETRY_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({'GET', 'PUT'}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_maxsize=BACKEND_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+@st.cache_resource
+def get_fanout_executor():
+    return ThreadPoolExecutor(max_workers=BACKEND_FANOUT_WORKERS, thread_name_prefix="backend-fanout")
+
+# Backend calls made during this script run, shown in the sidebar; Streamlit
+# re-executes the script on every rerun, so this starts empty each time
+call_timings = []
+
+def record_call(method, endpoint, status, source, started):
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    call_timings.append({
+        "page": st.session_state.get('current_page'),
+        "call": f"{method.upper()} {endpoint}",
+        "status": status,
+        "source": source,
+        "ms": round(elapsed_ms, 1),
+    })
+    log = logger.warning if elapsed_ms >= SLOW_CALL_MS else logger.info
+    log(f"{method.upper()} {endpoint} -> {status} ({source}) in {elapsed_ms:.1f} ms")
+
+def send_request(endpoint, method='get', data=None, params=None, accept=None):
+    # Safe to run in worker threads: makes no Streamlit calls.
+    # Returns (response, error message).
     url = f"{BACKEND_URL}{endpoint}"
+    cache = get_response_cache()
+    session = get_http_session()
+    timeout = (BACKEND_CONNECT_TIMEOUT, BACKEND_READ_TIMEOUT)
+    started = time.perf_counter()
+    source = "network"
     try:
         if method == 'get':
-            response = requests.get(url)
+            key = cache_key(endpoint, params, accept)
+            cached, fresh = cache.get(key)
+            if fresh:
+                response = cached
+                source = "cache"
+            else:
+                headers = {'Accept': accept} if accept else {}
+                if cached is not None and cached.headers.get('ETag'):
+                    headers['If-None-Match'] = cached.headers['ETag']
+                response = session.get(url, params=params, headers=headers, timeout=timeout)
+                if response.status_code == 304 and cached is not None:
+                    cache.put(key, cached)
+                    response = cached
+                    source = "revalidated"
+                elif response.status_code == 200:
+                    cache.put(key, response)
         elif method == 'post':
-            response = requests.post(url, json=data)
+            response = session.post(url, json=data, params=params, timeout=timeout)
         elif method == 'put':
-            response = requests.put(url, json=data)
-        
-        # Handle the response without debug messages
-        if response.status_code == 200:
-            try:
-                return response.json()
-            except json.JSONDecodeError as e:
-                st.error(f"Error: Invalid response from server")
-                return None
-        else:
-            st.error(f"Error: Server returned status code {response.status_code}")
-            return None
+            response = session.put(url, json=data, params=params, timeout=timeout)
     except requests.exceptions.RequestException as e:
-        st.error(f"Error connecting to server")
+        record_call(method, endpoint, "error", source, started)
+        return None, "Error connecting to server"
+    
+    record_call(method, endpoint, response.status_code, source, started)
+    if response.status_code == 200:
+        if method != 'get':
+            cache.invalidate(endpoint)
+        return response, None
+    return None, f"Error: Server returned status code {response.status_code}"
+
+# Add error handling for API calls
+def api_request(endpoint, method='get', data=None, params=None, accept=None):
+    response, error = send_request(endpoint, method=method, data=data, params=params, accept=accept)
+    if error:
+        st.error(error)
+    return response
+
+def api_fetch_many(calls):
+    # Run independent GETs concurrently: {name: (endpoint, params[, accept])} -> {name: response or None}
+    executor = get_fanout_executor()
+    futures = {
+        name: executor.submit(send_request, call[0], params=call[1], accept=call[2] if len(call) > 2 else None)
+        for name, call in calls.items()
+    }
+    responses = {}
+    for name, future in futures.items():
+        response, error = future.result()
+        if error:
+            st.error(error)
+        responses[name] = response
+    return responses
+
+def parse_json(response):
+    try:
+        return response.json()
+    except json.JSONDecodeError as e:
+        st.error(f"Error: Invalid response from server")
+        return None
+
+def api_call(endpoint, method='get', data=None, params=None):
+    response = api_request(endpoint, method=method, data=data, params=params)
+    if response is None:
+        return None
+    return parse_json(response)
+
+def read_table(response):
+    # DataFrame from a list endpoint response in whichever format the backend chose.
+    # Arrow columns arrive typed, so pandas skips building object columns from dicts;
+    # integer columns with gaps stay integers.
+    if response is None:
         return None
+    media_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+    try:
+        if media_type == TABLE_MEDIA_TYPES['arrow']:
+            table = pa.ipc.open_stream(response.content).read_all()
+        elif media_type == TABLE_MEDIA_TYPES['parquet']:
+            table = pq.read_table(pa.BufferReader(response.content))
+        else:
+            rows = parse_json(response)
+            return pd.DataFrame(rows) if rows is not None else None
+    except pa.ArrowInvalid:
+        st.error("Error: Invalid response from server")
+        return None
+    return table.to_pandas(split_blocks=True, types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+
+def read_page(response):
+    # The next keyset cursor of a list endpoint comes back in a header
+    if response is None:
+        return None, None
+    return read_table(response), response.headers.get('X-Next-Cursor')
+
+def history_params(state_key):
+    # Build list filters from the widgets' state of the previous run, so the page can
+    # be requested together with the filter options before the widgets are drawn
+    params = {"limit": st.session_state.get(f"{state_key}_page_size", 100), "order": "desc"}
+    selected_coffees = st.session_state.get(f"{state_key}_coffees") or []
+    date_range = st.session_state.get(f"{state_key}_date_range") or []
+    if selected_coffees:
+        params['coffee_name'] = selected_coffees
+    if len(date_range) == 2:
+        params['date_from'] = str(date_range[0])
+        params['date_to'] = str(date_range[1])
+    return params
+
+def page_cursor_params(params, state_key):
+    # Keep a stack of cursors per page so "Previous" can step back; reset it when filters change
+    filters_key = json.dumps(params, sort_keys=True, default=str)
+    if st.session_state.get(f"{state_key}_filters") != filters_key:
+        st.session_state[f"{state_key}_filters"] = filters_key
+        st.session_state[f"{state_key}_cursors"] = [None]
+    cursors = st.session_state[f"{state_key}_cursors"]
+    
+    page_params = dict(params)
+    if cursors[-1]:
+        page_params['cursor'] = cursors[-1]
+    return page_params, cursors
+
+def export_url(endpoint, params, fields):
+    # Download links stream straight from the backend instead of going through this process
+    query = {key: value for key, value in params.items() if key not in ('limit', 'cursor')}
+    query.update({"format": "csv", "gzip": "true", "fields": ",".join(fields)})
+    return f"{PUBLIC_BACKEND_URL}{endpoint}?{urlencode(query, doseq=True)}"
+
+def page_controls(next_cursor, cursors, state_key):
+    col1, col2, col3 = st.columns([1, 1, 4])
+    with col1:
+        st.button("◀ Previous", key=f"{state_key}_prev", disabled=len(cursors) <= 1,
+                  on_click=cursors.pop)
+    with col2:
+        st.button("Next ▶", key=f"{state_key}_next", disabled=not next_cursor,
+                  on_click=cursors.append, args=(next_cursor,))
+    with col3:
+        st.caption(f"Page {len(cursors)}")
 
 # Title
 st.title("☕ Coffee Roasting & Cupping App")
@@ -109,7 +349,6 @@ elif st.session_state.current_page == "Record Roast":
         
         if st.form_submit_button("💾 Save Roast"):
             data = {
-                "roast_id": str(uuid.uuid4()),
                 "date": str(date),
                 "coffee_name": coffee_name,
                 "agtron_whole": agtron_whole,
@@ -128,13 +367,25 @@ elif st.session_state.current_page == "Record Roast":
 elif st.session_state.current_page == "Score Coffee":
     st.header("📋 Coffee Cupping Score Sheet")
     
-    # Get available roasts
-    roasts = api_call('/roasts/')
-    
-    if roasts:
-        # For databases/sqlalchemy response format (dictionary-like objects)
+    # /roasts/ returns a page at a time, newest first; older roasts are reached with the
+    # coffee filter or by paging, as on the history pages
+    params = {"limit": 100, "order": "desc", "fields": "roast_id,coffee_name,date"}
+    if st.session_state.get("score_coffees"):
+        params['coffee_name'] = st.session_state["score_coffees"]
+    page_params, cursors = page_cursor_params(params, "score")
+    responses = api_fetch_many({
+        "coffee_names": ('/roasts/coffee-names', None),
+        "page": ('/roasts/', page_params),
+    })
+    coffee_options = (parse_json(responses["coffee_names"]) if responses["coffee_names"] else None) or []
+    df, next_cursor = read_page(responses["page"])
+    roasts = df.to_dict('records') if df is not None else []
+
+    if roasts or len(cursors) > 1 or params.get('coffee_name'):
+        st.multiselect("Filter by Coffee Name", options=coffee_options, key="score_coffees")
         # Create selection box for roasts
         roast_options = {f"{r['coffee_name']} - {r['date']}": r['roast_id'] for r in roasts}
+        page_controls(next_cursor, cursors, "score")
         
         if roast_options:
             selected_roast = st.selectbox(
@@ -162,18 +413,16 @@ elif st.session_state.current_page == "Score Coffee":
                         sweetness = st.slider("🍯 Sweetness", 0.0, 10.0, 6.0, 0.25)
                     
                     overall = st.slider("⭐ Overall", 0.0, 10.0, 6.0, 0.25)
-                    defects = st.number_input("❌ Defects", 0, 100, 0)
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        defect_cups = st.number_input("❌ Defective Cups", 0, 5, 0)
+                    with col2:
+                        defect_type = st.selectbox("⚠️ Defect Type", ["taint", "fault"])
                     notes = st.text_area("📝 Cupping Notes")
 
                     if st.form_submit_button("💾 Submit Score"):
-                        total_score = (
-                            fragrance_aroma + flavor + aftertaste + acidity + 
-                            body + uniformity + clean_cup + sweetness + 
-                            overall * 2 - defects
-                        )
-                        
+                        # The total is computed by the backend's scoring template
                         data = {
-                            "score_id": str(uuid.uuid4()),
                             "roast_id": roast_id,
                             "date": str(date),
                             "fragrance_aroma": fragrance_aroma,
@@ -185,38 +434,63 @@ elif st.session_state.current_page == "Score Coffee":
                             "clean_cup": clean_cup,
                             "sweetness": sweetness,
                             "overall": overall,
-                            "defects": defects,
-                            "total_score": total_score,
+                            "defect_cups": defect_cups,
+                            "defect_type": defect_type,
                             "notes": notes
                         }
                         
                         result = api_call("/scores/", method="post", data=data)
                         if result:
-                            st.success(f"✅ Score saved successfully! Total Score: {total_score:.2f}")
+                            st.success(f"✅ Score saved successfully! Total Score: {result['total_score']:.2f}")
+        else:
+            st.info("No roasts match the selected filters.")
     else:
         st.warning("No roasts available to score. Please record a roast first.")
 
 elif st.session_state.current_page == "Roast History":
     st.header("📚 Roast History")
     
-    # Get roast data
-    roasts = api_call('/roasts/')
+    # Filters are applied by the backend so only the shown page is transferred.
+    # The filter options and the page are fetched in parallel.
+    params = history_params("roast")
+    page_params, cursors = page_cursor_params(params, "roast")
+    responses = api_fetch_many({
+        "coffee_names": ('/roasts/coffee-names', None),
+        "page": ('/roasts/enriched', page_params, TABLE_ACCEPT),
+    })
+    coffee_options = (parse_json(responses["coffee_names"]) if responses["coffee_names"] else None) or []
+    # Get roast data, joined with green bean info by the backend
+    df, next_cursor = read_page(responses["page"])
     
-    if roasts:
-        # Create DataFrame
-        df = pd.DataFrame(roasts)
-        
-        # Get green bean info if available
-        green_beans = api_call('/green-beans/')
-        if green_beans:
-            green_df = pd.DataFrame(green_beans)
-            if 'bean_id' in df.columns and 'bean_id' in green_df.columns:
-                # Create lookup dictionary for green bean info
-                bean_lookup = {bean['bean_id']: f"{bean['name']} ({bean['origin']})" 
-                              for bean in green_beans}
-                
-                # Add green bean info to roast dataframe
-                df['green_bean'] = df['bean_id'].map(bean_lookup)
+    # Add filters
+    st.subheader("Filters")
+    col1, col2, col3 = st.columns([2, 2, 1])
+    
+    with col1:
+        selected_coffees = st.multiselect(
+            "Filter by Coffee Name",
+            options=coffee_options,
+            key="roast_coffees"
+        )
+    
+    with col2:
+        date_range = st.date_input(
+            "Date Range",
+            value=[],
+            key="roast_date_range"
+        )
+    
+    with col3:
+        st.selectbox("Rows per page", options=[25, 50, 100, 250], index=2,
+                     key="roast_page_size")
+    
+    if df is not None and not df.empty:
+        # Format green bean info for display
+        has_bean = df['bean_name'].notna()
+        df['green_bean'] = None
+        df.loc[has_bean, 'green_bean'] = (
+            df.loc[has_bean, 'bean_name'] + " (" + df.loc[has_bean, 'bean_origin'].fillna('') + ")"
+        )
         
         # Reorder columns to put coffee_name first and drop the roast_id
         if 'coffee_name' in df.columns:
@@ -236,79 +510,66 @@ elif st.session_state.current_page == "Roast History":
         except:
             pass
         
-        # Add filters
-        st.subheader("Filters")
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if 'coffee_name' in df.columns:
-                coffee_options = sorted(df['coffee_name'].unique())
-                selected_coffees = st.multiselect(
-                    "Filter by Coffee Name",
-                    options=coffee_options
-                )
-                
-                if selected_coffees:
-                    df = df[df['coffee_name'].isin(selected_coffees)]
-        
-        with col2:
-            if 'date' in df.columns:
-                try:
-                    min_date = df['date'].min().date()
-                    max_date = df['date'].max().date()
-                    
-                    date_range = st.date_input(
-                        "Date Range",
-                        value=(min_date, max_date),
-                        key="roast_date_range"
-                    )
-                    
-                    if len(date_range) == 2:
-                        start_date = pd.Timestamp(date_range[0])
-                        end_date = pd.Timestamp(date_range[1])
-                        df = df[(df['date'] >= start_date) & (df['date'] <= end_date)]
-                except:
-                    pass
-        
-        # Display data
+        # Display data (already sorted newest first by the backend)
         st.subheader("Roast Records")
-        if not df.empty:
-            st.dataframe(
-                df.sort_values('date', ascending=False) if 'date' in df.columns else df,
-                hide_index=True,
-                use_container_width=True
-            )
-            
-            # Add download button
-            csv = df.to_csv(index=False)
-            st.download_button(
-                label="📥 Download Roast History",
-                data=csv,
-                file_name="coffee_roast_history.csv",
-                mime="text/csv"
-            )
-        else:
-            st.info("No records to display after filtering.")
+        st.dataframe(
+            df,
+            hide_index=True,
+            use_container_width=True
+        )
+        page_controls(next_cursor, cursors, "roast")
+        
+        # Add download link for all matching records
+        st.link_button(
+            "📥 Download Roast History",
+            export_url('/roasts/export', params,
+                       ['coffee_name', 'bean_name', 'bean_origin', 'date', 'amount_used_kg',
+                        'agtron_whole', 'agtron_ground', 'drop_temp', 'development_time',
+                        'total_time', 'dtr_ratio', 'notes'])
+        )
+    elif len(cursors) > 1 or selected_coffees or len(date_range) == 2:
+        st.info("No records to display after filtering.")
     else:
         st.info("No roast records found.")
 
 elif st.session_state.current_page == "Cupping History":
     st.header("📊 Cupping History")
     
-    # Get cupping scores
-    scores = api_call('/scores/')
+    # Filters are applied by the backend so only the shown page is transferred.
+    # The filter options and the page are fetched in parallel.
+    params = history_params("cupping")
+    page_params, cursors = page_cursor_params(params, "cupping")
+    responses = api_fetch_many({
+        "coffee_names": ('/roasts/coffee-names', None),
+        "page": ('/scores/enriched', page_params, TABLE_ACCEPT),
+    })
+    coffee_options = (parse_json(responses["coffee_names"]) if responses["coffee_names"] else None) or []
+    # Get cupping scores, joined with the roast's coffee name by the backend
+    df, next_cursor = read_page(responses["page"])
     
-    if scores:
-        # Create DataFrame
-        df = pd.DataFrame(scores)
-        
-        # Get roast information to show coffee names
-        roasts = api_call('/roasts/')
-        if roasts:
-            roast_df = pd.DataFrame(roasts)
-            roast_lookup = dict(zip(roast_df['roast_id'], roast_df['coffee_name']))
-            df['coffee_name'] = df['roast_id'].map(roast_lookup)
-        
+    # Add filters
+    st.subheader("Filters")
+    col1, col2, col3 = st.columns([2, 2, 1])
+    
+    with col1:
+        selected_coffees = st.multiselect(
+            "Filter by Coffee Name",
+            options=coffee_options,
+            key="cupping_coffees"
+        )
+    
+    with col2:
+        date_range = st.date_input(
+            "Date Range",
+            value=[],
+            key="cupping_date_range"
+        )
+    
+    with col3:
+        st.selectbox("Rows per page", options=[25, 50, 100, 250], index=2,
+                     key="cupping_page_size")
+    
+    if df is not None and not df.empty:
         # Reorder columns to put coffee_name first and drop the IDs
         if 'coffee_name' in df.columns:
             # List all columns excluding score_id and roast_id, with coffee_name first
@@ -328,59 +589,25 @@ elif st.session_state.current_page == "Cupping History":
         except:
             pass
         
-        # Add filters
-        st.subheader("Filters")
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if 'coffee_name' in df.columns:
-                coffee_options = sorted(df['coffee_name'].unique())
-                selected_coffees = st.multiselect(
-                    "Filter by Coffee Name",
-                    options=coffee_options
-                )
-                
-                if selected_coffees:
-                    df = df[df['coffee_name'].isin(selected_coffees)]
-        
-        with col2:
-            if 'date' in df.columns:
-                try:
-                    min_date = df['date'].min().date()
-                    max_date = df['date'].max().date()
-                    
-                    date_range = st.date_input(
-                        "Date Range",
-                        value=(min_date, max_date),
-                        key="cupping_date_range"
-                    )
-                    
-                    if len(date_range) == 2:
-                        start_date = pd.Timestamp(date_range[0])
-                        end_date = pd.Timestamp(date_range[1])
-                        df = df[(df['date'] >= start_date) & (df['date'] <= end_date)]
-                except:
-                    pass
-        
-        # Display data
+        # Display data (already sorted newest first by the backend)
         st.subheader("Cupping Scores")
-        if not df.empty:
-            st.dataframe(
-                df.sort_values('date', ascending=False) if 'date' in df.columns else df,
-                hide_index=True,
-                use_container_width=True
-            )
-            
-            # Add download button
-            csv = df.to_csv(index=False)
-            st.download_button(
-                label="📥 Download Cupping History",
-                data=csv,
-                file_name="coffee_cupping_history.csv",
-                mime="text/csv"
-            )
-        else:
-            st.info("No records to display after filtering.")
+        st.dataframe(
+            df,
+            hide_index=True,
+            use_container_width=True
+        )
+        page_controls(next_cursor, cursors, "cupping")
+        
+        # Add download link for all matching records
+        st.link_button(
+            "📥 Download Cupping History",
+            export_url('/scores/export', params,
+                       ['coffee_name', 'date', 'fragrance_aroma', 'flavor', 'aftertaste', 'acidity',
+                        'body', 'uniformity', 'clean_cup', 'sweetness', 'overall', 'defects',
+                        'total_score', 'notes'])
+        )
+    elif len(cursors) > 1 or selected_coffees or len(date_range) == 2:
+        st.info("No records to display after filtering.")
     else:
         st.info("No cupping records found.")
 
@@ -451,15 +678,14 @@ elif st.session_state.current_page == "Green Beans":
         st.subheader("Green Bean Inventory")
         
         # Get green bean data
-        green_beans = api_call('/green-beans/')
+        df = read_table(api_request('/green-beans/', accept=TABLE_ACCEPT))
         
-        if green_beans:
-            # Create DataFrame
-            df = pd.DataFrame(green_beans)
-            
+        if df is not None and not df.empty:
             # Add filters
             st.subheader("Filters")
             col1, col2 = st.columns(2)
+            selected_coffees = []
+            selected_origins = []
             
             with col1:
                 if 'name' in df.columns:
@@ -554,13 +780,14 @@ elif st.session_state.current_page == "Green Beans":
                 else:
                     st.dataframe(df[display_cols], hide_index=True, use_container_width=True)
                 
-                # Add download button
-                csv = df.to_csv(index=False)
-                st.download_button(
-                    label="📥 Download Inventory",
-                    data=csv,
-                    file_name="green_bean_inventory.csv",
-                    mime="text/csv"
+                # Add download link for the filtered inventory
+                inventory_filters = {"name": selected_coffees, "origin": selected_origins}
+                st.link_button(
+                    "📥 Download Inventory",
+                    export_url('/green-beans/export', inventory_filters,
+                               ['name', 'origin', 'processing', 'variety', 'purchase_date',
+                                'initial_stock_kg', 'current_stock_kg', 'price_per_kg',
+                                'supplier', 'notes'])
                 )
             else:
                 st.info("No inventory records to display after filtering.")
@@ -675,22 +902,18 @@ elif st.session_state.current_page == "New Roast":
                 result = api_call("/roasts/", method="post", data=roast_data)
                 
                 if result and "roast_id" in result:
-                    # Update green bean stock
-                    if selected_bean_id:
-                        stock_update = api_call(
-                            f"/green-beans/{selected_bean_id}/update-stock", 
-                            method="put",
-                            data={"amount_used": amount_used_kg}
-                        )
-                        
-                        if stock_update:
-                            st.success(f"Roast recorded successfully! Green bean stock updated to {stock_update.get('new_stock_kg', 0)}kg")
-                        else:
-                            st.warning("Roast recorded, but failed to update green bean stock.")
+                    # The backend deducts green bean stock in the same transaction as the roast
+                    if result.get('new_stock_kg') is not None:
+                        st.success(f"Roast recorded successfully! Green bean stock updated to {result['new_stock_kg']}kg")
                     else:
                         st.success("Roast recorded successfully!")
                 else:
                     st.error("Error recording roast!")
 
+# Show how long this run's backend calls took, so a slow page can be traced to an endpoint
+if call_timings:
+    with st.sidebar.expander("⏱️ Backend calls"):
+        st.dataframe(pd.DataFrame(call_timings), hide_index=True, use_container_width=True)
+
 def set_page(page):
     st.session_state.current_page = page
\ No newline at end of file
@@ -0,0 +1,33 @@
+import os
+import time
+import uuid
+
+# Last millisecond an ID was made for, and the counter within it
+_last_ms = 0
+_counter = 0
+
+def uuid7():
+    """A UUIDv7 (RFC 9562): 48-bit Unix milliseconds, a 12-bit counter and 62 random bits.
+
+    Keys made later sort later, as text or bytes, so inserts append to the end of the
+    primary key and foreign key indexes instead of landing on random pages. The counter
+    keeps keys from the same millisecond in order; if it runs out, or the clock goes
+    back, the timestamp is carried forward rather than reused.
+    """
+    global _last_ms, _counter
+    ms = time.time_ns() // 1_000_000
+    if ms > _last_ms:
+        _last_ms = ms
+        # Random start, top bit clear, so there is room left to count up
+        _counter = int.from_bytes(os.urandom(2), "big") & 0x7FF
+    else:
+        _counter += 1
+        if _counter > 0xFFF:
+            _last_ms += 1
+            _counter = 0
+    random_bits = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    return uuid.UUID(int=(_last_ms << 80) | (0x7 << 76) | (_counter << 64) | (0b10 << 62) | random_bits)
+
+def new_id():
+    # Key for a new row, in the same 36-character form as the existing uuid4 keys
+    return str(uuid7())
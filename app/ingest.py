@@ -0,0 +1,112 @@
+import codecs
+import csv
+import json
+from pydantic import ValidationError
+
+# Content types accepted by the bulk endpoints
+JSON_TYPES = ("application/json",)
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+CSV_TYPES = ("text/csv", "application/csv")
+
+class UnsupportedFormat(Exception):
+    pass
+
+class InvalidBody(Exception):
+    pass
+
+class RowError(Exception):
+    pass
+
+async def iter_lines(stream):
+    # Decode a byte stream incrementally and yield complete lines
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in stream:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+async def iter_csv_records(stream):
+    # Join physical lines into CSV records; a record is complete once its quotes balance
+    pending = []
+    quotes = 0
+    async for line in iter_lines(stream):
+        pending.append(line)
+        quotes += line.count('"')
+        if quotes % 2 == 0:
+            yield next(csv.reader(["\n".join(pending)]), [])
+            pending = []
+            quotes = 0
+    if pending:
+        yield next(csv.reader(["\n".join(pending)]), [])
+
+async def iter_csv_rows(stream):
+    header = None
+    async for record in iter_csv_records(stream):
+        if not any(field.strip() for field in record):
+            continue
+        if header is None:
+            header = [name.strip() for name in record]
+            continue
+        if len(record) != len(header):
+            yield RowError(f"Expected {len(header)} fields, got {len(record)}")
+            continue
+        # Empty CSV cells mean "not set"
+        yield {name: (value if value != "" else None) for name, value in zip(header, record)}
+
+async def iter_ndjson_rows(stream):
+    async for line in iter_lines(stream):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield RowError(f"Invalid JSON: {e}")
+
+async def iter_json_rows(stream):
+    # A JSON array has to be read whole before it can be parsed
+    body = b"".join([chunk async for chunk in stream])
+    try:
+        rows = json.loads(body or b"[]")
+    except ValueError as e:
+        raise InvalidBody(f"Invalid JSON body: {e}")
+    if not isinstance(rows, list):
+        raise InvalidBody("JSON body must be an array of objects")
+    for row in rows:
+        yield row
+
+def row_parser(content_type):
+    media_type = (content_type or "application/json").split(";")[0].strip().lower()
+    if media_type in JSON_TYPES:
+        return iter_json_rows
+    if media_type in NDJSON_TYPES:
+        return iter_ndjson_rows
+    if media_type in CSV_TYPES:
+        return iter_csv_rows
+    raise UnsupportedFormat(f"Unsupported content type: {media_type}")
+
+def format_validation_errors(error):
+    return [
+        f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}"
+        for item in error.errors()
+    ]
+
+async def iter_validated(stream, content_type, model):
+    # Yield (row number, model instance, errors) for each row in the body
+    parser = row_parser(content_type)
+    row_number = 0
+    async for row in parser(stream):
+        row_number += 1
+        if isinstance(row, RowError):
+            yield row_number, None, [str(row)]
+        elif not isinstance(row, dict):
+            yield row_number, None, ["Row must be an object"]
+        else:
+            try:
+                yield row_number, model(**row), None
+            except ValidationError as e:
+                yield row_number, None, format_validation_errors(e)
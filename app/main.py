@@ -1,112 +1,883 @@
+import time
+# Cold start is measured from here, the first line of the app, to the end of startup()
+IMPORT_STARTED = time.perf_counter()
+
 import os
-from fastapi import FastAPI, HTTPException
-from .models import CoffeeRoast, CoffeeScore, GreenBean
-import databases
+import asyncio
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Optional
+from collections import defaultdict
+from .models import CoffeeRoast, CoffeeScore, CuppingSession, GreenBean, RoastCurve, ScoringTemplate
+from . import ingest
+from .stats import StatsBatch, summarize
+from . import curves
+from . import phases
+from . import columnar
+from . import search
+from . import metrics
+from . import scoring
+from . import costing
+from . import calibration
+from . import similar
 import sqlalchemy
-import uuid
+from datetime import datetime, timezone
+from email.utils import format_datetime
+import base64
+import csv
+import hashlib
+import io
+import json
+import orjson
+import zlib
 import logging
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Get database URL from environment variables
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-# Ensure DATABASE_URL is set
-if not DATABASE_URL:
-    raise Exception("DATABASE_URL environment variable not set! Cannot proceed without a database connection.")
-
-# If using PostgreSQL, convert the URL format
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-
-# Create database connection
-database = databases.Database(DATABASE_URL)
-metadata = sqlalchemy.MetaData()
-
-# Define tables
-coffee_roasts = sqlalchemy.Table(
-    "coffee_roasts",
-    metadata,
-    sqlalchemy.Column("roast_id", sqlalchemy.String, primary_key=True),
-    sqlalchemy.Column("bean_id", sqlalchemy.String),
-    sqlalchemy.Column("date", sqlalchemy.String),
-    sqlalchemy.Column("coffee_name", sqlalchemy.String),
-    sqlalchemy.Column("agtron_whole", sqlalchemy.Integer),
-    sqlalchemy.Column("agtron_ground", sqlalchemy.Integer),
-    sqlalchemy.Column("drop_temp", sqlalchemy.Float),
-    sqlalchemy.Column("development_time", sqlalchemy.Float),
-    sqlalchemy.Column("total_time", sqlalchemy.Float),
-    sqlalchemy.Column("dtr_ratio", sqlalchemy.Float),
-    sqlalchemy.Column("amount_used_kg", sqlalchemy.Float),
-    sqlalchemy.Column("notes", sqlalchemy.String),
+from .db import (
+    DATABASE_URL,
+    DATABASE_READ_URL,
+    uses_sqlite_profile,
+    database,
+    read_database,
+    coffee_roasts,
+    coffee_scores,
+    green_beans,
+    green_bean_stock_movements,
+    table_versions,
+    coffee_stats,
+    coffee_stats_bins,
+    roast_curves,
+    roast_phase_metrics,
+    scoring_templates,
+    score_results,
+    green_bean_costs,
+    cupping_sessions,
 )
+from . import migrations
+from .pool import PoolTimeoutError
+from .writequeue import GroupCommitQueue, WriteQueueFull
+from .ids import new_id
+from . import replica
+from .replica import reader
+
+# Workers apply pending migrations themselves (one at a time, behind a database lock)
+# unless they are run beforehand with `python -m app.migrate`
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+# Startup slower than this is logged as a warning
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "3000"))
+
+# Scoring template for new cuppings; its latest version applies
+SCORING_TEMPLATE = os.getenv("SCORING_TEMPLATE", scoring.DEFAULT_TEMPLATE_ID)
 
-coffee_scores = sqlalchemy.Table(
-    "coffee_scores",
-    metadata,
-    sqlalchemy.Column("score_id", sqlalchemy.String, primary_key=True),
-    sqlalchemy.Column("roast_id", sqlalchemy.String),
-    sqlalchemy.Column("date", sqlalchemy.String),
-    sqlalchemy.Column("fragrance_aroma", sqlalchemy.Float),
-    sqlalchemy.Column("flavor", sqlalchemy.Float),
-    sqlalchemy.Column("aftertaste", sqlalchemy.Float),
-    sqlalchemy.Column("acidity", sqlalchemy.Float),
-    sqlalchemy.Column("body", sqlalchemy.Float),
-    sqlalchemy.Column("uniformity", sqlalchemy.Float),
-    sqlalchemy.Column("clean_cup", sqlalchemy.Float),
-    sqlalchemy.Column("sweetness", sqlalchemy.Float),
-    sqlalchemy.Column("overall", sqlalchemy.Float),
-    sqlalchemy.Column("defects", sqlalchemy.Integer),
-    sqlalchemy.Column("total_score", sqlalchemy.Float),
-    sqlalchemy.Column("notes", sqlalchemy.String),
+# Single-row roast and score inserts and stock adjustments can be committed in groups by one writer: a
+# group closes at WRITE_QUEUE_MAX_BATCH writes or WRITE_QUEUE_MAX_DELAY_MS after its
+# first; beyond WRITE_QUEUE_MAX_PENDING waiting writes, requests get a 503. On by default
+# with the SQLite profile, where the queue feeds its single writer connection.
+WRITE_QUEUE_ENABLED = os.getenv(
+    "WRITE_QUEUE_ENABLED", "true" if uses_sqlite_profile(DATABASE_URL) else "false"
+).lower() in ("1", "true", "yes")
+WRITE_QUEUE_MAX_BATCH = int(os.getenv("WRITE_QUEUE_MAX_BATCH", "50"))
+WRITE_QUEUE_MAX_DELAY_MS = float(os.getenv("WRITE_QUEUE_MAX_DELAY_MS", "2"))
+WRITE_QUEUE_MAX_PENDING = int(os.getenv("WRITE_QUEUE_MAX_PENDING", "1000"))
+write_queue = GroupCommitQueue(
+    database, WRITE_QUEUE_MAX_BATCH, WRITE_QUEUE_MAX_DELAY_MS / 1000, WRITE_QUEUE_MAX_PENDING
 )
 
-green_beans = sqlalchemy.Table(
-    "green_beans",
-    metadata,
-    sqlalchemy.Column("bean_id", sqlalchemy.String, primary_key=True),
-    sqlalchemy.Column("name", sqlalchemy.String),
-    sqlalchemy.Column("origin", sqlalchemy.String),
-    sqlalchemy.Column("processing", sqlalchemy.String),
-    sqlalchemy.Column("variety", sqlalchemy.String),
-    sqlalchemy.Column("altitude", sqlalchemy.String),
-    sqlalchemy.Column("purchase_date", sqlalchemy.String),
-    sqlalchemy.Column("initial_stock_kg", sqlalchemy.Float),
-    sqlalchemy.Column("current_stock_kg", sqlalchemy.Float),
-    sqlalchemy.Column("price_per_kg", sqlalchemy.Float),
-    sqlalchemy.Column("supplier", sqlalchemy.String),
-    sqlalchemy.Column("notes", sqlalchemy.String),
+# GET routes that read from DATABASE_READ_URL when it is set. A client that just wrote
+# reads from the primary until the replica has its write, or READ_AFTER_MAX_AGE_S at most.
+REPLICA_ROUTES = (
+    "/roasts/", "/roasts/enriched", "/roasts/export", "/roasts/coffee-names",
+    "/scores/", "/scores/enriched", "/scores/export",
+    "/green-beans/", "/green-beans/export",
+    "/cupping-sessions/", "/search", "/stats/",
 )
+READ_AFTER_MAX_AGE_S = int(os.getenv("READ_AFTER_MAX_AGE_S", "300"))
+
+# Nearest-neighbour index over roast parameters for /roasts/{roast_id}/similar, loaded
+# on first use and kept current with this worker's roast writes
+MAX_SIMILAR = 100
+similar_roasts = similar.SimilarRoasts(database)
+
+# Full-text search backend for /search, set at startup; None if the database has no index
+SEARCH_BACKEND = None
+
+# Page size limits for list endpoints
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+# JSON list responses are encoded either "fast" (row values go straight into orjson,
+# skipping FastAPI's jsonable_encoder walk) or "standard". JSON_RESPONSE_MODE sets the
+# default and JSON_RESPONSE_ROUTES overrides it per route, e.g. "/scores/=standard".
+JSON_RESPONSE_MODE = os.getenv("JSON_RESPONSE_MODE", "fast")
+JSON_RESPONSE_ROUTES = {
+    path.strip(): mode.strip()
+    for path, _, mode in (item.partition("=") for item in os.getenv("JSON_RESPONSE_ROUTES", "").split(","))
+    if mode.strip()
+}
+# Rows encoded per orjson call when streaming a JSON array
+JSON_STREAM_BATCH_ROWS = 500
+
+def select_fields(columns, fields, required):
+    # Parse a comma-separated field list against a name -> column mapping,
+    # always keeping the pagination keys
+    columns = dict(columns.items())
+    if not fields:
+        names = list(columns)
+    else:
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in names if name not in columns]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        for name in required:
+            if name not in names:
+                names.append(name)
+    return [columns[name].label(name) for name in names]
+
+def filter_roasts(query, coffee_name, bean_id, date_from, date_to):
+    if coffee_name:
+        query = query.where(coffee_roasts.c.coffee_name.in_(coffee_name))
+    if bean_id:
+        query = query.where(coffee_roasts.c.bean_id == bean_id)
+    if date_from:
+        query = query.where(coffee_roasts.c.date >= date_from)
+    if date_to:
+        query = query.where(coffee_roasts.c.date <= date_to)
+    return query
+
+def filter_scores(query, roast_id, date_from, date_to):
+    if roast_id:
+        query = query.where(coffee_scores.c.roast_id == roast_id)
+    if date_from:
+        query = query.where(coffee_scores.c.date >= date_from)
+    if date_to:
+        query = query.where(coffee_scores.c.date <= date_to)
+    return query
+
+def filter_green_beans(query, name, origin):
+    if name:
+        query = query.where(green_beans.c.name.in_(name))
+    if origin:
+        query = query.where(green_beans.c.origin.in_(origin))
+    return query
+
+def select_enriched_roasts(columns):
+    return sqlalchemy.select(*columns).select_from(
+        coffee_roasts.outerjoin(green_beans, green_beans.c.bean_id == coffee_roasts.c.bean_id)
+    )
+
+def select_enriched_scores(columns):
+    return sqlalchemy.select(*columns).select_from(
+        coffee_scores.outerjoin(
+            coffee_roasts, coffee_roasts.c.roast_id == coffee_scores.c.roast_id
+        ).outerjoin(
+            green_beans, green_beans.c.bean_id == coffee_roasts.c.bean_id
+        )
+    )
+
+def filter_enriched_scores(query, coffee_name, roast_id, bean_id, date_from, date_to):
+    query = filter_scores(query, roast_id, date_from, date_to)
+    if coffee_name:
+        query = query.where(coffee_roasts.c.coffee_name.in_(coffee_name))
+    if bean_id:
+        query = query.where(coffee_roasts.c.bean_id == bean_id)
+    return query
+
+# Export formats and the size of each chunk written to the response
+EXPORT_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+async def iter_export(query, names, export_format):
+    # Stream rows from a server-side cursor, flushing the text buffer in fixed-size chunks
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == "csv" else None
+    if writer:
+        writer.writerow(names)
+    async for row in reader().iterate(query):
+        if writer:
+            writer.writerow([row[name] for name in names])
+        else:
+            buffer.write(json.dumps({name: row[name] for name in names}, default=str))
+            buffer.write("\n")
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+async def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_response(query, columns, export_format, use_gzip, filename):
+    names = [column.name for column in columns]
+    body = iter_export(query, names, export_format)
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'}
+    if use_gzip:
+        body = gzip_chunks(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type=EXPORT_MEDIA_TYPES[export_format], headers=headers)
+
+def encode_cursor(sort_value, key):
+    raw = json.dumps([sort_value, key]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor):
+    try:
+        sort_value, key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return sort_value, key
 
-# Create engine and attempt to create tables
-try:
-    engine = sqlalchemy.create_engine(DATABASE_URL)
-    logger.info("Created database engine")
+def keyset_runs(sort_col, key_col, after, descending):
+    # A page is read as two runs, the non-NULL sort values and the NULL ones (last when
+    # descending, first when ascending), each in plain (sort, key) order so that an index
+    # on (sort, key) serves it as a seek, forwards or backwards. Returns a predicate for
+    # every run that can still have rows after the cursor, in page order.
+    not_null, null = sort_col.isnot(None), sort_col.is_(None)
+    if after is None:
+        return [not_null, null] if descending else [null, not_null]
+    sort_value, key = after
+    row = sqlalchemy.tuple_(sort_col, key_col)
+    if descending:
+        if sort_value is None:
+            return [sqlalchemy.and_(null, key_col < key)]
+        return [row < sqlalchemy.tuple_(sort_value, key), null]
+    if sort_value is None:
+        return [sqlalchemy.and_(null, key_col > key), not_null]
+    return [row > sqlalchemy.tuple_(sort_value, key)]
+
+def order_keyset(query, sort_col, key_col, order):
+    if order == "desc":
+        return query.order_by(sort_col.desc().nullslast(), key_col.desc())
+    return query.order_by(sort_col.asc().nullsfirst(), key_col.asc())
+
+def paginate(query, sort_col, key_col, order, cursor, limit):
+    after = decode_cursor(cursor) if cursor else None
+    direction = sqlalchemy.desc if order == "desc" else sqlalchemy.asc
+    # Fetch one extra row to know whether another page exists
+    runs = [
+        query.where(predicate).order_by(direction(sort_col), direction(key_col)).limit(limit + 1)
+        for predicate in keyset_runs(sort_col, key_col, after, order == "desc")
+    ]
+    if len(runs) == 1:
+        return runs[0]
+    # OR-ing the runs' predicates would scan the index; each run stops at its own limit
+    # instead, and only those rows are merged
+    merged = sqlalchemy.union_all(*[sqlalchemy.select(run.subquery()) for run in runs]).subquery()
+    return order_keyset(
+        sqlalchemy.select(merged), merged.c[sort_col.name], merged.c[key_col.name], order
+    ).limit(limit + 1)
+
+async def fetch_page(request, query, response, sort_name, key_name, limit):
+    rows = await reader().fetch_all(query)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1][sort_name], rows[-1][key_name])
+    return list_response(request, response, rows, query.selected_columns)
+
+def json_mode(request):
+    route = request.scope.get("route")
+    return JSON_RESPONSE_ROUTES.get(getattr(route, "path", request.url.path), JSON_RESPONSE_MODE)
+
+def json_keys(columns):
+    # orjson only accepts exact str keys, and SQLAlchemy column names are a str subclass
+    return [str(column.name) for column in columns]
+
+def json_row(keys, row):
+    # _mapping.values() is in select order for both the SQLite and the Postgres records
+    return dict(zip(keys, row._mapping.values()))
+
+async def stream_json_rows(request, query):
+    # Encode a JSON array batch by batch while rows are still coming from the database
+    keys = json_keys(query.selected_columns)
+    separator = b"["
+    batch = []
+    count = 0
+    async for row in reader().iterate(query):
+        count += 1
+        batch.append(json_row(keys, row))
+        if len(batch) >= JSON_STREAM_BATCH_ROWS:
+            yield separator + orjson.dumps(batch)[1:-1]
+            separator = b","
+            batch = []
+    if batch:
+        yield separator + orjson.dumps(batch)[1:-1]
+        separator = b","
+    yield b"[]" if separator == b"[" else b"]"
+    if METRICS_ENABLED:
+        metrics.observe_rows(request, count)
+
+def list_response(request, response, rows, columns):
+    # JSON by default; an Arrow IPC stream or Parquet file, typed from the query's
+    # columns, when the Accept header prefers one
+    if METRICS_ENABLED:
+        metrics.observe_rows(request, len(rows))
+    media_type = columnar.negotiate(request.headers.get("accept"))
+    if media_type == columnar.JSON_TYPE:
+        if json_mode(request) != "fast":
+            return rows
+        keys = json_keys(columns)
+        return Response(
+            content=orjson.dumps([json_row(keys, row) for row in rows]),
+            media_type=media_type,
+            headers=dict(response.headers),
+        )
+    table = columnar.to_table(rows, columnar.schema_for(columns))
+    return Response(
+        content=columnar.encode(table, media_type),
+        media_type=media_type,
+        headers=dict(response.headers),
+    )
+
+async def bump_table_versions(*tables):
+    # Must run inside the write's transaction so readers never see new rows under an old ETag
+    query = table_versions.update().where(
+        table_versions.c.table_name.in_([table.name for table in tables])
+    ).values(
+        version=table_versions.c.version + 1,
+        updated_at=datetime.now(timezone.utc).isoformat(),
+    )
+    await database.execute(query)
+
+async def not_modified(request, response, tables):
+    # Set ETag/Last-Modified from the table versions and return a 304 response if the
+    # client already has this representation; the list query itself is skipped
+    query = table_versions.select().where(
+        table_versions.c.table_name.in_([table.name for table in tables])
+    ).order_by(table_versions.c.table_name)
+    rows = await reader().fetch_all(query)
+    versions = ",".join(f"{row['table_name']}:{row['version']}" for row in rows)
+    # The representation also depends on the negotiated format
+    accept = request.headers.get("accept", "")
+    digest = hashlib.sha1(f"{request.url.path}?{request.url.query}|{accept}|{versions}".encode()).hexdigest()
+    headers = {"ETag": f'W/"{digest[:20]}"', "Cache-Control": "no-cache", "Vary": "Accept"}
+    if rows:
+        last_modified = max(datetime.fromisoformat(row['updated_at']) for row in rows)
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    
+    if_none_match = request.headers.get("if-none-match", "")
+    if headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+# Upserts that merge a batch into the stats tables without reading them first
+STATS_MERGE_SQL = """
+INSERT INTO coffee_stats (group_type, group_key, metric, count, total, total_sq, min_value, max_value)
+VALUES (:group_type, :group_key, :metric, :count, :total, :total_sq, :min_value, :max_value)
+ON CONFLICT (group_type, group_key, metric) DO UPDATE SET
+    count = coffee_stats.count + excluded.count,
+    total = coffee_stats.total + excluded.total,
+    total_sq = coffee_stats.total_sq + excluded.total_sq,
+    min_value = CASE WHEN coffee_stats.min_value IS NULL OR excluded.min_value < coffee_stats.min_value
+                     THEN excluded.min_value ELSE coffee_stats.min_value END,
+    max_value = CASE WHEN coffee_stats.max_value IS NULL OR excluded.max_value > coffee_stats.max_value
+                     THEN excluded.max_value ELSE coffee_stats.max_value END
+"""
+
+STATS_BINS_MERGE_SQL = """
+INSERT INTO coffee_stats_bins (group_type, group_key, metric, bin, count)
+VALUES (:group_type, :group_key, :metric, :bin, :count)
+ON CONFLICT (group_type, group_key, metric, bin) DO UPDATE SET
+    count = coffee_stats_bins.count + excluded.count
+"""
+
+async def apply_stats(batch):
+    # Must run inside the transaction of the write that produced the batch
+    summary_rows = batch.summary_rows()
+    if summary_rows:
+        await database.execute_rows(STATS_MERGE_SQL, summary_rows)
+        await database.execute_rows(STATS_BINS_MERGE_SQL, batch.bin_rows())
+
+async def roasts_by_id(roast_ids):
+    # coffee_name and bean_id for each roast, looked up in chunks by primary key
+    roast_ids = list(roast_ids)
+    roasts = {}
+    for start in range(0, len(roast_ids), BULK_CHUNK_SIZE):
+        query = sqlalchemy.select(
+            coffee_roasts.c.roast_id, coffee_roasts.c.coffee_name, coffee_roasts.c.bean_id
+        ).where(coffee_roasts.c.roast_id.in_(roast_ids[start:start + BULK_CHUNK_SIZE]))
+        for row in await database.fetch_all(query):
+            roasts[row["roast_id"]] = {"coffee_name": row["coffee_name"], "bean_id": row["bean_id"]}
+    return roasts
+
+async def rebuild_stats():
+    # Recompute the stats tables from scratch, e.g. after a backfill or import
+    batch = StatsBatch()
+    async for roast in database.iterate(coffee_roasts.select()):
+        batch.add_roast(roast._mapping)
+    scores = sqlalchemy.select(
+        coffee_scores.c.total_score, coffee_roasts.c.coffee_name, coffee_roasts.c.bean_id
+    ).select_from(
+        coffee_scores.join(coffee_roasts, coffee_roasts.c.roast_id == coffee_scores.c.roast_id)
+    )
+    async for score in database.iterate(scores):
+        batch.add_score(score._mapping, score._mapping)
     
-    # Try to create tables if they don't exist
-    metadata.create_all(engine, checkfirst=True)
-    logger.info("Database tables initialized")
-except Exception as e:
-    logger.error(f"Failed to initialize database: {str(e)}")
-    raise e
+    async with database.transaction():
+        await database.execute(coffee_stats_bins.delete())
+        await database.execute(coffee_stats.delete())
+        await apply_stats(batch)
+        # The roasts and scores did not change, so /stats/ needs a version of its own
+        await bump_table_versions(coffee_stats)
+    return len(batch.summaries)
+
+# Stock may dip this far below zero from float rounding before a movement is refused
+STOCK_TOLERANCE_KG = 1e-9
+
+# Conditional update: applies the change only if stock stays non-negative, in one statement.
+# Written as text because SQLAlchemy 1.4 cannot compile RETURNING for SQLite (3.35+ supports it).
+STOCK_UPDATE_SQL = """
+UPDATE green_beans
+SET current_stock_kg = CASE
+    WHEN COALESCE(current_stock_kg, 0) + :change_kg > 0 THEN COALESCE(current_stock_kg, 0) + :change_kg
+    ELSE 0
+END
+WHERE bean_id = :bean_id AND COALESCE(current_stock_kg, 0) + :change_kg >= :min_stock
+RETURNING current_stock_kg, price_per_kg
+"""
+
+def stock_movement(bean_id, change_kg, reason, roast_id=None, unit_cost=None):
+    # cost and sequence are filled in by apply_costs
+    return {
+        "movement_id": new_id(),
+        "bean_id": bean_id,
+        "roast_id": roast_id,
+        "change_kg": change_kg,
+        "reason": reason,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "unit_cost": unit_cost,
+        "cost": None,
+        "sequence": None,
+    }
+
+COST_STATE_UPSERT_SQL = """
+INSERT INTO green_bean_costs (bean_id, method, quantity_kg, value, layers, sequence, updated_at)
+VALUES (:bean_id, :method, :quantity_kg, :value, :layers, :sequence, :updated_at)
+ON CONFLICT (bean_id) DO UPDATE SET
+    method = excluded.method,
+    quantity_kg = excluded.quantity_kg,
+    value = excluded.value,
+    layers = excluded.layers,
+    sequence = excluded.sequence,
+    updated_at = excluded.updated_at
+"""
+
+UPDATE_ROAST_COST_SQL = "UPDATE coffee_roasts SET green_cost = :green_cost WHERE roast_id = :roast_id"
+
+async def apply_costs(movements):
+    # Cost new ledger rows against their beans' cost layers, setting cost and sequence on
+    # each movement and green_cost on the roasts they belong to. Must run inside the
+    # transaction that inserts the movements, after their beans' stock rows are updated
+    # (which serializes writers per bean).
+    bean_ids = list({movement["bean_id"] for movement in movements})
+    states = {
+        row["bean_id"]: costing.CostLayers.from_row(row)
+        for row in await database.fetch_all(green_bean_costs.select().where(green_bean_costs.c.bean_id.in_(bean_ids)))
+    }
+    roast_costs = defaultdict(float)
+    for movement in movements:
+        state = states.get(movement["bean_id"])
+        if state is None:
+            state = states[movement["bean_id"]] = costing.CostLayers(costing.DEFAULT_METHOD)
+        state.apply(movement)
+        if movement["roast_id"]:
+            roast_costs[movement["roast_id"]] -= movement["cost"]
+    await database.execute_rows(COST_STATE_UPSERT_SQL, [state.row(bean_id) for bean_id, state in states.items()])
+    if roast_costs:
+        await database.execute_rows(UPDATE_ROAST_COST_SQL, [
+            {"roast_id": roast_id, "green_cost": cost} for roast_id, cost in roast_costs.items()
+        ])
+
+async def apply_stock_change(bean_id, change_kg, movements):
+    # Must run inside a transaction so the ledger rows and the stock update commit together
+    row = await database.fetch_one(STOCK_UPDATE_SQL, values={
+        "bean_id": bean_id,
+        "change_kg": change_kg,
+        "min_stock": -STOCK_TOLERANCE_KG,
+    })
+    if row is None:
+        exists = await database.fetch_one(
+            sqlalchemy.select(green_beans.c.bean_id).where(green_beans.c.bean_id == bean_id)
+        )
+        if not exists:
+            raise HTTPException(status_code=404, detail=f"Green bean {bean_id} not found")
+        raise HTTPException(status_code=409, detail=f"Not enough stock for green bean {bean_id}")
+    for movement in movements:
+        # Stock added back without a price is valued at the bean's purchase price
+        if movement["change_kg"] > 0 and movement["unit_cost"] is None:
+            movement["unit_cost"] = row["price_per_kg"]
+    await apply_costs(movements)
+    await database.execute_many(green_bean_stock_movements.insert(), movements)
+    await bump_table_versions(green_beans, green_bean_stock_movements)
+    return float(row["current_stock_kg"])
+
+# Rows per executemany batch in the bulk endpoints
+BULK_CHUNK_SIZE = 500
+
+async def bulk_insert(request, model, table, id_field, on_row=None, after_insert=None):
+    # Stream, validate and insert rows in chunks inside a single transaction.
+    # Invalid rows are skipped and reported; a database error rolls back everything.
+    # on_row may return a list of errors to skip and report its row the same way.
+    ids = []
+    errors = []
+    chunk = []
+    try:
+        async with database.transaction():
+            rows = ingest.iter_validated(request.stream(), request.headers.get("content-type"), model)
+            async for row_number, item, row_errors in rows:
+                if row_errors:
+                    errors.append({"row": row_number, "errors": row_errors})
+                    continue
+                values = item.dict()
+                # Keep IDs supplied by the source system so related rows can reference them
+                values[id_field] = values.get(id_field) or new_id()
+                if on_row:
+                    row_errors = on_row(values)
+                    if row_errors:
+                        errors.append({"row": row_number, "errors": row_errors})
+                        continue
+                chunk.append(values)
+                if len(chunk) >= BULK_CHUNK_SIZE:
+                    await database.execute_many(table.insert(), chunk)
+                    ids.extend(values[id_field] for values in chunk)
+                    chunk = []
+            if chunk:
+                await database.execute_many(table.insert(), chunk)
+                ids.extend(values[id_field] for values in chunk)
+            if after_insert:
+                await after_insert()
+            if ids:
+                await bump_table_versions(table)
+    except ingest.UnsupportedFormat as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ingest.InvalidBody as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Bulk insert into {table.name} failed: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Bulk insert failed, nothing was saved: {str(e)}")
+    
+    return {"inserted": len(ids), "ids": ids, "errors": errors}
+
+# Roast columns filled from the curve once first crack is detected
+PHASE_ROAST_COLUMNS = ("development_time", "total_time", "dtr_ratio")
+PHASE_BATCH_SIZE = 500
+
+UPDATE_ROAST_PHASES_SQL = """
+UPDATE coffee_roasts
+SET development_time = :development_time, total_time = :total_time, dtr_ratio = :dtr_ratio
+WHERE roast_id = :roast_id
+"""
+
+def analyze_curves(curve_rows):
+    # Decode stored curves and run the phase engine over all of them at once
+    results = phases.analyze(
+        [curves.decode_series(row["bean_temp"], curves.TEMP_SCALE) for row in curve_rows],
+        [row["sample_rate_hz"] for row in curve_rows],
+    )
+    return [
+        dict(metrics, roast_id=row["roast_id"], curve_updated_at=row["updated_at"])
+        for row, metrics in zip(curve_rows, phases.metrics_rows(results))
+    ]
+
+async def store_phase_metrics(metrics_rows):
+    # Cache the metrics and fill in the derived roast columns, moving the stats from the
+    # old values to the new ones. Must run inside a transaction.
+    roast_ids = [row["roast_id"] for row in metrics_rows]
+    query = sqlalchemy.select(
+        coffee_roasts.c.roast_id, coffee_roasts.c.coffee_name, coffee_roasts.c.bean_id,
+        *[coffee_roasts.c[name] for name in PHASE_ROAST_COLUMNS],
+    ).where(coffee_roasts.c.roast_id.in_(roast_ids))
+    roasts = {row["roast_id"]: row._mapping for row in await database.fetch_all(query)}
+    
+    stats = StatsBatch()
+    updates = []
+    for row in metrics_rows:
+        roast = roasts.get(row["roast_id"])
+        derived = phases.roast_columns(row)
+        if roast is None or derived is None:
+            # Without first crack there is nothing to derive; keep whatever was entered
+            continue
+        derived["roast_id"] = row["roast_id"]
+        stats.add_roast(roast, PHASE_ROAST_COLUMNS, weight=-1)
+        stats.add_roast(dict(roast, **derived), PHASE_ROAST_COLUMNS)
+        updates.append(derived)
+    
+    await database.execute(roast_phase_metrics.delete().where(roast_phase_metrics.c.roast_id.in_(roast_ids)))
+    await database.execute_many(roast_phase_metrics.insert(), metrics_rows)
+    if updates:
+        await database.execute_many(UPDATE_ROAST_PHASES_SQL, updates)
+        await bump_table_versions(coffee_roasts)
+        await apply_stats(stats)
+        similar_roasts.touch(update["roast_id"] for update in updates)
+    return len(updates)
+
+async def rebuild_phase_metrics(force=False):
+    # Recompute phase metrics for curves whose cached metrics are missing or stale
+    # (or all of them with force), PHASE_BATCH_SIZE roasts per engine pass
+    analyzed = derived = 0
+    last_id = ""
+    while True:
+        query = sqlalchemy.select(
+            roast_curves.c.roast_id, roast_curves.c.sample_rate_hz, roast_curves.c.bean_temp, roast_curves.c.updated_at
+        ).select_from(
+            roast_curves.outerjoin(roast_phase_metrics, roast_phase_metrics.c.roast_id == roast_curves.c.roast_id)
+        ).where(roast_curves.c.roast_id > last_id)
+        if not force:
+            query = query.where(sqlalchemy.or_(
+                roast_phase_metrics.c.curve_updated_at.is_(None),
+                roast_phase_metrics.c.curve_updated_at != roast_curves.c.updated_at,
+            ))
+        rows = await database.fetch_all(query.order_by(roast_curves.c.roast_id).limit(PHASE_BATCH_SIZE))
+        if not rows:
+            break
+        metrics_rows = analyze_curves(rows)
+        async with database.transaction():
+            derived += await store_phase_metrics(metrics_rows)
+        analyzed += len(rows)
+        last_id = rows[-1]["roast_id"]
+    return analyzed, derived
+
+# Stored template versions never change, so each is parsed and compiled once per process
+compiled_templates = {}
+
+async def load_template(template_id, version=None):
+    # ((template_id, version), compiled template) for the given version, else the latest
+    if version is not None and (template_id, version) in compiled_templates:
+        return (template_id, version), compiled_templates[(template_id, version)]
+    query = scoring_templates.select().where(scoring_templates.c.template_id == template_id)
+    if version is not None:
+        query = query.where(scoring_templates.c.version == version)
+    row = await database.fetch_one(query.order_by(scoring_templates.c.version.desc()).limit(1))
+    if not row:
+        raise HTTPException(status_code=404, detail=f"Scoring template {template_id} not found")
+    key = (row["template_id"], row["version"])
+    if key not in compiled_templates:
+        compiled_templates[key] = scoring.compile_template(json.loads(row["definition"]))
+    return key, compiled_templates[key]
+
+def apply_template(values, template_key, template):
+    apply_template_rows([values], template_key, template)
+
+def apply_template_rows(rows, template_key, template):
+    # Server-side totals and defect points in one engine pass; a cupping without
+    # attributes keeps its total
+    for values in rows:
+        error = scoring.unknown_defect(values, template)
+        if error:
+            raise HTTPException(status_code=400, detail=error)
+    for values, result in zip(rows, scoring.result_rows(rows, template)):
+        values["defects"] = result["defects"]
+        if result["total_score"] is not None:
+            values.update(total_score=result["total_score"], template_id=template_key[0], template_version=template_key[1])
+
+def template_response(row):
+    return {
+        "template_id": row["template_id"],
+        "version": row["version"],
+        "created_at": row["created_at"],
+        **json.loads(row["definition"]),
+    }
+
+# Scores per engine pass in the rescoring job
+RESCORE_BATCH_SIZE = 5000
+# Rescored totals further than this from the stored one count as changed
+RESCORE_TOLERANCE = 0.005
+
+SCORE_RESULT_INSERT_SQL = """
+INSERT INTO score_results (template_id, template_version, score_id, total_score, defects)
+VALUES (:template_id, :template_version, :score_id, :total_score, :defects)
+ON CONFLICT (template_id, template_version, score_id) DO NOTHING
+"""
+
+APPLY_RESCORE_SQL = """
+UPDATE coffee_scores
+SET total_score = (
+        SELECT r.total_score FROM score_results r
+        WHERE r.template_id = :template_id AND r.template_version = :template_version
+          AND r.score_id = coffee_scores.score_id
+    ),
+    defects = (
+        SELECT r.defects FROM score_results r
+        WHERE r.template_id = :template_id AND r.template_version = :template_version
+          AND r.score_id = coffee_scores.score_id
+    ),
+    template_id = :template_id,
+    template_version = :template_version
+WHERE score_id IN (
+    SELECT score_id FROM score_results
+    WHERE template_id = :template_id AND template_version = :template_version AND total_score IS NOT NULL
+)
+"""
+
+def score_result_match(template_key):
+    # Join condition from a score to its cached result for one template version
+    template_id, version = template_key
+    return sqlalchemy.and_(
+        score_results.c.score_id == coffee_scores.c.score_id,
+        score_results.c.template_id == template_id,
+        score_results.c.template_version == version,
+    )
+
+async def rescore(template_key, template):
+    # Score every cupping without a cached result for this template version, in batches
+    # of RESCORE_BATCH_SIZE; returns how many were computed
+    template_id, version = template_key
+    computed = 0
+    last_id = ""
+    while True:
+        query = sqlalchemy.select(
+            coffee_scores.c.score_id, coffee_scores.c.defects, coffee_scores.c.defect_cups,
+            coffee_scores.c.defect_type, *[coffee_scores.c[name] for name in scoring.ATTRIBUTES],
+        ).select_from(
+            coffee_scores.outerjoin(score_results, score_result_match(template_key))
+        ).where(coffee_scores.c.score_id > last_id, score_results.c.score_id.is_(None))
+        rows = await database.fetch_all(query.order_by(coffee_scores.c.score_id).limit(RESCORE_BATCH_SIZE))
+        if not rows:
+            break
+        results = [
+            dict(result, template_id=template_id, template_version=version, score_id=row["score_id"])
+            for row, result in zip(rows, scoring.result_rows(rows, template))
+        ]
+        async with database.transaction():
+            await database.execute_rows(SCORE_RESULT_INSERT_SQL, results)
+        computed += len(rows)
+        last_id = rows[-1]["score_id"]
+    return computed
+
+async def rescore_summary(template_key):
+    # How the cached results for a template version compare with the stored totals
+    rescored = score_results.c.total_score
+    stored = coffee_scores.c.total_score
+    changed = sqlalchemy.and_(
+        rescored.isnot(None),
+        sqlalchemy.or_(stored.is_(None), sqlalchemy.func.abs(rescored - stored) > RESCORE_TOLERANCE),
+    )
+    row = await database.fetch_one(sqlalchemy.select(
+        sqlalchemy.func.count().label("scores"),
+        sqlalchemy.func.sum(sqlalchemy.case((changed, 1), else_=0)).label("changed"),
+        sqlalchemy.func.avg(rescored - stored).label("mean_change"),
+    ).select_from(coffee_scores.join(score_results, score_result_match(template_key))))
+    mean_change = row["mean_change"]
+    return {
+        "scores": row["scores"],
+        "changed": row["changed"] or 0,
+        "mean_change": round(float(mean_change), 4) if mean_change is not None else None,
+    }
+
+async def apply_rescore(template_key):
+    # Write the cached results into the scores, then rebuild the statistics they feed
+    template_id, version = template_key
+    # One transaction, so /stats/ never pairs the new scores' ETag with the old statistics
+    async with database.transaction():
+        await database.execute(APPLY_RESCORE_SQL, {"template_id": template_id, "template_version": version})
+        await bump_table_versions(coffee_scores)
+        # Session totals changed, so their cached calibration is recomputed on next read
+        await database.execute(cupping_sessions.update().where(
+            cupping_sessions.c.calibration.isnot(None)
+        ).values(calibration=None))
+        await rebuild_stats()
+
+SCORE_INSERT_SQL = "INSERT INTO coffee_scores ({}) VALUES ({})".format(
+    ", ".join(coffee_scores.c.keys()), ", ".join(f":{name}" for name in coffee_scores.c.keys())
+)
+
+async def cache_calibration(session_id):
+    # Calibration statistics of a session from its stored sheets, saved on the session
+    # row; returns them as JSON text
+    rows = await database.fetch_all(sqlalchemy.select(
+        coffee_scores.c.score_id, coffee_scores.c.cupper, coffee_scores.c.roast_id,
+        *[coffee_scores.c[name] for name in calibration.METRICS],
+    ).where(coffee_scores.c.session_id == session_id))
+    content = json.dumps(calibration.calibrate([dict(row._mapping) for row in rows]))
+    await database.execute(cupping_sessions.update().where(
+        cupping_sessions.c.session_id == session_id
+    ).values(calibration=content))
+    return content
 
 app = FastAPI()
 
+# Request and query telemetry for /metrics; METRICS_ENABLED=false turns it off
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+if METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.instrument_database(database)
+
+if read_database is not database:
+    # A read-only pool on the primary's own file (SQLITE_PROFILE=wal) sees every commit
+    app.add_middleware(replica.ReplicaMiddleware, routes=REPLICA_ROUTES, max_age_s=READ_AFTER_MAX_AGE_S,
+                       read_your_writes=bool(DATABASE_READ_URL))
+    if METRICS_ENABLED:
+        metrics.instrument_database(read_database, "db_read_pool")
+
+@app.exception_handler(WriteQueueFull)
+@app.exception_handler(PoolTimeoutError)
+async def overloaded_handler(request: Request, exc: Exception):
+    # The pool or the write queue is saturated; ask clients to retry rather than
+    # queueing without bound
+    logger.warning(f"{request.method} {request.url.path}: {str(exc)}")
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+async def detect_search_backend():
+    if database.url.dialect == "postgresql":
+        return "postgresql"
+    if database.url.dialect == "sqlite":
+        exists = await database.fetch_val(
+            "SELECT 1 FROM sqlite_master WHERE name = :name", {"name": search.FTS5_TABLE}
+        )
+        return "sqlite" if exists else None
+    return None
+
 @app.on_event("startup")
 async def startup():
+    # Connection only: the schema is checked with one query and migrated just when behind
+    global SEARCH_BACKEND
     try:
         logger.info("Connecting to database...")
         await database.connect()
         logger.info("Database connection established")
+        if read_database is not database:
+            await read_database.connect()
+            logger.info("Read replica connection established")
+        
+        version = await migrations.schema_version()
+        if version is None or version < migrations.LATEST_VERSION:
+            if not MIGRATE_ON_STARTUP:
+                raise RuntimeError(
+                    f"Database schema is at version {version}, expected {migrations.LATEST_VERSION}; "
+                    "run `python -m app.migrate`"
+                )
+            await asyncio.get_running_loop().run_in_executor(None, migrations.migrate)
+        elif version > migrations.LATEST_VERSION:
+            logger.warning(f"Database schema version {version} is newer than this code ({migrations.LATEST_VERSION})")
+        SEARCH_BACKEND = await detect_search_backend()
+        if WRITE_QUEUE_ENABLED:
+            await write_queue.start()
     except Exception as e:
         logger.error(f"Startup error: {str(e)}")
         raise e
+    
+    elapsed_ms = (time.perf_counter() - IMPORT_STARTED) * 1000
+    log = logger.warning if elapsed_ms > STARTUP_BUDGET_MS else logger.info
+    log(f"Started in {elapsed_ms:.0f} ms (budget {STARTUP_BUDGET_MS:.0f} ms)")
 
 @app.on_event("shutdown")
 async def shutdown():
+    # Queued writes are committed before the connection goes
+    await write_queue.stop()
     await database.disconnect()
+    if read_database is not database:
+        await read_database.disconnect()
     logger.info("Database disconnected")
 
 @app.get("/health")
@@ -115,64 +886,823 @@ async def health_check():
         # Test database connection
         query = "SELECT 1"
         result = await database.fetch_one(query)
+        if read_database is not database:
+            await read_database.fetch_one(query)
+            return {"status": "healthy", "database": "connected", "replica": "connected"}
         return {"status": "healthy", "database": "connected"}
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    content, content_type = metrics.render()
+    # Passed as a header: media_type would get a second charset appended
+    return Response(content=content, headers={"Content-Type": content_type})
+
+@app.get("/db/stats")
+async def get_db_stats(
+    top: int = Query(10, ge=1, le=100),
+    sort: str = Query("mean", description="Order of the slowest statements: mean, max, total or count"),
+):
+    # Pool usage and wait times next to query times: high acquire waits with normal
+    # query times mean the pool is too small, not that the database is slow
+    if sort not in ("mean", "max", "total", "count"):
+        raise HTTPException(status_code=400, detail=f"Unknown sort: {sort}")
+    report = {**database.report(top, sort), "write_queue": write_queue.report()}
+    if read_database is not database:
+        report["replica"] = {**read_database.report(top, sort), **replica.report()}
+    return report
+
+@app.delete("/db/stats")
+async def reset_db_stats():
+    database.stats.reset()
+    read_database.stats.reset()
+    write_queue.reset()
+    return {"message": "Database statistics reset"}
+
+async def write_roast(roast_dict):
+    # Run through write_queue.submit: in a group commit when the queue is on, otherwise
+    # in a transaction of its own
+    new_stock = None
+    green_cost = None
+    stats = StatsBatch()
+    stats.add_roast(roast_dict)
+    await database.execute(coffee_roasts.insert().values(**roast_dict))
+    await bump_table_versions(coffee_roasts)
+    await apply_stats(stats)
+    
+    # If there's a bean_id and amount_used_kg, deduct the green bean stock in the same transaction
+    if roast_dict.get('bean_id') and roast_dict.get('amount_used_kg'):
+        used = roast_dict['amount_used_kg']
+        movement = stock_movement(roast_dict['bean_id'], -used, "roast", roast_dict['roast_id'])
+        new_stock = await apply_stock_change(roast_dict['bean_id'], -used, [movement])
+        green_cost = -movement['cost']
+    return new_stock, green_cost
+
 @app.post("/roasts/")
 async def create_roast(roast: CoffeeRoast):
     roast_dict = roast.dict()
-    roast_dict['roast_id'] = str(uuid.uuid4())
+    roast_dict['roast_id'] = new_id()
+    new_stock, green_cost = await write_queue.submit(lambda: write_roast(roast_dict))
+    similar_roasts.touch([roast_dict['roast_id']])
+    return {"roast_id": roast_dict['roast_id'], "new_stock_kg": new_stock, "green_cost": green_cost}
+
+@app.post("/roasts/bulk")
+async def create_roasts_bulk(request: Request):
+    # Stock is deducted once per bean with the summed amount, in the same transaction,
+    # with one ledger entry per roast; stats are merged once per coffee and bean
+    movements_by_bean = defaultdict(list)
+    stats = StatsBatch()
     
-    query = coffee_roasts.insert().values(**roast_dict)
-    await database.execute(query)
+    def track_usage(values):
+        stats.add_roast(values)
+        if values.get('bean_id') and values.get('amount_used_kg'):
+            movements_by_bean[values['bean_id']].append(stock_movement(
+                values['bean_id'], -values['amount_used_kg'], "roast", values['roast_id']
+            ))
     
-    # If there's a bean_id and amount_used_kg, update the green bean stock
-    if roast_dict.get('bean_id') and roast_dict.get('amount_used_kg'):
-        try:
-            await update_bean_stock(roast_dict['bean_id'], roast_dict['amount_used_kg'])
-        except Exception as e:
-            logger.error(f"Failed to update green bean stock: {str(e)}")
+    async def deduct_stock():
+        for bean_id, movements in movements_by_bean.items():
+            used = sum(movement['change_kg'] for movement in movements)
+            await apply_stock_change(bean_id, used, movements)
+        await apply_stats(stats)
     
-    return {"roast_id": roast_dict['roast_id']}
+    result = await bulk_insert(request, CoffeeRoast, coffee_roasts, "roast_id",
+                               on_row=track_usage, after_insert=deduct_stock)
+    similar_roasts.touch(result["ids"])
+    return result
 
 @app.get("/roasts/")
-async def get_roasts():
-    query = coffee_roasts.select()
-    return await database.fetch_all(query)
+async def get_roasts(
+    request: Request,
+    response: Response,
+    coffee_name: Optional[List[str]] = Query(None),
+    bean_id: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    cached = await not_modified(request, response, (coffee_roasts,))
+    if cached:
+        return cached
+    
+    columns = select_fields(coffee_roasts.c, fields, ("date", "roast_id"))
+    query = sqlalchemy.select(*columns)
+    query = filter_roasts(query, coffee_name, bean_id, date_from, date_to)
+    query = paginate(query, coffee_roasts.c.date, coffee_roasts.c.roast_id, order, cursor, limit)
+    return await fetch_page(request, query, response, "date", "roast_id", limit)
+
+# Roast columns plus the linked green bean, joined in SQL
+ENRICHED_ROAST_COLUMNS = {
+    **dict(coffee_roasts.c.items()),
+    "bean_name": green_beans.c.name,
+    "bean_origin": green_beans.c.origin,
+    "bean_processing": green_beans.c.processing,
+}
+
+@app.get("/roasts/enriched")
+async def get_enriched_roasts(
+    request: Request,
+    response: Response,
+    coffee_name: Optional[List[str]] = Query(None),
+    bean_id: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    cached = await not_modified(request, response, (coffee_roasts, green_beans))
+    if cached:
+        return cached
+    
+    columns = select_fields(ENRICHED_ROAST_COLUMNS, fields, ("date", "roast_id"))
+    query = select_enriched_roasts(columns)
+    query = filter_roasts(query, coffee_name, bean_id, date_from, date_to)
+    query = paginate(query, coffee_roasts.c.date, coffee_roasts.c.roast_id, order, cursor, limit)
+    return await fetch_page(request, query, response, "date", "roast_id", limit)
+
+@app.get("/roasts/export")
+async def export_roasts(
+    coffee_name: Optional[List[str]] = Query(None),
+    bean_id: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    fields: Optional[str] = None,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = False,
+):
+    columns = select_fields(ENRICHED_ROAST_COLUMNS, fields, ())
+    query = select_enriched_roasts(columns)
+    query = filter_roasts(query, coffee_name, bean_id, date_from, date_to)
+    query = order_keyset(query, coffee_roasts.c.date, coffee_roasts.c.roast_id, order)
+    return export_response(query, columns, format, gzip, "coffee_roast_history")
+
+@app.get("/roasts/coffee-names")
+async def get_roast_coffee_names(request: Request, response: Response):
+    # Distinct names for filter widgets, served from ix_coffee_roasts_coffee_name
+    cached = await not_modified(request, response, (coffee_roasts,))
+    if cached:
+        return cached
+    
+    query = sqlalchemy.select(coffee_roasts.c.coffee_name).distinct().where(
+        coffee_roasts.c.coffee_name.isnot(None)
+    ).order_by(coffee_roasts.c.coffee_name)
+    rows = await reader().fetch_all(query)
+    return [row["coffee_name"] for row in rows]
+
+@app.put("/roasts/{roast_id}/curve")
+async def put_roast_curve(roast_id: str, curve: RoastCurve):
+    if not curves.MIN_SAMPLE_RATE_HZ <= curve.sample_rate_hz <= curves.MAX_SAMPLE_RATE_HZ:
+        raise HTTPException(
+            status_code=400,
+            detail=f"sample_rate_hz must be between {curves.MIN_SAMPLE_RATE_HZ:g} and {curves.MAX_SAMPLE_RATE_HZ:g}",
+        )
+    if not curve.bean_temp:
+        raise HTTPException(status_code=400, detail="bean_temp must not be empty")
+    if curve.env_temp is not None and len(curve.env_temp) != len(curve.bean_temp):
+        raise HTTPException(status_code=400, detail="env_temp must have the same length as bean_temp")
+    
+    roast = await database.fetch_one(
+        sqlalchemy.select(coffee_roasts.c.roast_id).where(coffee_roasts.c.roast_id == roast_id)
+    )
+    if not roast:
+        raise HTTPException(status_code=404, detail="Roast not found")
+    
+    events = sorted(curve.burner_events, key=lambda event: event.time_s)
+    values = {
+        "roast_id": roast_id,
+        "sample_rate_hz": curve.sample_rate_hz,
+        "sample_count": len(curve.bean_temp),
+        "encoding": curves.CURVE_ENCODING,
+        "bean_temp": curves.encode_series(curve.bean_temp, curves.TEMP_SCALE),
+        "env_temp": curves.encode_series(curve.env_temp, curves.TEMP_SCALE) if curve.env_temp is not None else None,
+        "burner_times": curves.encode_series([event.time_s for event in events], curves.TIME_SCALE),
+        "burner_values": curves.encode_series([event.value for event in events], curves.TEMP_SCALE),
+        "updated_at": datetime.now(timezone.utc).isoformat(),
+    }
+    metrics = phases.metrics_rows(phases.analyze([curve.bean_temp], [curve.sample_rate_hz]))[0]
+    metrics.update(roast_id=roast_id, curve_updated_at=values["updated_at"])
+    async with database.transaction():
+        await database.execute(roast_curves.delete().where(roast_curves.c.roast_id == roast_id))
+        await database.execute(roast_curves.insert().values(**values))
+        await store_phase_metrics([metrics])
+    
+    stored_bytes = sum(len(values[name] or b"") for name in ("bean_temp", "env_temp", "burner_times", "burner_values"))
+    return {
+        "roast_id": roast_id,
+        "sample_count": values["sample_count"],
+        "stored_bytes": stored_bytes,
+        "phases": {name: metrics[name] for name in phases.METRICS},
+    }
+
+@app.get("/roasts/{roast_id}/curve")
+async def get_roast_curve(
+    roast_id: str,
+    points: int = Query(500, ge=3, le=100000),
+    ror: bool = Query(False, description="Include the smoothed rate of rise (degrees/min) as a series"),
+):
+    # Each temperature series is downsampled to at most `points` points with LTTB,
+    # which keeps turning points and peaks that uniform decimation would drop
+    curve = await database.fetch_one(roast_curves.select().where(roast_curves.c.roast_id == roast_id))
+    if not curve:
+        raise HTTPException(status_code=404, detail="Roast curve not found")
+    
+    times = [i / curve["sample_rate_hz"] for i in range(curve["sample_count"])]
+    series = {}
+    for name in ("bean_temp", "env_temp"):
+        values = curves.decode_series(curve[name], curves.TEMP_SCALE)
+        if values is None:
+            continue
+        kept_times, kept_values = curves.lttb(times, values, points)
+        series[name] = {
+            "time_s": [round(t, 2) for t in kept_times],
+            "value": [round(v, 2) for v in kept_values],
+        }
+    if ror:
+        rate_of_rise = phases.analyze([curves.decode_series(curve["bean_temp"], curves.TEMP_SCALE)],
+                                      [curve["sample_rate_hz"]])["ror"][0]
+        defined = [(i / phases.ENGINE_RATE_HZ, float(v)) for i, v in enumerate(rate_of_rise) if v == v]
+        kept_times, kept_values = curves.lttb([t for t, _ in defined], [v for _, v in defined], points)
+        series["ror"] = {
+            "time_s": [round(t, 2) for t in kept_times],
+            "value": [round(v, 2) for v in kept_values],
+        }
+    burner_times = curves.decode_series(curve["burner_times"], curves.TIME_SCALE) or []
+    burner_values = curves.decode_series(curve["burner_values"], curves.TEMP_SCALE) or []
+    
+    return {
+        "roast_id": roast_id,
+        "sample_rate_hz": curve["sample_rate_hz"],
+        "sample_count": curve["sample_count"],
+        "series": series,
+        "burner_events": [
+            {"time_s": t, "value": v} for t, v in zip(burner_times, burner_values)
+        ],
+    }
+
+@app.get("/roasts/{roast_id}/cost")
+async def get_roast_cost(roast_id: str):
+    # Costed when the roast's stock was deducted; null for roasts without a green bean
+    query = sqlalchemy.select(
+        coffee_roasts.c.roast_id, coffee_roasts.c.bean_id, coffee_roasts.c.amount_used_kg, coffee_roasts.c.green_cost,
+    ).where(coffee_roasts.c.roast_id == roast_id)
+    row = await database.fetch_one(query)
+    if not row:
+        raise HTTPException(status_code=404, detail="Roast not found")
+    cost, used = row["green_cost"], row["amount_used_kg"]
+    return {
+        **dict(row._mapping),
+        "cost_per_kg": cost / used if cost is not None and used else None,
+    }
+
+SIMILAR_ROAST_COLUMNS = list(coffee_roasts.c) + [green_beans.c.origin, green_beans.c.processing]
+SIMILAR_SCORE_COLUMNS = [
+    coffee_scores.c.score_id, coffee_scores.c.roast_id, coffee_scores.c.date, coffee_scores.c.total_score,
+    coffee_scores.c.cupper, coffee_scores.c.session_id,
+]
+
+@app.get("/roasts/{roast_id}/similar")
+async def get_similar_roasts(
+    roast_id: str,
+    k: int = Query(10, ge=1, le=MAX_SIMILAR),
+    same_origin: bool = False,
+    same_processing: bool = False,
+):
+    # Nearest roasts by the similar.FEATURES, with their cupping scores
+    same = [name for name, wanted in (("origin", same_origin), ("processing", same_processing)) if wanted]
+    index = await similar_roasts.index()
+    if roast_id not in index.positions:
+        # Written by another worker since the index was loaded
+        index = await similar_roasts.index(include=[roast_id])
+    try:
+        nearest = index.query(roast_id, k, same)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Roast not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    roast_ids = [roast for roast, _ in nearest]
+    roasts = await database.fetch_all(sqlalchemy.select(*SIMILAR_ROAST_COLUMNS).select_from(
+        coffee_roasts.outerjoin(green_beans, green_beans.c.bean_id == coffee_roasts.c.bean_id)
+    ).where(coffee_roasts.c.roast_id.in_(roast_ids)))
+    scores = await database.fetch_all(sqlalchemy.select(*SIMILAR_SCORE_COLUMNS).where(
+        coffee_scores.c.roast_id.in_(roast_ids)
+    ).order_by(coffee_scores.c.date, coffee_scores.c.score_id))
+    roast_keys, score_keys = json_keys(SIMILAR_ROAST_COLUMNS), json_keys(SIMILAR_SCORE_COLUMNS)
+    rows = {row["roast_id"]: json_row(roast_keys, row) for row in roasts}
+    scores_by_roast = defaultdict(list)
+    for row in scores:
+        scores_by_roast[row["roast_id"]].append(json_row(score_keys, row))
+    
+    results = []
+    for roast, distance in nearest:
+        if roast not in rows:
+            # Removed outside the API since it was indexed
+            continue
+        totals = [score["total_score"] for score in scores_by_roast[roast] if score["total_score"] is not None]
+        results.append({
+            **rows[roast],
+            "distance": round(distance, 4),
+            "mean_score": round(sum(totals) / len(totals), 2) if totals else None,
+            "scores": scores_by_roast[roast],
+        })
+    return Response(
+        content=orjson.dumps({"roast_id": roast_id, "features": similar.FEATURES, "similar": results}),
+        media_type="application/json",
+    )
+
+@app.get("/roasts/{roast_id}/phases")
+async def get_roast_phases(roast_id: str):
+    # Served from roast_phase_metrics; recomputed only if the curve changed since
+    query = sqlalchemy.select(
+        roast_curves.c.updated_at, roast_phase_metrics
+    ).select_from(
+        roast_curves.outerjoin(roast_phase_metrics, roast_phase_metrics.c.roast_id == roast_curves.c.roast_id)
+    ).where(roast_curves.c.roast_id == roast_id)
+    row = await database.fetch_one(query)
+    if not row:
+        raise HTTPException(status_code=404, detail="Roast curve not found")
+    
+    if row["curve_updated_at"] == row["updated_at"]:
+        metrics = {name: row[name] for name in phases.METRICS}
+    else:
+        curve = await database.fetch_one(roast_curves.select().where(roast_curves.c.roast_id == roast_id))
+        metrics = analyze_curves([curve])[0]
+        async with database.transaction():
+            await store_phase_metrics([metrics])
+    
+    return {"roast_id": roast_id, **{name: metrics[name] for name in phases.METRICS}}
+
+async def write_score(score_dict):
+    # Run through write_queue.submit, like write_roast
+    await database.execute(coffee_scores.insert().values(**score_dict))
+    await bump_table_versions(coffee_scores)
+    roast = (await roasts_by_id([score_dict['roast_id']])).get(score_dict['roast_id'])
+    if roast:
+        stats = StatsBatch()
+        stats.add_score(score_dict, roast)
+        await apply_stats(stats)
 
 @app.post("/scores/")
 async def create_score(score: CoffeeScore):
     score_dict = score.dict()
-    score_dict['score_id'] = str(uuid.uuid4())
+    score_dict['score_id'] = new_id()
+    template_key, template = await load_template(SCORING_TEMPLATE)
+    apply_template(score_dict, template_key, template)
+    await write_queue.submit(lambda: write_score(score_dict))
+    return {"score_id": score_dict['score_id'], "total_score": score_dict['total_score'], "defects": score_dict['defects']}
+
+@app.post("/scores/bulk")
+async def create_scores_bulk(request: Request):
+    # Every row is scored with the current template; a row naming an unknown defect
+    # type is skipped and reported like any other invalid row
+    scores = []
+    template_key, template = await load_template(SCORING_TEMPLATE)
     
-    query = coffee_scores.insert().values(**score_dict)
-    await database.execute(query)
-    return {"score_id": score_dict['score_id']}
+    def track_score(values):
+        error = scoring.unknown_defect(values, template)
+        if error:
+            return [error]
+        apply_template(values, template_key, template)
+        if values.get('total_score') is not None:
+            scores.append((values['roast_id'], values['total_score']))
+    
+    async def merge_stats():
+        roasts = await roasts_by_id({roast_id for roast_id, _ in scores})
+        stats = StatsBatch()
+        for roast_id, total_score in scores:
+            if roast_id in roasts:
+                stats.add_score({"total_score": total_score}, roasts[roast_id])
+        await apply_stats(stats)
+    
+    return await bulk_insert(request, CoffeeScore, coffee_scores, "score_id",
+                             on_row=track_score, after_insert=merge_stats)
 
 @app.get("/scores/")
-async def get_scores():
-    query = coffee_scores.select()
-    return await database.fetch_all(query)
+async def get_scores(
+    request: Request,
+    response: Response,
+    roast_id: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    cached = await not_modified(request, response, (coffee_scores,))
+    if cached:
+        return cached
+    
+    columns = select_fields(coffee_scores.c, fields, ("date", "score_id"))
+    query = sqlalchemy.select(*columns)
+    query = filter_scores(query, roast_id, date_from, date_to)
+    query = paginate(query, coffee_scores.c.date, coffee_scores.c.score_id, order, cursor, limit)
+    return await fetch_page(request, query, response, "date", "score_id", limit)
+
+# Score columns plus the roast and green bean they belong to, joined in SQL
+ENRICHED_SCORE_COLUMNS = {
+    **dict(coffee_scores.c.items()),
+    "coffee_name": coffee_roasts.c.coffee_name,
+    "roast_date": coffee_roasts.c.date,
+    "bean_id": coffee_roasts.c.bean_id,
+    "bean_name": green_beans.c.name,
+    "bean_origin": green_beans.c.origin,
+}
+
+@app.get("/scores/enriched")
+async def get_enriched_scores(
+    request: Request,
+    response: Response,
+    coffee_name: Optional[List[str]] = Query(None),
+    roast_id: Optional[str] = None,
+    bean_id: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    cached = await not_modified(request, response, (coffee_scores, coffee_roasts, green_beans))
+    if cached:
+        return cached
+    
+    columns = select_fields(ENRICHED_SCORE_COLUMNS, fields, ("date", "score_id"))
+    query = select_enriched_scores(columns)
+    query = filter_enriched_scores(query, coffee_name, roast_id, bean_id, date_from, date_to)
+    query = paginate(query, coffee_scores.c.date, coffee_scores.c.score_id, order, cursor, limit)
+    return await fetch_page(request, query, response, "date", "score_id", limit)
+
+@app.get("/scores/export")
+async def export_scores(
+    coffee_name: Optional[List[str]] = Query(None),
+    roast_id: Optional[str] = None,
+    bean_id: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    fields: Optional[str] = None,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = False,
+):
+    columns = select_fields(ENRICHED_SCORE_COLUMNS, fields, ())
+    query = select_enriched_scores(columns)
+    query = filter_enriched_scores(query, coffee_name, roast_id, bean_id, date_from, date_to)
+    query = order_keyset(query, coffee_scores.c.date, coffee_scores.c.score_id, order)
+    return export_response(query, columns, format, gzip, "coffee_cupping_history")
+
+@app.get("/scoring/templates")
+async def get_scoring_templates():
+    query = scoring_templates.select().order_by(scoring_templates.c.template_id, scoring_templates.c.version)
+    return [template_response(row) for row in await database.fetch_all(query)]
+
+@app.post("/scoring/templates")
+async def create_scoring_template(template: ScoringTemplate):
+    # Saved as the next version of template_id; earlier versions stay as they were
+    definition = template.dict(exclude={"template_id"})
+    errors = scoring.validate_template(definition)
+    if errors:
+        raise HTTPException(status_code=400, detail="; ".join(errors))
+    async with database.transaction():
+        latest = await database.fetch_val(sqlalchemy.select(sqlalchemy.func.max(scoring_templates.c.version)).where(
+            scoring_templates.c.template_id == template.template_id
+        ))
+        version = (latest or 0) + 1
+        await database.execute(scoring_templates.insert().values(
+            template_id=template.template_id, version=version, definition=json.dumps(definition),
+            created_at=datetime.now(timezone.utc).isoformat(),
+        ))
+    return {"template_id": template.template_id, "version": version}
+
+@app.get("/scoring/templates/{template_id}")
+async def get_scoring_template(template_id: str, version: Optional[int] = None):
+    query = scoring_templates.select().where(scoring_templates.c.template_id == template_id)
+    if version is not None:
+        query = query.where(scoring_templates.c.version == version)
+    row = await database.fetch_one(query.order_by(scoring_templates.c.version.desc()).limit(1))
+    if not row:
+        raise HTTPException(status_code=404, detail=f"Scoring template {template_id} not found")
+    return template_response(row)
+
+@app.post("/scoring/templates/{template_id}/rescore")
+async def rescore_template(template_id: str, version: Optional[int] = None, apply: bool = False):
+    # Score every cupping with a template version (the latest by default). Results are
+    # cached per version, so a repeat run only computes cuppings added since. apply=true
+    # also writes the new totals into the scores and rebuilds the statistics.
+    template_key, template = await load_template(template_id, version)
+    started = time.perf_counter()
+    computed = await rescore(template_key, template)
+    summary = await rescore_summary(template_key)
+    if apply:
+        await apply_rescore(template_key)
+    return {
+        "template_id": template_key[0],
+        "version": template_key[1],
+        "computed": computed,
+        **summary,
+        "applied": apply,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+@app.get("/scoring/templates/{template_id}/scores")
+async def get_rescored_scores(
+    request: Request,
+    response: Response,
+    template_id: str,
+    version: Optional[int] = None,
+    roast_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    # Cached rescoring results next to the totals the scores were saved with
+    template_key, _ = await load_template(template_id, version)
+    query = sqlalchemy.select(
+        coffee_scores.c.score_id,
+        coffee_scores.c.roast_id,
+        coffee_scores.c.total_score,
+        coffee_scores.c.template_id,
+        coffee_scores.c.template_version,
+        score_results.c.total_score.label("rescored_total"),
+        score_results.c.defects.label("rescored_defects"),
+    ).select_from(coffee_scores.join(score_results, score_result_match(template_key)))
+    if roast_id:
+        query = query.where(coffee_scores.c.roast_id == roast_id)
+    query = paginate(query, score_results.c.score_id, score_results.c.score_id, "asc", cursor, limit)
+    return await fetch_page(request, query, response, "score_id", "score_id", limit)
+
+@app.post("/cupping-sessions/")
+async def create_cupping_session(session: CuppingSession):
+    # A whole cupping table in one transaction: every sheet is scored with the current
+    # template in one pass, and the calibration statistics are computed and cached
+    # with it
+    if not session.sheets:
+        raise HTTPException(status_code=400, detail="A session needs at least one sheet")
+    session_id = session.session_id or new_id()
+    template_key, template = await load_template(SCORING_TEMPLATE)
+
+    sheets = []
+    seen = set()
+    for sheet in session.sheets:
+        values = sheet.dict()
+        key = (values["cupper"], values["roast_id"])
+        if key in seen:
+            raise HTTPException(status_code=400, detail=(
+                f"{values['cupper']} has more than one sheet for roast {values['roast_id']}; "
+                "all cups of a sample go on one sheet"
+            ))
+        seen.add(key)
+        error = scoring.unknown_defect(values, template)
+        if error:
+            raise HTTPException(status_code=400, detail=f"{values['cupper']}, roast {values['roast_id']}: {error}")
+        values.update(
+            score_id=values["score_id"] or new_id(), date=values["date"] or session.date,
+            session_id=session_id, template_id=None, template_version=None,
+        )
+        sheets.append(values)
+    apply_template_rows(sheets, template_key, template)
+
+    roasts = await roasts_by_id({values["roast_id"] for values in sheets})
+    unknown = sorted({values["roast_id"] for values in sheets} - set(roasts))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown roasts: {', '.join(unknown[:10])}")
+    stats = StatsBatch()
+    for values in sheets:
+        stats.add_score(values, roasts[values["roast_id"]])
+    summary = calibration.calibrate(sheets)
+
+    try:
+        async with database.transaction():
+            exists = await database.fetch_val(sqlalchemy.select(cupping_sessions.c.session_id).where(
+                cupping_sessions.c.session_id == session_id
+            ))
+            if exists:
+                raise HTTPException(status_code=409, detail=f"Cupping session {session_id} already exists")
+            await database.execute(cupping_sessions.insert().values(
+                session_id=session_id, name=session.name, date=session.date, notes=session.notes,
+                cupper_count=summary["cuppers"], sample_count=summary["samples"], sheet_count=len(sheets),
+                created_at=datetime.now(timezone.utc).isoformat(), calibration=json.dumps(summary),
+            ))
+            await database.execute_rows(SCORE_INSERT_SQL, sheets)
+            await bump_table_versions(coffee_scores)
+            await apply_stats(stats)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Saving cupping session {session_id} failed: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Cupping session not saved: {str(e)}")
+    return {"session_id": session_id, "score_ids": [values["score_id"] for values in sheets], "calibration": summary}
+
+SESSION_COLUMNS = [column for column in cupping_sessions.c if column.name != "calibration"]
+
+@app.get("/cupping-sessions/")
+async def get_cupping_sessions(
+    request: Request,
+    response: Response,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    query = sqlalchemy.select(*SESSION_COLUMNS)
+    if date_from:
+        query = query.where(cupping_sessions.c.date >= date_from)
+    if date_to:
+        query = query.where(cupping_sessions.c.date <= date_to)
+    query = paginate(query, cupping_sessions.c.date, cupping_sessions.c.session_id, order, cursor, limit)
+    return await fetch_page(request, query, response, "date", "session_id", limit)
+
+@app.get("/cupping-sessions/{session_id}")
+async def get_cupping_session(session_id: str):
+    session = await database.fetch_one(sqlalchemy.select(*SESSION_COLUMNS).where(
+        cupping_sessions.c.session_id == session_id
+    ))
+    if not session:
+        raise HTTPException(status_code=404, detail="Cupping session not found")
+    sheets = await database.fetch_all(coffee_scores.select().where(
+        coffee_scores.c.session_id == session_id
+    ).order_by(coffee_scores.c.roast_id, coffee_scores.c.cupper))
+    keys = json_keys(coffee_scores.c)
+    content = {**json_row(json_keys(SESSION_COLUMNS), session), "sheets": [json_row(keys, row) for row in sheets]}
+    return Response(
+        content=orjson.dumps(content),
+        media_type="application/json",
+    )
+
+@app.get("/cupping-sessions/{session_id}/calibration")
+async def get_session_calibration(session_id: str):
+    # Per-cupper bias, per-sample consensus, agreement (ICC) and outliers. Served from
+    # the cache on the session row; computed again only after the totals changed.
+    cached = await database.fetch_one(sqlalchemy.select(cupping_sessions.c.calibration).where(
+        cupping_sessions.c.session_id == session_id
+    ))
+    if not cached:
+        raise HTTPException(status_code=404, detail="Cupping session not found")
+    content = cached["calibration"] or await cache_calibration(session_id)
+    return Response(content=content, media_type="application/json")
+
+@app.get("/search")
+async def search_notes(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, description='Words to find; "quoted words" match as a phrase, OR between terms'),
+    kind: Optional[List[str]] = Query(None, description="roast, score and/or green_bean"),
+    limit: int = Query(20, ge=1, le=100),
+):
+    # Ranked matches from the notes of roasts, cupping scores and green beans, with the
+    # matching words wrapped in <mark> in a snippet of the note
+    if SEARCH_BACKEND is None:
+        raise HTTPException(status_code=503, detail="Full-text search is not available on this database")
+    kinds = list(dict.fromkeys(kind or []))
+    unknown = [name for name in kinds if name not in search.SEARCH_SOURCES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown kind: {', '.join(unknown)}")
+    
+    cached = await not_modified(request, response, (coffee_roasts, coffee_scores, green_beans))
+    if cached:
+        return cached
+    
+    if SEARCH_BACKEND == "sqlite":
+        match = search.fts5_match(q)
+        if not match:
+            raise HTTPException(status_code=400, detail="Search query has no searchable words")
+        values = {"query": match, "limit": limit, **{f"kind{i}": name for i, name in enumerate(kinds)}}
+        rows = await reader().fetch_all(search.sqlite_search(kinds), values)
+    else:
+        rows = await reader().fetch_all(search.postgres_search(kinds), {"query": q, "limit": limit})
+    
+    return [
+        {"kind": row["kind"], "id": row["record_id"], "rank": float(row["rank"]), "snippet": row["snippet"]}
+        for row in rows
+    ]
+
+@app.get("/stats/")
+async def get_stats(
+    request: Request,
+    response: Response,
+    group_type: str = Query("coffee", pattern="^(coffee|bean)$"),
+    group_key: Optional[List[str]] = Query(None),
+    metric: Optional[List[str]] = Query(None),
+    percentiles: str = "10,50,90",
+):
+    # One row per coffee (or bean) and metric; cost depends on the number of groups,
+    # not the number of roasts or cuppings
+    try:
+        percentile_values = [float(value) for value in percentiles.split(",") if value.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="percentiles must be comma-separated numbers")
+    if any(not 0 <= value <= 100 for value in percentile_values):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100")
+    
+    cached = await not_modified(request, response, (coffee_roasts, coffee_scores, coffee_stats))
+    if cached:
+        return cached
+    
+    summary_query = coffee_stats.select().where(coffee_stats.c.group_type == group_type)
+    bins_query = coffee_stats_bins.select().where(coffee_stats_bins.c.group_type == group_type)
+    if group_key:
+        summary_query = summary_query.where(coffee_stats.c.group_key.in_(group_key))
+        bins_query = bins_query.where(coffee_stats_bins.c.group_key.in_(group_key))
+    if metric:
+        summary_query = summary_query.where(coffee_stats.c.metric.in_(metric))
+        bins_query = bins_query.where(coffee_stats_bins.c.metric.in_(metric))
+    summary_query = summary_query.order_by(coffee_stats.c.group_key, coffee_stats.c.metric)
+    
+    bins = defaultdict(dict)
+    for row in await reader().fetch_all(bins_query):
+        bins[(row["group_key"], row["metric"])][row["bin"]] = row["count"]
+    return [
+        summarize(row, bins[(row["group_key"], row["metric"])], percentile_values)
+        for row in await reader().fetch_all(summary_query)
+    ]
 
 @app.post("/green-beans/")
 async def create_green_bean(green_bean: GreenBean):
     green_bean_dict = green_bean.dict()
-    green_bean_dict['bean_id'] = str(uuid.uuid4())
+    green_bean_dict['bean_id'] = new_id()
     
     # Set current_stock equal to initial_stock at creation
     if green_bean_dict.get('initial_stock_kg'):
         green_bean_dict['current_stock_kg'] = green_bean_dict['initial_stock_kg']
     
     query = green_beans.insert().values(**green_bean_dict)
-    await database.execute(query)
+    async with database.transaction():
+        await database.execute(query)
+        if green_bean_dict.get('current_stock_kg'):
+            movement = stock_movement(green_bean_dict['bean_id'], green_bean_dict['current_stock_kg'], "purchase",
+                                      unit_cost=green_bean_dict.get('price_per_kg'))
+            await apply_costs([movement])
+            await database.execute(green_bean_stock_movements.insert().values(**movement))
+        await bump_table_versions(green_beans, green_bean_stock_movements)
     return {"bean_id": green_bean_dict['bean_id']}
 
+@app.post("/green-beans/bulk")
+async def create_green_beans_bulk(request: Request):
+    purchases = []
+    
+    def set_current_stock(values):
+        # Set current_stock equal to initial_stock at creation, as in create_green_bean
+        if values.get('initial_stock_kg'):
+            values['current_stock_kg'] = values['initial_stock_kg']
+        if values.get('current_stock_kg'):
+            purchases.append(stock_movement(values['bean_id'], values['current_stock_kg'], "purchase",
+                                            unit_cost=values.get('price_per_kg')))
+    
+    async def record_purchases():
+        if purchases:
+            await apply_costs(purchases)
+        for start in range(0, len(purchases), BULK_CHUNK_SIZE):
+            await database.execute_many(
+                green_bean_stock_movements.insert(), purchases[start:start + BULK_CHUNK_SIZE]
+            )
+        if purchases:
+            await bump_table_versions(green_bean_stock_movements)
+    
+    return await bulk_insert(request, GreenBean, green_beans, "bean_id",
+                             on_row=set_current_stock, after_insert=record_purchases)
+
 @app.get("/green-beans/")
-async def get_green_beans():
-    query = green_beans.select()
-    return await database.fetch_all(query)
+async def get_green_beans(
+    request: Request,
+    response: Response,
+    name: Optional[List[str]] = Query(None),
+    origin: Optional[List[str]] = Query(None),
+):
+    cached = await not_modified(request, response, (green_beans,))
+    if cached:
+        return cached
+    
+    query = filter_green_beans(green_beans.select(), name, origin)
+    if json_mode(request) == "fast" and columnar.negotiate(request.headers.get("accept")) == columnar.JSON_TYPE:
+        # Not paged, so rows are streamed to the client instead of fetched first
+        return StreamingResponse(
+            stream_json_rows(request, query), media_type=columnar.JSON_TYPE, headers=dict(response.headers)
+        )
+    rows = await reader().fetch_all(query)
+    return list_response(request, response, rows, query.selected_columns)
+
+@app.get("/green-beans/export")
+async def export_green_beans(
+    name: Optional[List[str]] = Query(None),
+    origin: Optional[List[str]] = Query(None),
+    fields: Optional[str] = None,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = False,
+):
+    columns = select_fields(green_beans.c, fields, ())
+    query = filter_green_beans(sqlalchemy.select(*columns), name, origin)
+    query = query.order_by(green_beans.c.name, green_beans.c.bean_id)
+    return export_response(query, columns, format, gzip, "green_bean_inventory")
 
 @app.get("/green-beans/{bean_id}")
 async def get_green_bean(bean_id: str):
@@ -182,22 +1712,56 @@ async def get_green_bean(bean_id: str):
         return result
     raise HTTPException(status_code=404, detail="Green bean not found")
 
+@app.get("/green-beans/{bean_id}/movements")
+async def get_bean_stock_movements(bean_id: str):
+    query = green_bean_stock_movements.select().where(
+        green_bean_stock_movements.c.bean_id == bean_id
+    ).order_by(green_bean_stock_movements.c.created_at.desc())
+    return await database.fetch_all(query)
+
 @app.put("/green-beans/{bean_id}/update-stock")
-async def update_bean_stock(bean_id: str, amount_used: float):
-    # First get current stock
-    select_query = green_beans.select().where(green_beans.c.bean_id == bean_id)
-    bean = await database.fetch_one(select_query)
-    
-    if not bean:
-        raise HTTPException(status_code=404, detail="Green bean not found")
-    
-    # Calculate new stock and update
-    current_stock = bean["current_stock_kg"]
-    new_stock = max(0, current_stock - amount_used)  # Prevent negative stock
-    
-    update_query = green_beans.update().where(
-        green_beans.c.bean_id == bean_id
-    ).values(current_stock_kg=new_stock)
-    
-    await database.execute(update_query)
-    return {"bean_id": bean_id, "new_stock_kg": new_stock} 
\ No newline at end of file
+async def update_bean_stock(
+    bean_id: str,
+    amount_used: float,
+    unit_cost: Optional[float] = Query(None, ge=0, description="Price per kg of stock added back (negative amount_used); defaults to the bean's price"),
+):
+    # Manual adjustment; a negative amount adds stock back, as a new cost layer
+    movement = stock_movement(bean_id, -amount_used, "adjustment", unit_cost=unit_cost if amount_used < 0 else None)
+    new_stock = await write_queue.submit(lambda: apply_stock_change(bean_id, -amount_used, [movement]))
+    return {"bean_id": bean_id, "new_stock_kg": new_stock, "cost": movement["cost"]}
+
+@app.get("/green-beans/{bean_id}/valuation")
+async def get_bean_valuation(bean_id: str):
+    # Read from the bean's cost layers; no ledger replay
+    row = await database.fetch_one(green_bean_costs.select().where(green_bean_costs.c.bean_id == bean_id))
+    if not row:
+        exists = await database.fetch_one(sqlalchemy.select(green_beans.c.bean_id).where(green_beans.c.bean_id == bean_id))
+        if not exists:
+            raise HTTPException(status_code=404, detail="Green bean not found")
+        return {"bean_id": bean_id, "method": costing.DEFAULT_METHOD, "quantity_kg": 0.0, "value": 0.0,
+                "unit_cost": None, "layers": []}
+    layers = json.loads(row["layers"])
+    return {
+        "bean_id": bean_id,
+        "method": row["method"],
+        "quantity_kg": row["quantity_kg"],
+        "value": row["value"],
+        "unit_cost": row["value"] / row["quantity_kg"] if row["quantity_kg"] > costing.EPSILON_KG else None,
+        "layers": [{"quantity_kg": quantity, "unit_cost": unit_cost} for quantity, unit_cost in layers],
+    }
+
+@app.get("/inventory/valuation")
+async def get_inventory_valuation():
+    # Green coffee on hand and its value per costing method, summed over one row per bean
+    query = sqlalchemy.select(
+        green_bean_costs.c.method,
+        sqlalchemy.func.count().label("beans"),
+        sqlalchemy.func.sum(green_bean_costs.c.quantity_kg).label("quantity_kg"),
+        sqlalchemy.func.sum(green_bean_costs.c.value).label("value"),
+    ).group_by(green_bean_costs.c.method).order_by(green_bean_costs.c.method)
+    methods = [dict(row._mapping) for row in await database.fetch_all(query)]
+    return {
+        "quantity_kg": sum(method["quantity_kg"] or 0.0 for method in methods),
+        "value": sum(method["value"] or 0.0 for method in methods),
+        "methods": methods,
+    }
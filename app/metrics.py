@@ -0,0 +1,140 @@
+import os
+import re
+import time
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+# With several worker processes, set PROMETHEUS_MULTIPROC_DIR to a shared, empty
+# directory so /metrics adds up every worker instead of reporting whichever one answered
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+ROW_BUCKETS = (0, 1, 10, 25, 50, 100, 250, 500, 1000, 5000)
+UNMATCHED_ROUTE = "<unmatched>"
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time to serve a request, by route template and status",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests being served", multiprocess_mode="livesum",
+)
+REQUEST_SIZE = Histogram(
+    "http_request_size_bytes", "Request body size (from Content-Length)",
+    ["method", "route"], buckets=SIZE_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "Response body size as sent",
+    ["method", "route"], buckets=SIZE_BUCKETS,
+)
+QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Database statement time, by main table and operation",
+    ["table", "operation"], buckets=QUERY_BUCKETS,
+)
+QUERY_ERRORS = Counter(
+    "db_query_errors", "Failed database statements, by main table and operation", ["table", "operation"],
+)
+LIST_ROWS = Histogram(
+    "list_rows_returned", "Rows returned per list call", ["route"], buckets=ROW_BUCKETS,
+)
+
+# labels() takes a lock and builds a key on every call; children are reused instead
+children = {}
+
+def child(metric, *labels):
+    key = (metric, labels)
+    found = children.get(key)
+    if found is None:
+        found = children[key] = metric.labels(*labels)
+    return found
+
+def route_path(scope):
+    # The route template (/roasts/{roast_id}/curve), never the raw path, to keep label
+    # cardinality bounded
+    route = scope.get("route")
+    return route.path if route is not None else UNMATCHED_ROUTE
+
+class MetricsMiddleware:
+    # Plain ASGI rather than BaseHTTPMiddleware, which runs every request in an extra
+    # task and buffers streaming responses
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+        sent = 0
+
+        async def send_and_measure(message):
+            nonlocal status, sent
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_and_measure)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            method = scope["method"]
+            route = route_path(scope)
+            child(REQUEST_DURATION, method, route, status).observe(time.perf_counter() - started)
+            child(RESPONSE_SIZE, method, route).observe(sent)
+            for name, value in scope["headers"]:
+                if name == b"content-length":
+                    child(REQUEST_SIZE, method, route).observe(int(value))
+                    break
+
+def observe_rows(request, count):
+    child(LIST_ROWS, route_path(request.scope)).observe(count)
+
+SQL_TARGET = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+\"?(\w+)", re.IGNORECASE)
+MAX_STATEMENT_LABELS = 1000
+statement_labels = {}
+
+def query_labels(sql):
+    # (table, operation) for a normalized statement, e.g. ("coffee_roasts", "select")
+    labels = statement_labels.get(sql)
+    if labels is None:
+        words = sql.split(None, 1)
+        operation = words[0].lower() if words else "unknown"
+        if operation == "with":
+            operation = "select"
+        target = SQL_TARGET.search(sql)
+        labels = (target.group(1).lower() if target else "none", operation)
+        if len(statement_labels) < MAX_STATEMENT_LABELS:
+            statement_labels[sql] = labels
+    return labels
+
+def observe_query(sql, seconds, failed):
+    table, operation = query_labels(sql)
+    child(QUERY_DURATION, table, operation).observe(seconds)
+    if failed:
+        child(QUERY_ERRORS, table, operation).inc()
+
+def instrument_database(database, pool="db_pool"):
+    # pool prefixes the gauge names, e.g. db_read_pool for the replica's pool
+    database.query_listeners.append(observe_query)
+    if not MULTIPROCESS:
+        # Read from the pool at scrape time; per-process values mean nothing once summed
+        Gauge(f"{pool}_connections_in_use", "Connections held from the pool").set_function(
+            lambda: database.stats.in_use
+        )
+        Gauge(f"{pool}_requests_waiting", "Callers waiting for a pool connection").set_function(
+            lambda: database.stats.waiting
+        )
+
+def render():
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
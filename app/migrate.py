@@ -0,0 +1,16 @@
+import logging
+from .db import DATABASE_URL
+from .migrations import LATEST_VERSION, migrate
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Apply pending schema migrations, e.g. as a release step before starting the workers
+# with MIGRATE_ON_STARTUP=false:
+#     python -m app.migrate
+if __name__ == "__main__":
+    applied = migrate(DATABASE_URL)
+    if applied:
+        logger.info(f"Applied migrations {applied}; schema is at version {LATEST_VERSION}")
+    else:
+        logger.info(f"Schema is up to date at version {LATEST_VERSION}")
@@ -0,0 +1,169 @@
+import json
+import logging
+import time
+from datetime import datetime, timezone
+import sqlalchemy
+from . import costing, scoring, search
+from .db import (
+    DATABASE_URL, database, metadata, uses_sqlite_profile, schema_migrations, table_versions, VERSIONED_TABLES,
+    coffee_roasts, coffee_scores, cupping_sessions, green_bean_costs, green_bean_stock_movements, scoring_templates, score_results,
+)
+
+logger = logging.getLogger(__name__)
+
+# Key of the Postgres advisory lock held while migrating, so that when several workers
+# or replicas start together only one of them changes the schema
+MIGRATION_LOCK_KEY = 7_316_247_150_561
+# Seconds a SQLite process waits for another one's migration to finish
+SQLITE_LOCK_TIMEOUT_S = 60
+
+def create_base_schema(connection):
+    # Databases from before versioned migrations were built with create_all, so this
+    # is idempotent and only fills in what is missing
+    metadata.create_all(connection, checkfirst=True)
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+def add_opening_balances(connection):
+    # Beans created before the stock ledger existed get an opening balance entry
+    connection.execute(sqlalchemy.text("""
+        INSERT INTO green_bean_stock_movements (movement_id, bean_id, change_kg, reason, created_at)
+        SELECT 'opening-' || bean_id, bean_id, current_stock_kg, 'opening_balance', :now
+        FROM green_beans
+        WHERE current_stock_kg IS NOT NULL
+          AND NOT EXISTS (
+            SELECT 1 FROM green_bean_stock_movements m WHERE m.bean_id = green_beans.bean_id
+          )
+    """), {"now": datetime.now(timezone.utc).isoformat()})
+
+def seed_table_versions(connection):
+    existing = {row[0] for row in connection.execute(sqlalchemy.select(table_versions.c.table_name))}
+    for table in VERSIONED_TABLES:
+        if table.name not in existing:
+            connection.execute(table_versions.insert().values(
+                table_name=table.name, version=0, updated_at=datetime.now(timezone.utc).isoformat()
+            ))
+
+def create_notes_search_index(connection):
+    if connection.dialect.name == "postgresql":
+        for statement in search.postgres_indexes():
+            connection.execute(sqlalchemy.text(statement))
+        return
+    if connection.dialect.name != "sqlite":
+        return
+    exists = connection.execute(
+        sqlalchemy.text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": search.FTS5_TABLE}
+    ).first()
+    if exists:
+        return
+    try:
+        with connection.begin_nested():
+            connection.execute(sqlalchemy.text(search.FTS5_CREATE))
+            for statement in search.fts5_backfill() + search.fts5_triggers():
+                connection.execute(sqlalchemy.text(statement))
+    except sqlalchemy.exc.OperationalError as e:
+        # SQLite built without FTS5: /search stays unavailable, everything else works
+        logger.warning(f"Skipping the notes search index: {str(e)}")
+
+def add_missing_columns(connection, table, names):
+    # Databases migrated to version 1 before a column existed lack it
+    existing = {column["name"] for column in sqlalchemy.inspect(connection).get_columns(table.name)}
+    for name in names:
+        if name not in existing:
+            type_name = table.c[name].type.compile(dialect=connection.dialect)
+            connection.execute(sqlalchemy.text(f"ALTER TABLE {table.name} ADD COLUMN {name} {type_name}"))
+
+def add_scoring_templates(connection):
+    scoring_templates.create(connection, checkfirst=True)
+    score_results.create(connection, checkfirst=True)
+    add_missing_columns(connection, coffee_scores, ("defect_cups", "defect_type", "template_id", "template_version"))
+    exists = connection.execute(sqlalchemy.select(scoring_templates.c.version).where(
+        scoring_templates.c.template_id == scoring.DEFAULT_TEMPLATE_ID
+    )).first()
+    if not exists:
+        connection.execute(scoring_templates.insert().values(
+            template_id=scoring.DEFAULT_TEMPLATE_ID, version=1, definition=json.dumps(scoring.DEFAULT_TEMPLATE),
+            created_at=datetime.now(timezone.utc).isoformat(),
+        ))
+
+def add_cost_layers(connection):
+    # Builds the cost layers of existing beans by replaying their ledger
+    green_bean_costs.create(connection, checkfirst=True)
+    add_missing_columns(connection, coffee_roasts, ("green_cost",))
+    add_missing_columns(connection, green_bean_stock_movements, ("unit_cost", "cost", "sequence"))
+    report = costing.rebuild(connection)
+    logger.info(f"Costed {report['movements']} stock movements for {report['beans']} green beans")
+
+def add_cupping_sessions(connection):
+    cupping_sessions.create(connection, checkfirst=True)
+    add_missing_columns(connection, coffee_scores, ("cupper", "session_id"))
+    for index in cupping_sessions.indexes | coffee_scores.indexes:
+        index.create(connection, checkfirst=True)
+
+# Applied in order, once per database. Never edit or reorder an applied migration;
+# add a new one at the end.
+MIGRATIONS = [
+    (1, "Base schema and indexes", create_base_schema),
+    (2, "Opening balances in the stock ledger", add_opening_balances),
+    (3, "Table versions for ETags", seed_table_versions),
+    (4, "Full-text index over notes", create_notes_search_index),
+    (5, "Scoring templates", add_scoring_templates),
+    (6, "Green bean cost layers", add_cost_layers),
+    (7, "Cupping sessions", add_cupping_sessions),
+    (8, "Table version for the statistics", seed_table_versions),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def migration_engine(url):
+    if not url.startswith("sqlite"):
+        return sqlalchemy.create_engine(url)
+    engine = sqlalchemy.create_engine(url, connect_args={"timeout": SQLITE_LOCK_TIMEOUT_S})
+
+    # SQLite has no advisory locks; BEGIN IMMEDIATE takes the database write lock up
+    # front instead, so a second process waits here rather than failing mid-migration
+    @sqlalchemy.event.listens_for(engine, "connect")
+    def disable_implicit_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        if uses_sqlite_profile(url):
+            # journal_mode sticks to the file, so init_db.py leaves it ready for the profile
+            dbapi_connection.execute("PRAGMA journal_mode = WAL")
+
+    @sqlalchemy.event.listens_for(engine, "begin")
+    def begin_immediate(connection):
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return engine
+
+def migrate(url=DATABASE_URL):
+    """Apply pending migrations, holding a database-wide lock. Returns the versions applied."""
+    engine = migration_engine(url)
+    applied = []
+    try:
+        with engine.connect() as connection, connection.begin():
+            if connection.dialect.name == "postgresql":
+                connection.execute(sqlalchemy.text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            # Checked again under the lock: another process may have just migrated
+            schema_migrations.create(connection, checkfirst=True)
+            done = {row[0] for row in connection.execute(sqlalchemy.select(schema_migrations.c.version))}
+            for version, description, apply in MIGRATIONS:
+                if version in done:
+                    continue
+                started = time.perf_counter()
+                apply(connection)
+                connection.execute(schema_migrations.insert().values(
+                    version=version, description=description, applied_at=datetime.now(timezone.utc).isoformat()
+                ))
+                applied.append(version)
+                logger.info(f"Applied migration {version}: {description} "
+                            f"({(time.perf_counter() - started) * 1000:.0f} ms)")
+    finally:
+        engine.dispose()
+    return applied
+
+async def schema_version():
+    # Highest applied migration, read over the app's own connection; None before the first
+    try:
+        return await database.fetch_val(sqlalchemy.select(sqlalchemy.func.max(schema_migrations.c.version)))
+    except Exception:
+        return None
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, List, Optional
 
 class GreenBean(BaseModel):
     bean_id: Optional[str] = None
@@ -42,6 +42,39 @@ class CoffeeScore(BaseModel):
     clean_cup: Optional[float] = None
     sweetness: Optional[float] = None
     overall: Optional[float] = None
-    defects: Optional[int] = None
-    total_score: Optional[float] = None
-    notes: Optional[str] = None 
\ No newline at end of file
+    defects: Optional[int] = None  # Points; computed from defect_cups when given
+    defect_cups: Optional[int] = None
+    defect_type: Optional[str] = None  # e.g. "taint" or "fault", see the scoring template
+    total_score: Optional[float] = None  # Computed by the server when attributes are given
+    notes: Optional[str] = None 
+    cupper: Optional[str] = None
+
+class CuppingSheet(CoffeeScore):
+    cupper: str  # One sheet per cupper and sample (roast_id) in a session
+
+class CuppingSession(BaseModel):
+    session_id: Optional[str] = None
+    name: Optional[str] = None
+    date: Optional[str] = None  # Also the date of sheets that have none
+    notes: Optional[str] = None
+    sheets: List[CuppingSheet]
+
+class BurnerEvent(BaseModel):
+    time_s: float  # Seconds from charge
+    value: float  # Burner setting, e.g. percent of max gas or power
+
+class RoastCurve(BaseModel):
+    sample_rate_hz: float  # Bean and environment temps are sampled at this fixed rate
+    bean_temp: List[float]
+    env_temp: Optional[List[float]] = None  # Same length as bean_temp when present
+    burner_events: List[BurnerEvent] = []
+
+class ScoringTemplate(BaseModel):
+    template_id: str
+    description: Optional[str] = None
+    weights: Dict[str, float]  # Attribute name -> weight; attributes left out count 0
+    defect_intensity: Dict[str, int] = {"taint": 2, "fault": 4}  # Points per defective cup
+    offset: float = 0.0
+    multiplier: float = 1.0  # total = offset + multiplier * weighted sum - defect points
+    min_score: Optional[float] = None
+    max_score: Optional[float] = None
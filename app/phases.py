@@ -0,0 +1,132 @@
+import numpy as np
+
+# Curves are resampled to a common rate and stacked into one matrix, one row per roast,
+# so every metric below is computed for all roasts at once
+ENGINE_RATE_HZ = 1
+# Trailing moving average applied to bean temp before RoR and turning point detection
+SMOOTHING_S = 10
+# Rate of rise is the smoothed temperature change over this window, in degrees per minute
+ROR_WINDOW_S = 30
+# The turning point is the bean temp minimum within this many seconds of charge
+TURNING_POINT_SEARCH_S = 240
+# Phase boundaries detected from bean temp crossings after the turning point
+DRY_END_TEMP = 150.0
+FIRST_CRACK_TEMP = 196.0
+
+METRICS = (
+    "turning_point_s",
+    "turning_point_temp",
+    "dry_end_s",
+    "first_crack_s",
+    "development_time_s",
+    "total_time_s",
+    "dtr_ratio",
+    "max_ror",
+)
+
+def resample(values, sample_rate_hz):
+    values = np.asarray(values, dtype=float)
+    step = sample_rate_hz / ENGINE_RATE_HZ
+    if step >= 1 and float(step).is_integer():
+        # Block means: cheap, and they also average out sensor noise
+        step = int(step)
+        usable = len(values) // step * step
+        if not usable:
+            return values[:1]
+        return values[:usable].reshape(-1, step).mean(axis=1)
+    times = np.arange(len(values)) / sample_rate_hz
+    grid = np.arange(0, times[-1] + 1e-9, 1 / ENGINE_RATE_HZ)
+    return np.interp(grid, times, values)
+
+def stack(series):
+    # Pad rows to a common length with NaN
+    lengths = np.array([len(row) for row in series])
+    matrix = np.full((len(series), lengths.max(initial=1)), np.nan)
+    for i, row in enumerate(series):
+        matrix[i, :len(row)] = row
+    return matrix, lengths
+
+def trailing_mean(matrix, window):
+    # NaN-aware trailing moving average along each row
+    valid = ~np.isnan(matrix)
+    sums = np.cumsum(np.where(valid, matrix, 0.0), axis=1)
+    counts = np.cumsum(valid, axis=1)
+    sums[:, window:] = sums[:, window:] - sums[:, :-window]
+    counts[:, window:] = counts[:, window:] - counts[:, :-window]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = sums / counts
+    mean[~valid] = np.nan
+    return mean
+
+def first_index(mask):
+    # Index of the first True in each row, -1 when there is none
+    return np.where(mask.any(axis=1), mask.argmax(axis=1), -1)
+
+def analyze(bean_temps, sample_rates):
+    """Detect phases for many roasts in one pass.
+
+    Returns a dict of per-roast arrays keyed by METRICS (NaN where a phase was not
+    reached) plus the rate-of-rise matrix under "ror", sampled at ENGINE_RATE_HZ.
+    """
+    durations = np.array([len(bt) / rate for bt, rate in zip(bean_temps, sample_rates)])
+    bt, lengths = stack([resample(values, rate) for values, rate in zip(bean_temps, sample_rates)])
+    rows = np.arange(len(bt))
+    times = np.arange(bt.shape[1]) / ENGINE_RATE_HZ
+
+    smooth = trailing_mean(bt, max(1, SMOOTHING_S * ENGINE_RATE_HZ))
+    window = ROR_WINDOW_S * ENGINE_RATE_HZ
+    ror = np.full_like(smooth, np.nan)
+    ror[:, window:] = (smooth[:, window:] - smooth[:, :-window]) * 60 / ROR_WINDOW_S
+
+    search = np.where(np.isnan(smooth), np.inf, smooth)[:, :TURNING_POINT_SEARCH_S * ENGINE_RATE_HZ]
+    tp_index = search.argmin(axis=1)
+    tp_found = np.isfinite(search[rows, tp_index])
+    turning_point_s = np.where(tp_found, times[tp_index], np.nan)
+    turning_point_temp = np.where(tp_found, bt[rows, tp_index], np.nan)
+
+    after_tp = times[None, :] > np.where(tp_found, turning_point_s, np.inf)[:, None]
+    with np.errstate(invalid="ignore"):
+        dry_end_index = first_index(after_tp & (bt >= DRY_END_TEMP))
+        first_crack_index = first_index(after_tp & (bt >= FIRST_CRACK_TEMP))
+    dry_end_s = np.where(dry_end_index >= 0, times[dry_end_index], np.nan)
+    first_crack_s = np.where(first_crack_index >= 0, times[first_crack_index], np.nan)
+
+    development_time_s = durations - first_crack_s
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dtr_ratio = development_time_s / durations
+    ror_after_tp = np.where(after_tp & ~np.isnan(ror), ror, -np.inf)
+    max_ror = ror_after_tp.max(axis=1)
+    max_ror[np.isinf(max_ror)] = np.nan
+
+    return {
+        "turning_point_s": turning_point_s,
+        "turning_point_temp": turning_point_temp,
+        "dry_end_s": dry_end_s,
+        "first_crack_s": first_crack_s,
+        "development_time_s": development_time_s,
+        "total_time_s": durations,
+        "dtr_ratio": dtr_ratio,
+        "max_ror": max_ror,
+        "ror": ror,
+        "lengths": lengths,
+    }
+
+def metrics_rows(results):
+    # One dict per roast with NaN turned into None, ready to store
+    return [
+        {
+            name: (None if np.isnan(results[name][i]) else round(float(results[name][i]), 4))
+            for name in METRICS
+        }
+        for i in range(len(results["total_time_s"]))
+    ]
+
+def roast_columns(metrics):
+    # Roast fields (minutes) derived from one metrics row; None until first crack is found
+    if metrics["first_crack_s"] is None:
+        return None
+    return {
+        "development_time": round(metrics["development_time_s"] / 60, 2),
+        "total_time": round(metrics["total_time_s"] / 60, 2),
+        "dtr_ratio": metrics["dtr_ratio"],
+    }
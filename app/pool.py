@@ -0,0 +1,368 @@
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+import databases
+from databases.backends.sqlite import SQLiteBackend, SQLiteConnection, SQLiteTransaction
+from databases.core import Connection, Transaction
+
+logger = logging.getLogger(__name__)
+
+# Percentiles are over the most recent samples; counts and maxima cover all time
+SAMPLE_SIZE = 2048
+# Distinct statements tracked; anything beyond is counted under OTHER_QUERIES
+MAX_TRACKED_QUERIES = 500
+OTHER_QUERIES = "<other statements>"
+
+SQL_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SQL_VALUE_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+SQL_SPACE = re.compile(r"\s+")
+BIND_PARAM = re.compile(r"(?<!:):(\w+)")
+
+def normalize_sql(sql):
+    # Same statement, different literals -> same key
+    sql = SQL_LITERAL.sub("?", sql)
+    sql = SQL_VALUE_LIST.sub("?, ...", sql)
+    return SQL_SPACE.sub(" ", sql).strip()
+
+def summarize_ms(samples, maximum):
+    if not samples:
+        return {"mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+    return {
+        "mean": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99),
+        "max": round(maximum * 1000, 3),
+    }
+
+def driver_statement(sql, dialect):
+    # Text with :name parameters -> the driver's own placeholders (? for sqlite3, $n for
+    # asyncpg) and the parameter names in placeholder order
+    names = []
+    def placeholder(match):
+        names.append(match.group(1))
+        return "?" if dialect == "sqlite" else f"${len(names)}"
+    return BIND_PARAM.sub(placeholder, sql), names
+
+class PoolTimeoutError(Exception):
+    pass
+
+class PoolStats:
+    def __init__(self, slow_query_s=None):
+        self.slow_query_s = slow_query_s
+        # Gauges, never reset
+        self.in_use = 0
+        self.waiting = 0
+        self.reset()
+
+    def reset(self):
+        self.since = time.time()
+        self.peak_in_use = self.in_use
+        self.peak_waiting = self.waiting
+        self.acquires = 0
+        self.acquire_timeouts = 0
+        self.acquire_waits = deque(maxlen=SAMPLE_SIZE)
+        self.acquire_wait_max = 0.0
+        self.queries = 0
+        self.query_errors = 0
+        self.query_times = deque(maxlen=SAMPLE_SIZE)
+        self.query_time_max = 0.0
+        # normalized SQL -> [count, errors, total seconds, max seconds]
+        self.statements = {}
+
+    def record_acquire(self, seconds):
+        self.acquires += 1
+        self.acquire_waits.append(seconds)
+        self.acquire_wait_max = max(self.acquire_wait_max, seconds)
+
+    def record_query(self, sql, seconds, failed=False):
+        self.queries += 1
+        self.query_errors += failed
+        self.query_times.append(seconds)
+        self.query_time_max = max(self.query_time_max, seconds)
+        if sql is None:
+            return
+        if sql not in self.statements and len(self.statements) >= MAX_TRACKED_QUERIES:
+            sql = OTHER_QUERIES
+        entry = self.statements.setdefault(sql, [0, 0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += failed
+        entry[2] += seconds
+        entry[3] = max(entry[3], seconds)
+        if self.slow_query_s is not None and seconds >= self.slow_query_s:
+            logger.warning(f"Slow query ({seconds * 1000:.0f} ms): {sql}")
+
+    def slowest(self, top=10, sort="mean"):
+        rows = [
+            {
+                "sql": sql,
+                "count": count,
+                "errors": errors,
+                "mean_ms": round(total / count * 1000, 3),
+                "max_ms": round(maximum * 1000, 3),
+                "total_ms": round(total * 1000, 3),
+            }
+            for sql, (count, errors, total, maximum) in self.statements.items()
+        ]
+        key = {"mean": "mean_ms", "max": "max_ms", "total": "total_ms", "count": "count"}[sort]
+        return sorted(rows, key=lambda row: row[key], reverse=True)[:top]
+
+class ReleasingTransaction(Transaction):
+    # databases.Transaction.start keeps the connection it acquired when BEGIN fails, and
+    # a SQLite connection left open keeps its thread, and so the process, alive
+
+    async def start(self):
+        connection = self._connection
+        self._transaction = connection._connection.transaction()
+        async with connection._transaction_lock:
+            is_root = not connection._transaction_stack
+            await connection.__aenter__()
+            try:
+                await self._transaction.start(is_root=is_root, extra_options=self._extra_options)
+            except BaseException:
+                await connection.__aexit__()
+                raise
+            connection._transaction_stack.append(self)
+        return self
+
+class InstrumentedConnection(Connection):
+    # Times pool acquisition separately from the queries run on the connection, so
+    # "waiting for a connection" and "the database is slow" show up as different numbers
+
+    async def __aenter__(self):
+        if self._connection_counter:
+            # Nested use (e.g. a query inside a transaction) reuses the held connection
+            return await super().__aenter__()
+        database = self._database
+        stats = database.stats
+        stats.waiting += 1
+        stats.peak_waiting = max(stats.peak_waiting, stats.waiting)
+        started = time.perf_counter()
+        try:
+            if database.acquire_timeout:
+                await asyncio.wait_for(super().__aenter__(), database.acquire_timeout)
+            else:
+                await super().__aenter__()
+        except asyncio.TimeoutError:
+            stats.acquire_timeouts += 1
+            raise PoolTimeoutError(
+                f"No database connection available within {database.acquire_timeout:g} s"
+            )
+        finally:
+            stats.waiting -= 1
+        stats.record_acquire(time.perf_counter() - started)
+        stats.in_use += 1
+        stats.peak_in_use = max(stats.peak_in_use, stats.in_use)
+        return self
+
+    async def __aexit__(self, *args):
+        await super().__aexit__(*args)
+        if not self._connection_counter:
+            self._database.stats.in_use -= 1
+
+    def transaction(self, *, force_rollback=False, **kwargs):
+        return ReleasingTransaction(lambda: self, force_rollback, **kwargs)
+
+    async def _timed(self, query, call):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = await call
+            failed = False
+            return result
+        finally:
+            self._database.record_query(query, time.perf_counter() - started, failed)
+
+    async def fetch_all(self, query, values=None):
+        return await self._timed(query, super().fetch_all(query, values))
+
+    async def fetch_one(self, query, values=None):
+        return await self._timed(query, super().fetch_one(query, values))
+
+    async def fetch_val(self, query, values=None, column=0):
+        return await self._timed(query, super().fetch_val(query, values, column=column))
+
+    async def execute(self, query, values=None):
+        return await self._timed(query, super().execute(query, values))
+
+    async def execute_many(self, query, values):
+        return await self._timed(query, super().execute_many(query, values))
+
+    async def execute_rows(self, sql, rows):
+        # execute_many compiles and runs the statement once per row; this hands every row
+        # to the driver's executemany in one call instead. sql is text with :name parameters.
+        statement, names = driver_statement(sql, self._database.url.dialect)
+        values = [tuple(row[name] for name in names) for row in rows]
+        async with self:
+            return await self._timed(sql, self.raw_connection.executemany(statement, values))
+
+    async def iterate(self, query, values=None):
+        # Only time spent fetching rows counts, not the consumer's work between rows
+        rows = super().iterate(query, values)
+        elapsed = 0.0
+        failed = True
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    row = await rows.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - started
+                yield row
+            failed = False
+        finally:
+            await rows.aclose()
+            self._database.record_query(query, elapsed, failed)
+
+class ImmediateSQLiteTransaction(SQLiteTransaction):
+    # A deferred BEGIN takes the write lock at the first write. When a transaction that
+    # has read already (the FTS5 note triggers read their index before writing it) finds
+    # the lock held, SQLite fails at once instead of waiting out the busy timeout, so
+    # concurrent writes error with "database is locked". BEGIN IMMEDIATE takes the lock
+    # up front. Writers in this process queue on an asyncio lock first, so the busy
+    # timeout only covers other processes however many requests are waiting here.
+
+    def __init__(self, connection, write_lock):
+        super().__init__(connection)
+        self._write_lock = write_lock
+
+    async def start(self, is_root, extra_options):
+        if not is_root:
+            return await super().start(is_root, extra_options)
+        self._is_root = True
+        await self._write_lock.acquire()
+        try:
+            async with self._connection._connection.execute("BEGIN IMMEDIATE") as cursor:
+                await cursor.close()
+        except BaseException:
+            self._write_lock.release()
+            raise
+
+    async def commit(self):
+        try:
+            await super().commit()
+        finally:
+            if self._is_root:
+                self._write_lock.release()
+
+    async def rollback(self):
+        try:
+            await super().rollback()
+        finally:
+            if self._is_root:
+                self._write_lock.release()
+
+class ImmediateSQLiteConnection(SQLiteConnection):
+    def __init__(self, pool, dialect, backend):
+        super().__init__(pool, dialect)
+        self._backend = backend
+
+    def transaction(self):
+        return ImmediateSQLiteTransaction(self, self._backend.write_lock())
+
+class ImmediateSQLiteBackend(SQLiteBackend):
+    _write_lock = None
+
+    def write_lock(self):
+        # Made on first use, inside the running event loop
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        return self._write_lock
+
+    def connection(self):
+        return ImmediateSQLiteConnection(self._pool, self._dialect, self)
+
+class InstrumentedDatabase(databases.Database):
+    def __init__(self, url, acquire_timeout=None, query_stats=True, slow_query_s=None, **options):
+        super().__init__(url, **options)
+        if self.url.dialect == "sqlite":
+            self._backend = ImmediateSQLiteBackend(self.url, **self.options)
+        self.acquire_timeout = acquire_timeout
+        self.query_stats = query_stats
+        self.stats = PoolStats(slow_query_s)
+        # Called with (normalized SQL, seconds, failed) after every statement
+        self.query_listeners = []
+        self._statement_keys = {}
+
+    def connection(self):
+        # Same as databases.Database.connection, with the instrumented class
+        if self._global_connection is not None:
+            return self._global_connection
+        if not self._connection:
+            self._connection = InstrumentedConnection(self, self._backend)
+        return self._connection
+
+    def transaction(self, *, force_rollback=False, **kwargs):
+        return ReleasingTransaction(self.connection, force_rollback, **kwargs)
+
+    async def disconnect(self):
+        await super().disconnect()
+        # Pools that keep SQLite connections open (see app/sqlitepool.py) close them here;
+        # asyncpg's is already gone
+        pool = getattr(self._backend, "_pool", None)
+        if hasattr(pool, "close"):
+            await pool.close()
+
+    async def execute_rows(self, sql, rows):
+        async with self.connection() as connection:
+            return await connection.execute_rows(sql, rows)
+
+    def statement_key(self, query):
+        if isinstance(query, str):
+            return normalize_sql(query)
+        # Compiling costs as much as running a small query, so statements are compiled
+        # once per SQLAlchemy cache key rather than on every call
+        cache_key = query._generate_cache_key()
+        if cache_key is None:
+            return normalize_sql(str(query))
+        sql = self._statement_keys.get(cache_key.key)
+        if sql is None:
+            sql = normalize_sql(str(query))
+            if len(self._statement_keys) < MAX_TRACKED_QUERIES:
+                self._statement_keys[cache_key.key] = sql
+        return sql
+
+    def record_query(self, query, seconds, failed=False):
+        sql = self.statement_key(query) if self.query_stats or self.query_listeners else None
+        self.stats.record_query(sql if self.query_stats else None, seconds, failed)
+        for listener in self.query_listeners:
+            listener(sql, seconds, failed)
+
+    def pool_status(self):
+        stats = self.stats
+        status = {
+            "in_use": stats.in_use,
+            "waiting": stats.waiting,
+            "peak_in_use": stats.peak_in_use,
+            "peak_waiting": stats.peak_waiting,
+        }
+        # asyncpg pools report their own size; the SQLite backend opens a connection per use
+        pool = getattr(self._backend, "_pool", None)
+        if hasattr(pool, "get_size"):
+            status.update(size=pool.get_size(), idle=pool.get_idle_size(),
+                          min_size=pool.get_min_size(), max_size=pool.get_max_size())
+        return status
+
+    def report(self, top=10, sort="mean"):
+        stats = self.stats
+        return {
+            "backend": self.url.dialect,
+            "since": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(stats.since)),
+            "pool": self.pool_status(),
+            "acquire": {
+                "count": stats.acquires,
+                "timeouts": stats.acquire_timeouts,
+                "timeout_s": self.acquire_timeout,
+                "wait_ms": summarize_ms(stats.acquire_waits, stats.acquire_wait_max),
+            },
+            "queries": {
+                "count": stats.queries,
+                "errors": stats.query_errors,
+                "duration_ms": summarize_ms(stats.query_times, stats.query_time_max),
+            },
+            "slowest": stats.slowest(top, sort),
+        }
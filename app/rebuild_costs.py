@@ -0,0 +1,33 @@
+import argparse
+import logging
+import sqlalchemy
+from . import costing
+from .db import DATABASE_URL
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Replay the green bean stock ledger and compare it with the cost layers, movement costs
+# and roast costs maintained as stock moves. --check only reports; otherwise the replayed
+# state is written, and --method switches every bean to fifo or average costing:
+#     python -m app.rebuild_costs [--check] [--method fifo|average]
+# Run it while nothing else writes stock movements.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild or check green bean costs")
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--method", choices=costing.METHODS)
+    args = parser.parse_args()
+    engine = sqlalchemy.create_engine(DATABASE_URL)
+    try:
+        with engine.begin() as connection:
+            report = costing.rebuild(connection, method=args.method, check_only=args.check)
+    finally:
+        engine.dispose()
+    mismatches = report["bean_mismatches"] + report["movement_mismatches"] + report["roast_mismatches"]
+    logger.info(f"Replayed {report['movements']} movements for {report['beans']} beans and {report['roasts']} roasts: "
+                f"{report['bean_mismatches']} beans, {report['movement_mismatches']} movements and "
+                f"{report['roast_mismatches']} roasts differed from the stored costs")
+    if report["examples"]:
+        logger.info(f"Differing beans include: {', '.join(report['examples'])}")
+    if args.check and mismatches:
+        raise SystemExit(1)
@@ -0,0 +1,20 @@
+import asyncio
+import logging
+import sys
+from .main import database, rebuild_phase_metrics
+
+logger = logging.getLogger(__name__)
+
+# Recompute cached phase metrics for curves stored before the phase engine existed, or
+# whose metrics are stale; --all recomputes every curve (e.g. after tuning app/phases.py):
+#     python -m app.rebuild_phases [--all]
+async def main(force):
+    await database.connect()
+    try:
+        analyzed, derived = await rebuild_phase_metrics(force=force)
+        logger.info(f"Analyzed {analyzed} roast curves, filled derived times for {derived} roasts")
+    finally:
+        await database.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(main("--all" in sys.argv[1:]))
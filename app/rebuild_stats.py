@@ -0,0 +1,18 @@
+import asyncio
+import logging
+from .main import database, rebuild_stats
+
+logger = logging.getLogger(__name__)
+
+# Full rebuild of the per-coffee and per-bean statistics tables:
+#     python -m app.rebuild_stats
+async def main():
+    await database.connect()
+    try:
+        groups = await rebuild_stats()
+        logger.info(f"Rebuilt statistics for {groups} coffee/bean metrics")
+    finally:
+        await database.disconnect()
+
+if __name__ == "__main__":
+    asyncio.run(main())
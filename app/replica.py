@@ -0,0 +1,132 @@
+import contextvars
+import logging
+import sqlalchemy
+from .db import VERSIONED_TABLES, database, read_database, table_versions
+
+logger = logging.getLogger(__name__)
+
+# After a successful write, the client gets the table versions it must be able to read
+# back, as an X-Read-After header and a cookie sent on later requests
+READ_AFTER_HEADER = "x-read-after"
+READ_AFTER_COOKIE = "read_after"
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+# Database the current request reads from, set by ReplicaMiddleware; the primary
+# unless the route reads from the replica
+current_reader = contextvars.ContextVar("current_reader", default=database)
+
+def reader():
+    return current_reader.get()
+
+def versions_query():
+    return sqlalchemy.select(table_versions.c.table_name, table_versions.c.version).where(
+        table_versions.c.table_name.in_([table.name for table in VERSIONED_TABLES])
+    )
+
+async def positions(db):
+    # Version of every versioned table, in VERSIONED_TABLES order. Every write bumps the
+    # versions of its tables in its own transaction, so a copy with versions at least
+    # these has every write committed before they were read.
+    rows = {row["table_name"]: row["version"] for row in await db.fetch_all(versions_query())}
+    return tuple(rows.get(table.name, 0) for table in VERSIONED_TABLES)
+
+def encode_token(position):
+    return ".".join(str(version) for version in position)
+
+def decode_token(token):
+    try:
+        position = tuple(int(version) for version in token.split("."))
+    except ValueError:
+        return None
+    return position if len(position) == len(VERSIONED_TABLES) else None
+
+def caught_up(position, required):
+    return all(have >= need for have, need in zip(position, required))
+
+# Furthest position seen on the replica. It only moves forward, so it is only asked
+# again for tokens beyond this.
+replica_position = ()
+reads = {"replica": 0, "primary": 0}
+
+def request_token(scope):
+    for name, value in scope["headers"]:
+        if name == READ_AFTER_HEADER.encode():
+            return value.decode("latin-1")
+    for name, value in scope["headers"]:
+        if name == b"cookie":
+            for part in value.decode("latin-1").split(";"):
+                key, _, token = part.strip().partition("=")
+                if key == READ_AFTER_COOKIE:
+                    return token
+    return None
+
+async def replica_ready(scope):
+    # Whether the replica has the writes of the request's token (any, without one)
+    global replica_position
+    token = request_token(scope)
+    if not token:
+        return True
+    required = decode_token(token)
+    if required is None:
+        return False
+    if replica_position and caught_up(replica_position, required):
+        return True
+    try:
+        position = await positions(read_database)
+    except Exception as e:
+        logger.warning(f"Reading from the primary, the replica's position is unknown: {str(e)}")
+        return False
+    replica_position = tuple(map(max, replica_position or position, position))
+    return caught_up(replica_position, required)
+
+def report():
+    return {
+        "reads": dict(reads),
+        "replica_position": encode_token(replica_position) if replica_position else None,
+    }
+
+class ReplicaMiddleware:
+    """Sends GETs on the given routes to the replica, with read-your-writes per client.
+
+    A client whose request carries a token (X-Read-After header or read_after cookie)
+    from its own write reads from the primary until the replica has caught up with it.
+    Without read_your_writes (a read pool on the primary itself) there are no tokens.
+    """
+
+    def __init__(self, app, routes, max_age_s=300, read_your_writes=True):
+        self.app = app
+        self.routes = frozenset(routes)
+        self.max_age_s = max_age_s
+        self.read_your_writes = read_your_writes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if scope["method"] in ("GET", "HEAD") and scope["path"] in self.routes:
+            ready = not self.read_your_writes or await replica_ready(scope)
+            target = read_database if ready else database
+            reads["replica" if target is read_database else "primary"] += 1
+            reset = current_reader.set(target)
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                current_reader.reset(reset)
+            return
+        if scope["method"] not in WRITE_METHODS or not self.read_your_writes:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_token(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                # The write has committed by the time its response starts
+                token = encode_token(await positions(database)).encode()
+                message = dict(message, headers=list(message.get("headers", [])) + [
+                    (READ_AFTER_HEADER.encode(), token),
+                    (b"set-cookie", b"%s=%s; Max-Age=%d; Path=/; HttpOnly; SameSite=Lax" % (
+                        READ_AFTER_COOKIE.encode(), token, self.max_age_s,
+                    )),
+                ])
+            await send(message)
+
+        await self.app(scope, receive, send_with_token)
@@ -0,0 +1,33 @@
+import argparse
+import asyncio
+import logging
+import time
+from .main import apply_rescore, database, load_template, rescore, rescore_summary
+
+logger = logging.getLogger(__name__)
+
+# Rescore every cupping with a scoring template (latest version unless --version), e.g.
+# to preview a new template against the history; --apply also saves the new totals:
+#     python -m app.rescore sca [--version 2] [--apply]
+async def main(args):
+    await database.connect()
+    try:
+        started = time.perf_counter()
+        template_key, template = await load_template(args.template_id, args.version)
+        computed = await rescore(template_key, template)
+        summary = await rescore_summary(template_key)
+        logger.info(f"Template {template_key[0]} v{template_key[1]}: computed {computed} scores in "
+                    f"{time.perf_counter() - started:.1f}s; {summary['changed']} of {summary['scores']} "
+                    f"differ from the stored total (mean change {summary['mean_change']})")
+        if args.apply:
+            await apply_rescore(template_key)
+            logger.info("Saved the new totals and rebuilt the statistics")
+    finally:
+        await database.disconnect()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rescore cuppings with a scoring template")
+    parser.add_argument("template_id")
+    parser.add_argument("--version", type=int)
+    parser.add_argument("--apply", action="store_true")
+    asyncio.run(main(parser.parse_args()))
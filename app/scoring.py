@@ -0,0 +1,89 @@
+import numpy as np
+
+# Cupping attributes a template can weight, as stored on coffee_scores
+ATTRIBUTES = (
+    "fragrance_aroma",
+    "flavor",
+    "aftertaste",
+    "acidity",
+    "body",
+    "uniformity",
+    "clean_cup",
+    "sweetness",
+    "overall",
+)
+
+# The sheet the frontend used to compute itself: every attribute once, overall twice,
+# minus defect points. A defect costs cups x intensity, 2 per cup for a taint and 4 per
+# cup for a fault.
+DEFAULT_TEMPLATE_ID = "sca"
+DEFAULT_TEMPLATE = {
+    "description": "SCA cupping form",
+    "weights": {**{name: 1.0 for name in ATTRIBUTES}, "overall": 2.0},
+    "defect_intensity": {"taint": 2, "fault": 4},
+    "offset": 0.0,
+    "multiplier": 1.0,
+    "min_score": None,
+    "max_score": None,
+}
+
+def validate_template(definition):
+    # Error messages for a template definition, empty when it can be used
+    errors = []
+    unknown = [name for name in definition["weights"] if name not in ATTRIBUTES]
+    if unknown:
+        errors.append(f"Unknown attributes: {', '.join(unknown)}")
+    if not any(definition["weights"].values()):
+        errors.append("At least one attribute needs a non-zero weight")
+    if any(intensity < 0 for intensity in definition["defect_intensity"].values()):
+        errors.append("Defect intensities must not be negative")
+    low, high = definition.get("min_score"), definition.get("max_score")
+    if low is not None and high is not None and low > high:
+        errors.append("min_score must not be above max_score")
+    return errors
+
+def compile_template(definition):
+    # The definition plus its weights as a vector in ATTRIBUTES order
+    weights = definition["weights"]
+    return dict(definition, weight_vector=np.array([float(weights.get(name, 0.0)) for name in ATTRIBUTES]))
+
+def unknown_defect(score, template):
+    # Error message when a score reports defective cups of a kind the template has no rule for
+    if score.get("defect_cups") and score.get("defect_type") not in template["defect_intensity"]:
+        kinds = ", ".join(template["defect_intensity"])
+        return f"defect_type must be one of: {kinds}"
+    return None
+
+def score_rows(rows, template):
+    """Score many cupping rows in one pass.
+
+    Returns arrays of total scores and defect points. A row with no attribute filled in
+    gets a NaN total, so whatever total it was saved with is kept. Rows without
+    defect_cups keep their defect points as entered (NaN when there are none).
+    """
+    values = lambda name: np.array([row[name] for row in rows], dtype=float)
+    attributes = np.column_stack([values(name) for name in ATTRIBUTES]) if rows else np.empty((0, len(ATTRIBUTES)))
+    rated = ~np.isnan(attributes).all(axis=1)
+    raw = np.nan_to_num(attributes) @ template["weight_vector"]
+
+    intensity = np.array(
+        [template["defect_intensity"].get(row["defect_type"], np.nan) for row in rows], dtype=float
+    )
+    per_cup = values("defect_cups") * intensity
+    defects = np.where(np.isnan(per_cup), values("defects"), per_cup)
+
+    total = template["offset"] + template["multiplier"] * raw - np.nan_to_num(defects)
+    if template["min_score"] is not None or template["max_score"] is not None:
+        total = np.clip(total, template["min_score"], template["max_score"])
+    return np.where(rated, total, np.nan), defects
+
+def result_rows(rows, template):
+    # One {"total_score", "defects"} dict per row, NaN turned into None and rounded to store
+    totals, defects = score_rows(rows, template)
+    return [
+        {
+            "total_score": None if np.isnan(total) else round(float(total), 4),
+            "defects": None if np.isnan(points) else int(round(float(points))),
+        }
+        for total, points in zip(totals, defects)
+    ]
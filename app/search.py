@@ -0,0 +1,137 @@
+import re
+
+# Searchable notes: result kind -> (table, id column)
+SEARCH_SOURCES = {
+    "roast": ("coffee_roasts", "roast_id"),
+    "score": ("coffee_scores", "score_id"),
+    "green_bean": ("green_beans", "bean_id"),
+}
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+SNIPPET_WORDS = 16
+
+# SQLite: one FTS5 table over all notes, kept in sync by triggers on the source tables so
+# every write path (single, bulk, direct SQL) is covered. Porter stemming lets "scorched"
+# match "scorch". Ids are UNINDEXED columns rather than the source rowids, which VACUUM
+# may renumber; the price is a scan when a note is edited or deleted, which is rare.
+FTS5_TABLE = "notes_fts"
+FTS5_CREATE = f"""
+CREATE VIRTUAL TABLE {FTS5_TABLE} USING fts5(
+    kind UNINDEXED, record_id UNINDEXED, notes,
+    tokenize = 'porter unicode61 remove_diacritics 2'
+)
+"""
+
+def fts5_backfill():
+    return [
+        f"""
+        INSERT INTO {FTS5_TABLE} (kind, record_id, notes)
+        SELECT '{kind}', {id_column}, notes FROM {table} WHERE notes IS NOT NULL AND notes != ''
+        """
+        for kind, (table, id_column) in SEARCH_SOURCES.items()
+    ]
+
+def fts5_triggers():
+    statements = []
+    for kind, (table, id_column) in SEARCH_SOURCES.items():
+        statements += [
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_notes_fts_insert AFTER INSERT ON {table}
+            WHEN new.notes IS NOT NULL AND new.notes != '' BEGIN
+                INSERT INTO {FTS5_TABLE} (kind, record_id, notes) VALUES ('{kind}', new.{id_column}, new.notes);
+            END
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_notes_fts_update AFTER UPDATE OF notes, {id_column} ON {table} BEGIN
+                DELETE FROM {FTS5_TABLE} WHERE kind = '{kind}' AND record_id = old.{id_column};
+                INSERT INTO {FTS5_TABLE} (kind, record_id, notes)
+                SELECT '{kind}', new.{id_column}, new.notes WHERE new.notes IS NOT NULL AND new.notes != '';
+            END
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_notes_fts_delete AFTER DELETE ON {table} BEGIN
+                DELETE FROM {FTS5_TABLE} WHERE kind = '{kind}' AND record_id = old.{id_column};
+            END
+            """,
+        ]
+    return statements
+
+# Postgres: a GIN expression index per table. Queries use the same expression, so the
+# index is maintained by Postgres itself on every write.
+PG_CONFIG = "english"
+PG_DOCUMENT = f"to_tsvector('{PG_CONFIG}', coalesce(notes, ''))"
+
+def postgres_indexes():
+    return [
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_notes_fts ON {table} USING GIN ({PG_DOCUMENT})"
+        for table, _ in SEARCH_SOURCES.values()
+    ]
+
+QUERY_TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+WORD = re.compile(r"\w+")
+
+def fts5_match(text):
+    # Build an FTS5 query from user input without exposing FTS5 syntax: every word must
+    # match, "quoted words" match as a phrase and OR between terms means either
+    parts = []
+    for phrase, word in QUERY_TOKEN.findall(text):
+        if word == "OR" or word.lower() == "or":
+            if parts and parts[-1] != "OR":
+                parts.append("OR")
+            continue
+        tokens = WORD.findall(phrase or word)
+        if phrase and tokens:
+            parts.append('"' + " ".join(tokens) + '"')
+        else:
+            parts += [f'"{token}"' for token in tokens]
+    while parts and parts[-1] == "OR":
+        parts.pop()
+    if parts and parts[0] == "OR":
+        parts.pop(0)
+    return " ".join(parts)
+
+# bm25 ranking reads every match's document size, so a term found in tens of thousands
+# of notes costs ~100ms to rank. Ranking stops at the newest SQLITE_MAX_CANDIDATES
+# matches instead, found with a rowid bound that FTS5 can seek on.
+SQLITE_MAX_CANDIDATES = 5000
+
+def sqlite_search(kinds):
+    kind_filter = ""
+    if kinds:
+        kind_filter = "AND kind IN (" + ", ".join(f":kind{i}" for i in range(len(kinds))) + ")"
+    return f"""
+        SELECT kind, record_id, -rank AS rank,
+               snippet({FTS5_TABLE}, 2, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', {SNIPPET_WORDS}) AS snippet
+        FROM {FTS5_TABLE}
+        WHERE {FTS5_TABLE} MATCH :query {kind_filter}
+          AND rowid >= (
+            SELECT min(rowid) FROM (
+                SELECT rowid FROM {FTS5_TABLE} WHERE {FTS5_TABLE} MATCH :query {kind_filter}
+                ORDER BY rowid DESC LIMIT {SQLITE_MAX_CANDIDATES}
+            )
+          )
+        ORDER BY {FTS5_TABLE}.rank
+        LIMIT :limit
+    """
+
+def postgres_search(kinds):
+    # Rank inside each table through its GIN index, then build headlines for the top
+    # rows only; ts_headline re-parses the text and is the expensive part
+    hits = " UNION ALL ".join(
+        f"""
+        SELECT '{kind}' AS kind, {id_column} AS record_id, notes,
+               ts_rank_cd({PG_DOCUMENT}, q.query) AS rank
+        FROM {table}, q
+        WHERE {PG_DOCUMENT} @@ q.query
+        """
+        for kind, (table, id_column) in SEARCH_SOURCES.items()
+        if not kinds or kind in kinds
+    )
+    options = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxWords={SNIPPET_WORDS}, MinWords=5"
+    return f"""
+        WITH q AS (SELECT websearch_to_tsquery('{PG_CONFIG}', :query) AS query),
+        top AS ({hits} ORDER BY rank DESC, record_id LIMIT :limit)
+        SELECT kind, record_id, rank, ts_headline('{PG_CONFIG}', notes, q.query, '{options}') AS snippet
+        FROM top, q
+        ORDER BY rank DESC, record_id
+    """
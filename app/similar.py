@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import os
+import time
+import warnings
+import numpy as np
+import sqlalchemy
+from .db import coffee_roasts, green_beans, table_versions
+
+logger = logging.getLogger(__name__)
+
+# Roast parameters compared, each z-scored so they weigh the same
+FEATURES = ("agtron_whole", "agtron_ground", "drop_temp", "development_time", "total_time", "dtr_ratio")
+# Bean attributes results can be restricted to
+CATEGORIES = ("origin", "processing")
+MIN_SCALE = 1e-6
+# Distances sampled per query to pick a cut-off below which the nearest must lie
+SAMPLE_SIZE = 1000
+# Roasts read per query while loading
+LOAD_BATCH_SIZE = 50_000
+# With several workers, each one's index sees the others' roasts after a reload, at most
+# this often and only when roasts changed; 0 never reloads
+SIMILAR_INDEX_MAX_AGE_S = float(os.getenv("SIMILAR_INDEX_MAX_AGE_S", "300"))
+
+def columns(rows):
+    # Rows of select_features() -> ids, (n, features) float array with NaN for missing
+    # values, and the category values
+    rows = [tuple(row[name] for name in ("roast_id",) + FEATURES + CATEGORIES) for row in rows]
+    ids = [row[0] for row in rows]
+    values = np.array([row[1:1 + len(FEATURES)] for row in rows], dtype=float).reshape(len(rows), len(FEATURES))
+    categories = [[row[1 + len(FEATURES) + c] for row in rows] for c in range(len(CATEGORIES))]
+    return ids, values, categories
+
+class RoastIndex:
+    """Exact nearest-neighbour search over roast parameters, in memory.
+
+    Features are z-scored with the mean and standard deviation of the roasts the index
+    was built from and stored one row per feature, so a query is one matrix-vector
+    product over every roast plus a selection among the few under a sampled cut-off. A
+    missing value counts as the mean in the roasts searched and is left out of the
+    distance when the query roast lacks it. Roasts added later are scaled the same way.
+    """
+
+    def __init__(self, ids=(), values=None, categories=None):
+        values = np.empty((0, len(FEATURES))) if values is None else values
+        with warnings.catch_warnings():
+            # Features nobody recorded give NaN ("mean of empty slice"), replaced below
+            warnings.simplefilter("ignore", RuntimeWarning)
+            self.mean = np.nan_to_num(np.nanmean(values, axis=0))
+            self.scale = np.fmax(np.nan_to_num(np.nanstd(values, axis=0), nan=1.0), MIN_SCALE)
+        self.size = 0
+        self.ids = []
+        self.positions = {}
+        self.codes = [{} for _ in CATEGORIES]
+        self.allocate(max(1024, len(ids)))
+        self.upsert(ids, values, categories or [[None] * len(ids) for _ in CATEGORIES])
+
+    def allocate(self, capacity, keep=0):
+        # Arrays for capacity roasts, with the first keep copied from the current ones
+        old = keep and (self.features, self.half_norms, self.missing, self.categories)
+        self.features = np.zeros((len(FEATURES), capacity), np.float32)
+        # Half the squared norm of each roast: its distance to q ranks by half_norm - x.q
+        self.half_norms = np.zeros(capacity, np.float32)
+        # Bit j set when feature j is missing
+        self.missing = np.zeros(capacity, np.uint8)
+        # Code per category, 0 when unknown
+        self.categories = np.zeros((len(CATEGORIES), capacity), np.int32)
+        if old:
+            self.features[:, :keep] = old[0][:, :keep]
+            self.half_norms[:keep] = old[1][:keep]
+            self.missing[:keep] = old[2][:keep]
+            self.categories[:, :keep] = old[3][:, :keep]
+
+    def upsert(self, ids, values, categories):
+        # Adds roasts, or replaces the features of ones already indexed
+        if not len(ids):
+            return
+        indexed = self.size
+        positions = np.empty(len(ids), np.int64)
+        for i, roast_id in enumerate(ids):
+            position = self.positions.get(roast_id)
+            if position is None:
+                position = self.positions[roast_id] = self.size
+                self.ids.append(roast_id)
+                self.size += 1
+            positions[i] = position
+        if self.size > self.features.shape[1]:
+            self.allocate(max(self.size, 2 * self.features.shape[1]), keep=indexed)
+
+        missing = np.isnan(values)
+        scaled = np.where(missing, 0.0, (values - self.mean) / self.scale).astype(np.float32)
+        self.features[:, positions] = scaled.T
+        self.half_norms[positions] = 0.5 * (scaled * scaled).sum(axis=1)
+        self.missing[positions] = (missing * (1 << np.arange(len(FEATURES)))).sum(axis=1)
+        for c, labels in enumerate(categories):
+            codes = self.codes[c]
+            self.categories[c, positions] = [
+                0 if label is None else codes.setdefault(label, len(codes) + 1) for label in labels
+            ]
+
+    def nearest(self, distances, k, keep=None):
+        """Positions of the k smallest distances, nearest first, among those keep accepts.
+
+        keep filters an array of positions. Every roast under a cut-off taken from a sample
+        of the distances is a candidate; when at least k candidates pass keep, the k
+        nearest are among them, so only the candidates are filtered and sorted. Otherwise
+        the cut-off is raised, up to a full sort.
+        """
+        n = len(distances)
+        stride = max(1, n // SAMPLE_SIZE)
+        sample = np.sort(distances[::stride]) if stride > 1 else None
+        rank = k // stride + 1
+        while sample is not None and rank < len(sample):
+            cut = sample[rank]
+            if not np.isfinite(cut):
+                break
+            candidates = np.flatnonzero(distances <= cut)
+            if keep is not None:
+                candidates = keep(candidates)
+            if len(candidates) >= k:
+                return candidates[np.argsort(distances[candidates], kind="stable")[:k]]
+            rank *= 4
+        candidates = np.arange(n) if keep is None else keep(np.arange(n))
+        if k < len(candidates):
+            candidates = candidates[np.argpartition(distances[candidates], k - 1)[:k]]
+        return candidates[np.argsort(distances[candidates], kind="stable")]
+
+    def query(self, roast_id, k=10, same=()):
+        """The k roasts closest to roast_id, as (roast_id, distance) pairs, nearest first.
+
+        same lists CATEGORIES the results must share with the roast. Raises KeyError for a
+        roast not in the index and ValueError when the roast has no value to match.
+        """
+        position = self.positions[roast_id]
+        n = self.size
+        features = self.features[:, :n]
+        q = features[:, position].copy()
+        distances = np.dot(q, features)
+        np.subtract(self.half_norms[:n], distances, out=distances)
+        skipped = [j for j in range(len(FEATURES)) if self.missing[position] >> j & 1]
+        for j in skipped:
+            distances -= 0.5 * features[j] ** 2
+        distances[position] = np.inf
+
+        required = []
+        for category in same:
+            c = CATEGORIES.index(category)
+            code = self.categories[c, position]
+            if not code:
+                raise ValueError(f"Roast {roast_id} has no {category} to match")
+            required.append((self.categories[c], code))
+
+        def keep(candidates):
+            for codes, code in required:
+                candidates = candidates[codes[candidates] == code]
+            return candidates
+
+        nearest = self.nearest(distances, min(k, n), keep if required else None)
+        nearest = nearest[np.isfinite(distances[nearest])]
+        # Exact distances for the few results, over the features the query roast has
+        used = np.array([j not in skipped for j in range(len(FEATURES))])
+        exact = np.sqrt((((features[:, nearest] - q[:, None]) ** 2) * used[:, None]).sum(axis=0))
+        return [(self.ids[i], float(d)) for i, d in zip(nearest, exact)]
+
+def select_features():
+    return sqlalchemy.select(
+        coffee_roasts.c.roast_id,
+        *[coffee_roasts.c[name] for name in FEATURES],
+        *[green_beans.c[name] for name in CATEGORIES],
+    ).select_from(coffee_roasts.outerjoin(green_beans, green_beans.c.bean_id == coffee_roasts.c.bean_id))
+
+def roasts_version_query():
+    return sqlalchemy.select(table_versions.c.version).where(table_versions.c.table_name == coffee_roasts.name)
+
+class SimilarRoasts:
+    """The RoastIndex of a database: loaded on first use, then kept current.
+
+    touch() marks roasts this worker wrote; they are read back and indexed before the
+    next query, so callers see their own roasts at once. Roasts written by other workers
+    arrive with a reload in the background, when the index is older than max_age_s and
+    the roasts table version has moved.
+    """
+
+    def __init__(self, database, max_age_s=SIMILAR_INDEX_MAX_AGE_S):
+        self.database = database
+        self.max_age_s = max_age_s
+        self.current = None
+        self.loading = None
+        self.loaded_at = 0.0
+        self.version = None
+        self.pending = set()
+
+    def touch(self, roast_ids):
+        if self.current is not None or self.loading is not None:
+            self.pending.update(roast_ids)
+
+    async def load(self):
+        started = time.perf_counter()
+        version = await self.database.fetch_val(roasts_version_query())
+        pending = set(self.pending)
+        batches = []
+        last_id = ""
+        while True:
+            rows = await self.database.fetch_all(
+                select_features().where(coffee_roasts.c.roast_id > last_id)
+                .order_by(coffee_roasts.c.roast_id).limit(LOAD_BATCH_SIZE)
+            )
+            if not rows:
+                break
+            batches.append(columns(rows))
+            last_id = rows[-1]["roast_id"]
+        ids = [roast_id for batch in batches for roast_id in batch[0]]
+        values = np.concatenate([batch[1] for batch in batches]) if batches else None
+        categories = [[label for batch in batches for label in batch[2][c]] for c in range(len(CATEGORIES))]
+        index = RoastIndex(ids, values, categories)
+        # Roasts touched before the load began are in it; later ones stay pending
+        self.pending -= pending
+        self.current, self.loaded_at, self.version = index, time.monotonic(), version
+        logger.info(f"Indexed {index.size} roasts for similarity search "
+                    f"({(time.perf_counter() - started) * 1000:.0f} ms)")
+        return index
+
+    async def refresh(self):
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error(f"Reloading the similar roasts index failed: {str(e)}")
+        finally:
+            self.loading = None
+
+    async def apply_pending(self):
+        roast_ids, self.pending = list(self.pending), set()
+        try:
+            for start in range(0, len(roast_ids), LOAD_BATCH_SIZE):
+                chunk = roast_ids[start:start + LOAD_BATCH_SIZE]
+                rows = await self.database.fetch_all(select_features().where(coffee_roasts.c.roast_id.in_(chunk)))
+                if rows:
+                    self.current.upsert(*columns(rows))
+        except Exception:
+            self.pending.update(roast_ids)
+            raise
+
+    async def index(self, include=()):
+        # The index with this worker's writes and the given roasts applied
+        if self.current is None:
+            if self.loading is None:
+                self.loading = asyncio.ensure_future(self.load())
+            try:
+                await asyncio.shield(self.loading)
+            finally:
+                if self.loading is not None and self.loading.done():
+                    self.loading = None
+        elif (self.max_age_s and self.loading is None
+              and time.monotonic() - self.loaded_at > self.max_age_s):
+            self.loaded_at = time.monotonic()
+            if await self.database.fetch_val(roasts_version_query()) != self.version:
+                self.loading = asyncio.ensure_future(self.refresh())
+        self.pending.update(include)
+        if self.pending:
+            await self.apply_pending()
+        return self.current
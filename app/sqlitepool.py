@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import os
+import urllib.parse
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+class SQLiteConnectionPool:
+    """Long-lived aiosqlite connections, in place of the SQLite backend's connection per use.
+
+    Every connection runs the given pragmas once when it opens. With size 1 the pool is a
+    single writer: transactions wait for the connection in arrival order instead of racing
+    each other for the database lock. read_only connections open the file with mode=ro,
+    so a write sent to them fails rather than taking the lock.
+    """
+
+    def __init__(self, path, size=1, read_only=False, pragmas=(), **options):
+        self.path = path
+        self.size = size
+        self.read_only = read_only
+        self.pragmas = tuple(pragmas)
+        self.options = options
+        self.opened = 0
+        # Created on first use, inside the running event loop
+        self.idle = None
+        # The backend drops a reference to shared in-memory databases on disconnect
+        self._memref = None
+
+    async def open(self):
+        if self.read_only:
+            uri = "file:{}?mode=ro".format(urllib.parse.quote(os.path.abspath(self.path)))
+            connection = aiosqlite.connect(database=uri, uri=True, isolation_level=None, **self.options)
+        else:
+            connection = aiosqlite.connect(database=self.path, isolation_level=None, **self.options)
+        await connection.__aenter__()
+        try:
+            for pragma in self.pragmas:
+                await connection.execute(f"PRAGMA {pragma}")
+        except Exception:
+            await connection.close()
+            raise
+        return connection
+
+    async def acquire(self):
+        if self.idle is None:
+            self.idle = asyncio.Queue()
+        if self.idle.empty() and self.opened < self.size:
+            self.opened += 1
+            try:
+                return await self.open()
+            except Exception:
+                self.opened -= 1
+                raise
+        return await self.idle.get()
+
+    async def release(self, connection):
+        if connection.in_transaction:
+            # Left mid-transaction (e.g. a cancelled request); the next user must not inherit it
+            try:
+                await connection.rollback()
+            except Exception as e:
+                logger.warning(f"Closing a SQLite connection that could not roll back: {str(e)}")
+                self.opened -= 1
+                await connection.close()
+                return
+        if self.idle is None:
+            # Released after the pool closed
+            self.opened -= 1
+            await connection.close()
+            return
+        self.idle.put_nowait(connection)
+
+    async def close(self):
+        # Connections still in use are closed when they are released
+        if self.idle is None:
+            return
+        while not self.idle.empty():
+            await self.idle.get_nowait().close()
+            self.opened -= 1
+        self.idle = None
+
+    # Same accessors as asyncpg pools, for InstrumentedDatabase.pool_status
+    def get_size(self):
+        return self.opened
+
+    def get_idle_size(self):
+        return self.idle.qsize() if self.idle is not None else 0
+
+    def get_min_size(self):
+        return 0
+
+    def get_max_size(self):
+        return self.size
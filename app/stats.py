@@ -0,0 +1,122 @@
+import math
+from collections import defaultdict
+
+# Roast and score columns summarised per coffee and per green bean
+ROAST_METRICS = ("dtr_ratio", "drop_temp", "agtron_whole", "agtron_ground", "development_time", "total_time")
+SCORE_METRICS = ("total_score",)
+
+# Percentiles are read from a log-bucketed histogram (as in DDSketch): every value in a
+# bucket is within RELATIVE_ACCURACY of the bucket's representative value, and two
+# histograms merge by adding their bucket counts
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+# Values at or below this go into a single zero bucket
+MIN_POSITIVE = 1e-9
+ZERO_BIN = -(2 ** 31)
+
+def bin_index(value):
+    if value <= MIN_POSITIVE:
+        return ZERO_BIN
+    return math.ceil(math.log(value) / LOG_GAMMA)
+
+def bin_value(index):
+    if index == ZERO_BIN:
+        return 0.0
+    return 2 * GAMMA ** index / (GAMMA + 1)
+
+def clamp(value, lower=None, upper=None):
+    if lower is not None:
+        value = max(value, lower)
+    if upper is not None:
+        value = min(value, upper)
+    return value
+
+def quantile(bins, q, lower=None, upper=None):
+    # bins: {bin index: count}. A bucket's representative value can lie just outside
+    # the values seen, so it is clamped to the group's min and max when given.
+    total = sum(bins.values())
+    if not total:
+        return None
+    rank = q * (total - 1)
+    seen = 0
+    for index in sorted(bins):
+        seen += bins[index]
+        if seen > rank:
+            return clamp(bin_value(index), lower, upper)
+    return clamp(bin_value(max(bins)), lower, upper)
+
+def summarize(row, bins, percentiles):
+    count = row["count"]
+    mean = row["total"] / count if count else None
+    stdev = None
+    if count > 1:
+        variance = (row["total_sq"] - row["total"] ** 2 / count) / (count - 1)
+        stdev = math.sqrt(max(variance, 0.0))
+    summary = {
+        "group_type": row["group_type"],
+        "group_key": row["group_key"],
+        "metric": row["metric"],
+        "count": count,
+        "mean": mean,
+        "stdev": stdev,
+        "min": row["min_value"],
+        "max": row["max_value"],
+    }
+    for percentile in percentiles:
+        summary[f"p{percentile:g}"] = quantile(bins, percentile / 100, row["min_value"], row["max_value"])
+    return summary
+
+class StatsBatch:
+    # Accumulates values in memory and turns them into merge rows for the stats tables
+    def __init__(self):
+        self.summaries = {}
+        self.bins = defaultdict(int)
+
+    def add(self, group_type, group_key, metric, value, weight=1):
+        # weight=-1 retracts a value added earlier. Min and max cannot be retracted,
+        # so they stay as wide as ever until the stats are rebuilt.
+        if group_key is None or value is None:
+            return
+        value = float(value)
+        key = (group_type, group_key, metric)
+        summary = self.summaries.setdefault(key, [0, 0.0, 0.0, None, None])
+        summary[0] += weight
+        summary[1] += weight * value
+        summary[2] += weight * value * value
+        if weight > 0:
+            summary[3] = value if summary[3] is None else min(summary[3], value)
+            summary[4] = value if summary[4] is None else max(summary[4], value)
+        self.bins[key + (bin_index(value),)] += weight
+
+    def add_roast(self, roast, metrics=ROAST_METRICS, weight=1):
+        for metric in metrics:
+            self.add("coffee", roast.get("coffee_name"), metric, roast.get(metric), weight)
+            self.add("bean", roast.get("bean_id"), metric, roast.get(metric), weight)
+
+    def add_score(self, score, roast):
+        for metric in SCORE_METRICS:
+            self.add("coffee", roast.get("coffee_name"), metric, score.get(metric))
+            self.add("bean", roast.get("bean_id"), metric, score.get(metric))
+
+    def summary_rows(self):
+        return [
+            {
+                "group_type": group_type,
+                "group_key": group_key,
+                "metric": metric,
+                "count": count,
+                "total": total,
+                "total_sq": total_sq,
+                "min_value": min_value,
+                "max_value": max_value,
+            }
+            for (group_type, group_key, metric), (count, total, total_sq, min_value, max_value)
+            in self.summaries.items()
+        ]
+
+    def bin_rows(self):
+        return [
+            {"group_type": group_type, "group_key": group_key, "metric": metric, "bin": index, "count": count}
+            for (group_type, group_key, metric, index), count in self.bins.items()
+        ]
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from .pool import SAMPLE_SIZE, summarize_ms
+
+logger = logging.getLogger(__name__)
+
+class WriteQueueFull(Exception):
+    pass
+
+class GroupCommitQueue:
+    """Runs write jobs from many requests in shared transactions.
+
+    A job is an async function that does its writes on the database. submit() returns
+    its result only after the transaction that ran it has committed, so an acknowledged
+    write is as durable as one committed on its own. Each job runs in a savepoint: one
+    that fails (e.g. out of stock) is rolled back alone and its error goes to its caller.
+    A batch closes when it has max_batch jobs or max_delay_s after its first job.
+    """
+
+    def __init__(self, database, max_batch=50, max_delay_s=0.002, max_pending=1000):
+        self.database = database
+        self.max_batch = max_batch
+        self.max_delay_s = max_delay_s
+        self.max_pending = max_pending
+        self.queue = None
+        self.worker = None
+        self.reset()
+
+    def reset(self):
+        self.since = time.time()
+        self.batches = 0
+        self.jobs = 0
+        self.failed_jobs = 0
+        self.failed_batches = 0
+        self.rejected = 0
+        self.batch_sizes = deque(maxlen=SAMPLE_SIZE)
+        self.largest_batch = 0
+        self.commit_times = deque(maxlen=SAMPLE_SIZE)
+        self.commit_time_max = 0.0
+
+    @property
+    def running(self):
+        return self.worker is not None
+
+    async def start(self):
+        self.queue = asyncio.Queue(self.max_pending)
+        self.worker = asyncio.create_task(self.run())
+
+    async def stop(self):
+        # Commits everything already queued; later submits run in their own transaction
+        if self.worker is None:
+            return
+        worker, self.worker = self.worker, None
+        await self.queue.put(None)
+        await worker
+
+    async def submit(self, job):
+        # Without the worker (queue off or shut down) the job commits on its own
+        if self.worker is None:
+            async with self.database.transaction():
+                return await job()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((job, future))
+        except asyncio.QueueFull:
+            # Backpressure: refuse rather than let waiting requests pile up without bound
+            self.rejected += 1
+            raise WriteQueueFull(f"Write queue is full ({self.max_pending} writes pending)")
+        return await future
+
+    async def run(self):
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            if self.max_delay_s and self.queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.max_delay_s)
+            while len(batch) < self.max_batch and not self.queue.empty():
+                item = self.queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self.commit(batch)
+
+    async def commit(self, batch):
+        outcomes = []
+        started = time.perf_counter()
+        try:
+            async with self.database.transaction():
+                for job, future in batch:
+                    try:
+                        async with self.database.transaction():
+                            outcomes.append((future, None, await job()))
+                    except Exception as e:
+                        outcomes.append((future, e, None))
+        except Exception as e:
+            # The batch did not commit, so nothing in it was saved
+            logger.error(f"Group commit of {len(batch)} writes failed: {str(e)}")
+            self.failed_batches += 1
+            outcomes = [(future, e, None) for _, future in batch]
+        elapsed = time.perf_counter() - started
+
+        self.batches += 1
+        self.jobs += len(batch)
+        self.batch_sizes.append(len(batch))
+        self.largest_batch = max(self.largest_batch, len(batch))
+        self.commit_times.append(elapsed)
+        self.commit_time_max = max(self.commit_time_max, elapsed)
+        for future, error, result in outcomes:
+            self.failed_jobs += error is not None
+            # A caller that went away (cancelled request) still had its write committed
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def report(self):
+        return {
+            "running": self.running,
+            "since": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.since)),
+            "pending": self.queue.qsize() if self.queue is not None else 0,
+            "max_pending": self.max_pending,
+            "max_batch": self.max_batch,
+            "max_delay_ms": self.max_delay_s * 1000,
+            "batches": self.batches,
+            "jobs": self.jobs,
+            "failed_jobs": self.failed_jobs,
+            "failed_batches": self.failed_batches,
+            "rejected": self.rejected,
+            "mean_batch": round(sum(self.batch_sizes) / len(self.batch_sizes), 2) if self.batch_sizes else None,
+            "largest_batch": self.largest_batch,
+            "commit_ms": summarize_ms(self.commit_times, self.commit_time_max),
+        }
@@ -0,0 +1,81 @@
+"""Check that bulk imports skip and report bad rows instead of rejecting the import.
+
+Usage:
+    python -m benchmarks.bulk_import
+
+Posts cuppings to /scores/bulk as JSON, NDJSON and CSV, each with a valid row, a row
+with an unknown defect_type and a row that fails validation, and checks that the valid
+row is saved and the other two come back as errors for rows 2 and 3. Runs against
+DATABASE_URL, or a throwaway SQLite file with the default settings when it is not set.
+Exits non-zero on any difference.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    return parser.parse_args()
+
+def bodies(roast_id):
+    rows = [
+        {"roast_id": roast_id, "flavor": 8.0, "defect_cups": 1, "defect_type": "taint"},
+        {"roast_id": roast_id, "flavor": 8.0, "defect_cups": 1, "defect_type": "weird"},
+        {"roast_id": roast_id, "flavor": "not a number"},
+    ]
+    columns = ["roast_id", "flavor", "defect_cups", "defect_type"]
+    csv = "\n".join([",".join(columns)] + [",".join(str(row.get(name, "")) for name in columns) for row in rows])
+    return {
+        "json": ("application/json", json.dumps(rows)),
+        "ndjson": ("application/x-ndjson", "\n".join(json.dumps(row) for row in rows)),
+        "csv": ("text/csv", csv),
+    }
+
+async def run(args):
+    import httpx
+    from app import main
+
+    failures = []
+    await main.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+            roast_id = (await client.post("/roasts/", json={"coffee_name": "Bulk check"})).json()["roast_id"]
+            for name, (content_type, body) in bodies(roast_id).items():
+                response = await client.post("/scores/bulk", content=body, headers={"Content-Type": content_type})
+                result = response.json() if response.status_code == 200 else {}
+                errors = {error["row"]: error["errors"] for error in result.get("errors", [])}
+                print(f"{name:>6}: {response.status_code}, inserted {result.get('inserted')}, "
+                      f"errors {json.dumps(errors)}")
+                if response.status_code != 200:
+                    failures.append(f"{name}: the import was rejected with {response.status_code}: {response.text}")
+                    continue
+                if result["inserted"] != 1:
+                    failures.append(f"{name}: {result['inserted']} rows inserted, expected 1")
+                if sorted(errors) != [2, 3]:
+                    failures.append(f"{name}: errors reported for rows {sorted(errors)}, expected [2, 3]")
+                elif not any("defect_type" in error for error in errors[2]):
+                    failures.append(f"{name}: row 2's error does not name defect_type")
+                for score_id in result["ids"]:
+                    score = (await client.get("/scores/", params={"roast_id": roast_id})).json()
+                    if not any(row["score_id"] == score_id and row["defects"] == 2 for row in score):
+                        failures.append(f"{name}: score {score_id} was not saved with its defect points")
+    finally:
+        await main.shutdown()
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return not failures
+
+def main():
+    args = parse_args()
+    if not os.getenv("DATABASE_URL"):
+        path = os.path.join(tempfile.mkdtemp(), "bulk_import.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    sys.exit(0 if asyncio.run(run(args)) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Measure cold start time of the API with several processes starting at once.
+
+Usage:
+    python -m benchmarks.cold_start --processes 4 --budget-ms 3000
+
+Starts --processes uvicorn servers (default: one per CPU) at the same time against one database, like workers
+or replicas after a deploy, and times each until /health answers. This runs twice: on
+an empty database (one process migrates, the others wait for the lock) and again on the
+migrated one (connection-only startup). Afterwards it checks that every migration was
+applied exactly once. Exits non-zero if a process failed or went over the budget.
+Runs against DATABASE_URL, or a throwaway SQLite file when it is not set (the "empty"
+round is only empty for a fresh database).
+"""
+import argparse
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--budget-ms", type=float, default=3000)
+    parser.add_argument("--timeout-s", type=float, default=60)
+    return parser.parse_args()
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def healthy(port):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+def start_round(args):
+    # Returns [(ms until healthy or None, ms reported by the app or None, exit code)]
+    servers = []
+    started = time.perf_counter()
+    for _ in range(args.processes):
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port)],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+        )
+        servers.append((port, process))
+
+    ready = {}
+    deadline = started + args.timeout_s
+    while len(ready) < len(servers) and time.perf_counter() < deadline:
+        for port, process in servers:
+            if port not in ready and (process.poll() is not None or healthy(port)):
+                ready[port] = (time.perf_counter() - started) * 1000 if process.poll() is None else None
+        time.sleep(0.01)
+
+    results = []
+    for port, process in servers:
+        process.terminate()
+        output, _ = process.communicate(timeout=10)
+        reported = re.search(r"Started in (\d+) ms", output)
+        results.append((ready.get(port), float(reported.group(1)) if reported else None, process.returncode))
+        if ready.get(port) is None:
+            print(output[-2000:])
+    return results
+
+def main():
+    args = parse_args()
+    if not os.getenv("DATABASE_URL"):
+        path = os.path.join(tempfile.mkdtemp(), "cold_start.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    os.environ["STARTUP_BUDGET_MS"] = str(args.budget_ms)
+
+    failures = []
+    for label in ("empty database", "migrated database"):
+        results = start_round(args)
+        print(f"{label}: {args.processes} processes")
+        for i, (until_healthy, reported, _) in enumerate(results):
+            healthy_text = f"{until_healthy:.0f} ms" if until_healthy is not None else "never"
+            reported_text = f"{reported:.0f} ms" if reported is not None else "-"
+            print(f"  process {i}: healthy after {healthy_text} (app startup {reported_text})")
+            if until_healthy is None:
+                failures.append(f"{label}: process {i} did not become healthy")
+            elif reported is not None and reported > args.budget_ms:
+                failures.append(f"{label}: process {i} took {reported:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+
+    import sqlalchemy
+    from app.migrations import LATEST_VERSION
+    engine = sqlalchemy.create_engine(os.environ["DATABASE_URL"])
+    with engine.connect() as connection:
+        versions = [row[0] for row in connection.execute(sqlalchemy.text(
+            "SELECT version FROM schema_migrations ORDER BY version"
+        ))]
+    engine.dispose()
+    print(f"applied migrations: {versions}")
+    if versions != list(range(1, LATEST_VERSION + 1)):
+        failures.append(f"expected migrations 1..{LATEST_VERSION} applied once each")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
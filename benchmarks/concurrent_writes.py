@@ -0,0 +1,66 @@
+"""Check that concurrent single writes all succeed and are all searchable.
+
+Usage:
+    python -m benchmarks.concurrent_writes --writes 50
+
+Sends --writes POST /roasts/, POST /scores/ and POST /green-beans/ requests at once, each
+with notes (so the full-text index is written in the same transaction), then checks
+that every request returned 200 and that /search finds every note. Runs against
+DATABASE_URL, or a throwaway SQLite file with the default settings when it is not set.
+Exits non-zero on any failed write or missing note.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from collections import Counter
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writes", type=int, default=50)
+    return parser.parse_args()
+
+async def run(args):
+    import httpx
+    from app import main
+
+    failures = []
+    await main.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://check", timeout=60) as client:
+            roast_id = (await client.post("/roasts/", json={"coffee_name": "Concurrent check"})).json()["roast_id"]
+            requests = {
+                "roast": ("/roasts/", lambda i: {"coffee_name": "Concurrent check", "notes": f"concurrentroast{i}"}),
+                "score": ("/scores/", lambda i: {"roast_id": roast_id, "flavor": 8.0, "notes": f"concurrentscore{i}"}),
+                "green_bean": ("/green-beans/", lambda i: {"name": f"Concurrent check {i}", "notes": f"concurrentbean{i}"}),
+            }
+            for kind, (path, body) in requests.items():
+                responses = await asyncio.gather(*[client.post(path, json=body(i)) for i in range(args.writes)])
+                statuses = Counter(response.status_code for response in responses)
+                print(f"{kind:>10}: " + ", ".join(f"{count} x {status}" for status, count in sorted(statuses.items())))
+                if statuses[200] != args.writes:
+                    failures.append(f"{args.writes - statuses[200]} of {args.writes} {kind} writes failed")
+                missing = 0
+                for i in range(args.writes):
+                    found = (await client.get("/search", params={"q": body(i)["notes"], "kind": kind})).json()
+                    missing += not found
+                if missing:
+                    failures.append(f"{missing} {kind} notes are not searchable")
+    finally:
+        await main.shutdown()
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return not failures
+
+def main():
+    args = parse_args()
+    if not os.getenv("DATABASE_URL"):
+        path = os.path.join(tempfile.mkdtemp(), "concurrent_writes.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    sys.exit(0 if asyncio.run(run(args)) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Compare random uuid4 keys with time-ordered UUIDv7 keys: insert rate and index size.
+
+Usage:
+    python -m benchmarks.ids --rows 500000 --batch 100
+
+Inserts --rows roasts and as many scores (each pointing at a recent roast, like cuppings
+do) into a throwaway SQLite file per key layout, --batch rows per transaction, and
+reports rows per second and the size of the primary key and foreign key indexes (from
+dbstat). Layouts: uuid4 as 36-character text (the old keys), uuid7 as text (what the app
+now generates, in the same text columns) and uuid7 as a 16-byte BLOB. The app does not
+store keys as BLOBs, since its key columns also hold supplied string keys; that layout
+only shows what a binary column would add.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import uuid
+
+from app.ids import uuid7
+
+LAYOUTS = {
+    "uuid4 text": ("TEXT", lambda: str(uuid.uuid4())),
+    "uuid7 text": ("TEXT", lambda: str(uuid7())),
+    # Not used by the app, for reference
+    "uuid7 blob": ("BLOB", lambda: uuid7().bytes),
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+def run(args, key_type, make_id):
+    rng = random.Random(args.seed)
+    path = os.path.join(tempfile.mkdtemp(), "ids.db")
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.executescript(f"""
+        CREATE TABLE coffee_roasts (roast_id {key_type} PRIMARY KEY, bean_id {key_type}, coffee_name TEXT, drop_temp REAL);
+        CREATE INDEX ix_coffee_roasts_bean_id ON coffee_roasts (bean_id);
+        CREATE TABLE coffee_scores (score_id {key_type} PRIMARY KEY, roast_id {key_type}, flavor REAL);
+        CREATE INDEX ix_coffee_scores_roast_id ON coffee_scores (roast_id);
+    """)
+    beans = [make_id() for _ in range(max(20, args.rows // 500))]
+    roast_ids = []
+    started = time.perf_counter()
+    for start in range(0, args.rows, args.batch):
+        count = min(args.batch, args.rows - start)
+        roasts = [(make_id(), rng.choice(beans), "Kenya AA", rng.uniform(200, 225)) for _ in range(count)]
+        roast_ids.extend(roast[0] for roast in roasts)
+        # Cuppings follow their roasts within days, so they mostly point at recent ones
+        scores = [(make_id(), roast_ids[max(0, len(roast_ids) - 1 - int(rng.expovariate(1 / 50)))], rng.uniform(6, 9))
+                  for _ in range(count)]
+        connection.execute("BEGIN")
+        connection.executemany("INSERT INTO coffee_roasts VALUES (?, ?, ?, ?)", roasts)
+        connection.executemany("INSERT INTO coffee_scores VALUES (?, ?, ?)", scores)
+        connection.execute("COMMIT")
+    elapsed = time.perf_counter() - started
+    sizes = dict(connection.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"))
+    connection.close()
+    return 2 * args.rows / elapsed, sizes, os.path.getsize(path)
+
+def main():
+    args = parse_args()
+    print(f"{args.rows} roasts and {args.rows} scores, {args.batch} rows per transaction")
+    baseline = None
+    for name, (key_type, make_id) in LAYOUTS.items():
+        rate, sizes, file_size = run(args, key_type, make_id)
+        baseline = baseline or (rate, file_size)
+        indexes = {index: size for index, size in sizes.items() if index.startswith(("sqlite_autoindex", "ix_"))}
+        print(f"{name:>11}: {rate:8.0f} rows/s ({rate / baseline[0]:.1f}x), "
+              f"file {file_size / 2**20:.1f} MiB ({file_size / baseline[1]:.2f}x), indexes "
+              + ", ".join(f"{index.replace('sqlite_autoindex_', '').replace('_1', ' key')} {size / 2**20:.1f} MiB"
+                          for index, size in sorted(indexes.items())))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Compare fast (orjson) and standard JSON encoding of /roasts/ and /scores/.
+
+Usage:
+    python -m benchmarks.json_serialization --rows 10000 100000 --repeat 5
+
+For each row count, loads that many roasts and scores straight into the database, then
+fetches the whole table as one page (limit=rows) in both JSON_RESPONSE_MODE settings
+and reports the median latency. Runs against DATABASE_URL, or a throwaway SQLite file
+when it is not set.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    return parser.parse_args()
+
+def roast_row():
+    return {
+        "roast_id": str(uuid.uuid4()),
+        "coffee_name": f"Coffee {random.randrange(50)}",
+        "date": f"2024-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}",
+        "agtron_whole": random.randint(45, 95),
+        "agtron_ground": random.randint(45, 95),
+        "drop_temp": round(random.uniform(195, 225), 1),
+        "development_time": round(random.uniform(1, 3), 2),
+        "total_time": round(random.uniform(9, 14), 2),
+        "dtr_ratio": round(random.uniform(0.12, 0.28), 3),
+        "amount_used_kg": 0.25,
+        "notes": "Sweet, clean finish with notes of stone fruit",
+    }
+
+def score_row(roast_id):
+    attributes = {name: round(random.uniform(6, 9), 2) for name in (
+        "fragrance_aroma", "flavor", "aftertaste", "acidity", "body",
+        "uniformity", "clean_cup", "sweetness", "overall",
+    )}
+    return {
+        "score_id": str(uuid.uuid4()),
+        "roast_id": roast_id,
+        "date": f"2024-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}",
+        "defects": 0,
+        "total_score": round(sum(attributes.values()) + 10, 2),
+        "notes": "Juicy",
+        **attributes,
+    }
+
+async def fill(database, table, rows):
+    async with database.transaction():
+        for start in range(0, len(rows), 5000):
+            await database.execute_many(table.insert(), rows[start:start + 5000])
+
+async def run(args):
+    import httpx
+    from app import main
+
+    results = []
+    await main.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            loaded = 0
+            for count in sorted(args.rows):
+                roasts = [roast_row() for _ in range(count - loaded)]
+                await fill(main.database, main.coffee_roasts, roasts)
+                await fill(main.database, main.coffee_scores, [score_row(roast["roast_id"]) for roast in roasts])
+                loaded = count
+                for path in ("/roasts/", "/scores/"):
+                    timings = {}
+                    for mode in ("standard", "fast"):
+                        main.JSON_RESPONSE_MODE = mode
+                        samples = []
+                        for _ in range(args.repeat):
+                            started = time.perf_counter()
+                            response = await client.get(path, params={"limit": count})
+                            samples.append(time.perf_counter() - started)
+                            assert response.status_code == 200 and len(response.json()) == count
+                        timings[mode] = statistics.median(samples)
+                    results.append((path, count, timings["standard"], timings["fast"]))
+    finally:
+        await main.shutdown()
+
+    print(f"{'route':<10} {'rows':>8} {'standard ms':>12} {'fast ms':>10} {'speedup':>8}")
+    for path, count, standard, fast in results:
+        print(f"{path:<10} {count:>8} {standard * 1000:>12.1f} {fast * 1000:>10.1f} {standard / fast:>7.1f}x")
+
+def main():
+    args = parse_args()
+    if not os.getenv("DATABASE_URL"):
+        path = os.path.join(tempfile.mkdtemp(), "json_serialization.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    # Whole tables are fetched as a single page
+    os.environ.setdefault("MAX_PAGE_SIZE", str(max(args.rows)))
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Compare JSON, Arrow IPC and Parquet responses from the list endpoints.
+
+Usage:
+    python -m benchmarks.list_formats --roasts 5000 --limit 1000 --repeat 20
+
+Seeds --roasts roasts (with green beans) through the bulk endpoints, then fetches
+/roasts/enriched pages of --limit rows in each format and reads them into a pandas
+DataFrame the way the frontend does. Reports response size, time to produce the
+response (server) and time to build the DataFrame (client), best of --repeat.
+Runs against DATABASE_URL, or a throwaway SQLite file when it is not set.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+FORMATS = {
+    "json": "application/json",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--roasts", type=int, default=5000)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    return parser.parse_args()
+
+def to_dataframe(name, content):
+    # Same decoding as read_table in app/frontend.py
+    if name == "arrow":
+        table = pa.ipc.open_stream(content).read_all()
+    elif name == "parquet":
+        table = pq.read_table(pa.BufferReader(content))
+    else:
+        return pd.DataFrame(json.loads(content))
+    return table.to_pandas(split_blocks=True, types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+
+async def seed(client, roasts):
+    beans = [{"bean_id": f"bench-bean-{i}", "name": f"Bean {i}", "origin": random.choice(["Ethiopia", "Kenya", "Colombia"]),
+              "processing": "Washed", "initial_stock_kg": 1e6} for i in range(20)]
+    await client.post("/green-beans/bulk", json=beans)
+    rows = [
+        {
+            "bean_id": f"bench-bean-{random.randrange(20)}",
+            "coffee_name": f"Coffee {random.randrange(50)}",
+            "date": f"2024-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}",
+            "agtron_whole": random.choice([None, random.randint(45, 95)]),
+            "agtron_ground": random.randint(45, 95),
+            "drop_temp": round(random.uniform(195, 225), 1),
+            "development_time": round(random.uniform(1, 3), 2),
+            "total_time": round(random.uniform(9, 14), 2),
+            "dtr_ratio": round(random.uniform(0.12, 0.28), 3),
+            "notes": "Sweet, clean finish with notes of stone fruit",
+        }
+        for _ in range(roasts)
+    ]
+    body = "\n".join(json.dumps(row) for row in rows)
+    await client.post("/roasts/bulk", content=body, headers={"Content-Type": "application/x-ndjson"})
+
+async def run(args):
+    import httpx
+    from app.main import app, startup, shutdown
+
+    await startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await seed(client, args.roasts)
+            results = {}
+            for name, media_type in FORMATS.items():
+                server_times, client_times = [], []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    response = await client.get("/roasts/enriched", params={"limit": args.limit},
+                                                headers={"Accept": media_type})
+                    server_times.append(time.perf_counter() - started)
+                    started = time.perf_counter()
+                    df = to_dataframe(name, response.content)
+                    client_times.append(time.perf_counter() - started)
+                results[name] = (len(response.content), min(server_times), min(client_times), len(df))
+    finally:
+        await shutdown()
+
+    print(f"/roasts/enriched, {args.limit} rows per page, best of {args.repeat}")
+    print(f"{'format':<8} {'bytes':>10} {'server ms':>10} {'client ms':>10} {'total ms':>10}")
+    for name, (size, server, client, rows) in results.items():
+        print(f"{name:<8} {size:>10} {server * 1000:>10.2f} {client * 1000:>10.2f} {(server + client) * 1000:>10.2f}")
+
+def main():
+    args = parse_args()
+    if not os.getenv("DATABASE_URL"):
+        path = os.path.join(tempfile.mkdtemp(), "list_formats.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
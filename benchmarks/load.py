@@ -0,0 +1,393 @@
+"""Drive every API endpoint with concurrent clients and record latency and throughput.
+
+Usage:
+    python -m benchmarks.seed --size 100k
+    DATABASE_URL=sqlite:///./benchmark.db python -m benchmarks.load --output before.json
+    ... change the code ...
+    DATABASE_URL=sqlite:///./benchmark.db python -m benchmarks.load --output after.json --compare before.json
+
+By default each operation in OPERATIONS runs on its own for --duration seconds with
+--concurrency clients (after --warmup seconds), so every endpoint gets its own p50, p95,
+p99 and requests per second. --mode mixed runs all of them together for --duration,
+weighted towards reads. --only and --skip-writes narrow the set (writes change the data,
+so reseed for strictly comparable runs).
+
+The app runs in this process (DATABASE_URL; a throwaway 10k-roast database is seeded
+when it is not set), or pass --base-url to load a running server. Results are written
+to --output as JSON with the git commit, settings and per-operation numbers. --compare
+reads an earlier file and exits non-zero when an operation's p95 grew or its throughput
+fell by more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from benchmarks.phase_engine import synthetic_curve
+from benchmarks.search import DESCRIPTORS
+
+DISCOVERY_ROWS = 500
+CURVE_PROBES = 500
+READ_WEIGHT = 10
+WRITE_WEIGHT = 1
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", help="load a running server instead of the app in this process")
+    parser.add_argument("--mode", choices=("each", "mixed"), default="each")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5, help="seconds per operation (each) or in total (mixed)")
+    parser.add_argument("--warmup", type=float, default=1)
+    parser.add_argument("--only", nargs="+", help="operation names to run")
+    parser.add_argument("--skip-writes", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="load-results.json")
+    parser.add_argument("--label", help="free text stored with the results, e.g. the dataset size")
+    parser.add_argument("--compare", help="results file of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    return parser.parse_args()
+
+class Context:
+    # Ids and values sampled from the database before the run
+    def __init__(self):
+        self.roasts = []
+        self.scores = []
+        self.beans = []
+        self.session_ids = []
+        self.curve_roast_ids = []
+        self.roast_cursors = []
+        self.roasts_etag = None
+
+def day(rng):
+    return f"20{rng.randint(19, 25)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+
+def new_roast(ctx, rng):
+    bean = rng.choice(ctx.beans)
+    return {
+        "bean_id": bean["bean_id"], "coffee_name": f"{bean['name']} Load Test", "date": day(rng),
+        "agtron_ground": rng.randint(45, 95), "drop_temp": round(rng.uniform(200, 225), 1),
+        "development_time": 2.0, "total_time": 11.0, "dtr_ratio": 0.18, "amount_used_kg": 0.01,
+        "notes": "Load test roast, " + rng.choice(DESCRIPTORS),
+    }
+
+def new_score(ctx, rng):
+    attributes = {name: round(rng.uniform(7, 9), 2) for name in (
+        "fragrance_aroma", "flavor", "aftertaste", "acidity", "body", "uniformity", "clean_cup", "sweetness", "overall",
+    )}
+    return {"roast_id": rng.choice(ctx.roasts)["roast_id"], "date": day(rng), **attributes,
+            "defect_cups": rng.choice((0, 0, 0, 1)), "defect_type": "taint", "notes": "Load test cupping"}
+
+def new_session(ctx, rng, cuppers=8, samples=12):
+    roasts = rng.sample(ctx.roasts, samples)
+    return {"name": "Load test session", "date": day(rng), "sheets": [
+        dict(new_score(ctx, rng), roast_id=roast["roast_id"], cupper=f"Cupper {c}", defect_cups=0)
+        for c in range(cuppers) for roast in roasts
+    ]}
+
+def new_bean(ctx, rng):
+    return {"name": f"Load Test Bean {rng.randrange(10**9)}", "origin": "Ethiopia", "processing": "Washed",
+            "initial_stock_kg": 60, "current_stock_kg": 60, "notes": "Load test lot"}
+
+def new_curve(ctx, rng):
+    bean_temp = synthetic_curve(np.random.default_rng(rng.randrange(2**32)), 1.0).round(2).tolist()
+    return {"sample_rate_hz": 1.0, "bean_temp": bean_temp, "burner_events": [{"time_s": 0, "value": 80}]}
+
+def get(path, **params):
+    return {"method": "GET", "url": path, "params": params}
+
+def one_day(path, rng):
+    date = day(rng)
+    return get(path, date_from=date, date_to=date)
+
+# name -> (builds one request from the context and a random generator, writes data)
+OPERATIONS = {
+    "health": (lambda ctx, rng: get("/health"), False),
+    "roasts_list": (lambda ctx, rng: get("/roasts/", limit=100), False),
+    "roasts_list_filtered": (lambda ctx, rng: get(
+        "/roasts/", coffee_name=rng.choice(ctx.roasts)["coffee_name"], date_from="2022-01-01", limit=50,
+    ), False),
+    "roasts_list_next_page": (lambda ctx, rng: get("/roasts/", limit=100, cursor=rng.choice(ctx.roast_cursors)), False),
+    "roasts_list_arrow": (lambda ctx, rng: {
+        **get("/roasts/", limit=1000), "headers": {"Accept": "application/vnd.apache.arrow.stream"},
+    }, False),
+    "roasts_list_not_modified": (lambda ctx, rng: {
+        **get("/roasts/", limit=100), "headers": {"If-None-Match": ctx.roasts_etag or ""},
+    }, False),
+    "roasts_enriched": (lambda ctx, rng: get("/roasts/enriched", limit=100), False),
+    "roasts_export": (lambda ctx, rng: one_day("/roasts/export", rng), False),
+    "roasts_coffee_names": (lambda ctx, rng: get("/roasts/coffee-names"), False),
+    "roast_curve": (lambda ctx, rng: get(f"/roasts/{rng.choice(ctx.curve_roast_ids)}/curve", points=300, ror="true"), False),
+    "roast_phases": (lambda ctx, rng: get(f"/roasts/{rng.choice(ctx.curve_roast_ids)}/phases"), False),
+    "scores_list": (lambda ctx, rng: get("/scores/", limit=100), False),
+    "scores_list_by_roast": (lambda ctx, rng: get("/scores/", roast_id=rng.choice(ctx.scores)["roast_id"]), False),
+    "scores_enriched": (lambda ctx, rng: get(
+        "/scores/enriched", coffee_name=rng.choice(ctx.roasts)["coffee_name"], limit=100,
+    ), False),
+    "scores_export": (lambda ctx, rng: one_day("/scores/export", rng), False),
+    "scoring_templates": (lambda ctx, rng: get("/scoring/templates"), False),
+    "rescored_scores": (lambda ctx, rng: get("/scoring/templates/sca/scores", limit=100), False),
+    "cupping_sessions": (lambda ctx, rng: get("/cupping-sessions/", limit=100), False),
+    "cupping_session": (lambda ctx, rng: get(f"/cupping-sessions/{rng.choice(ctx.session_ids)}"), False),
+    "session_calibration": (lambda ctx, rng: get(f"/cupping-sessions/{rng.choice(ctx.session_ids)}/calibration"), False),
+    "search": (lambda ctx, rng: get("/search", q=rng.choice(DESCRIPTORS), limit=20), False),
+    "stats": (lambda ctx, rng: get("/stats/", group_key=rng.choice(ctx.roasts)["coffee_name"]), False),
+    "stats_by_bean": (lambda ctx, rng: get("/stats/", group_type="bean"), False),
+    "green_beans_list": (lambda ctx, rng: get("/green-beans/"), False),
+    "green_beans_export": (lambda ctx, rng: get("/green-beans/export", format="ndjson"), False),
+    "green_bean": (lambda ctx, rng: get(f"/green-beans/{rng.choice(ctx.beans)['bean_id']}"), False),
+    "green_bean_movements": (lambda ctx, rng: get(f"/green-beans/{rng.choice(ctx.beans)['bean_id']}/movements"), False),
+    "roast_cost": (lambda ctx, rng: get(f"/roasts/{rng.choice(ctx.roasts)['roast_id']}/cost"), False),
+    "roast_similar": (lambda ctx, rng: get(f"/roasts/{rng.choice(ctx.roasts)['roast_id']}/similar", k=10), False),
+    "green_bean_valuation": (lambda ctx, rng: get(f"/green-beans/{rng.choice(ctx.beans)['bean_id']}/valuation"), False),
+    "inventory_valuation": (lambda ctx, rng: get("/inventory/valuation"), False),
+    "metrics": (lambda ctx, rng: get("/metrics"), False),
+    "db_stats": (lambda ctx, rng: get("/db/stats"), False),
+    "roast_create": (lambda ctx, rng: {"method": "POST", "url": "/roasts/", "json": new_roast(ctx, rng)}, True),
+    "roasts_bulk": (lambda ctx, rng: {
+        "method": "POST", "url": "/roasts/bulk", "json": [new_roast(ctx, rng) for _ in range(50)],
+    }, True),
+    "roast_curve_put": (lambda ctx, rng: {
+        "method": "PUT", "url": f"/roasts/{rng.choice(ctx.curve_roast_ids)}/curve", "json": new_curve(ctx, rng),
+    }, True),
+    "score_create": (lambda ctx, rng: {"method": "POST", "url": "/scores/", "json": new_score(ctx, rng)}, True),
+    "scores_bulk": (lambda ctx, rng: {
+        "method": "POST", "url": "/scores/bulk", "json": [new_score(ctx, rng) for _ in range(50)],
+    }, True),
+    "cupping_session_create": (lambda ctx, rng: {
+        "method": "POST", "url": "/cupping-sessions/", "json": new_session(ctx, rng),
+    }, True),
+    "green_bean_create": (lambda ctx, rng: {"method": "POST", "url": "/green-beans/", "json": new_bean(ctx, rng)}, True),
+    "green_beans_bulk": (lambda ctx, rng: {
+        "method": "POST", "url": "/green-beans/bulk", "json": [new_bean(ctx, rng) for _ in range(20)],
+    }, True),
+    "green_bean_stock_update": (lambda ctx, rng: {
+        "method": "PUT", "url": f"/green-beans/{rng.choice(ctx.beans)['bean_id']}/update-stock",
+        "params": {"amount_used": 0.001},
+    }, True),
+}
+
+async def discover(client, concurrency):
+    ctx = Context()
+    response = await client.get("/roasts/", params={"limit": DISCOVERY_ROWS, "fields": "roast_id,coffee_name,bean_id"})
+    ctx.roasts = response.json()
+    ctx.roasts_etag = response.headers.get("etag")
+    ctx.scores = (await client.get("/scores/", params={"limit": DISCOVERY_ROWS, "fields": "score_id,roast_id"})).json()
+    ctx.beans = (await client.get("/green-beans/", params={"fields": "bean_id,name"})).json()
+    sessions = (await client.get("/cupping-sessions/", params={"limit": DISCOVERY_ROWS})).json()
+    ctx.session_ids = [session["session_id"] for session in sessions]
+    if not (ctx.roasts and ctx.scores and ctx.beans and ctx.session_ids):
+        sys.exit("The database needs roasts, scores, green beans and cupping sessions; "
+                 "run python -m benchmarks.seed first")
+
+    for limit in (10, 50, 100):
+        cursor = (await client.get("/roasts/", params={"limit": limit})).headers.get("x-next-cursor")
+        if cursor:
+            ctx.roast_cursors.append(cursor)
+
+    # Roasts with a stored curve, found by probing (the seeder stores one every 50 roasts)
+    limit = asyncio.Semaphore(concurrency)
+
+    async def probe(roast_id):
+        async with limit:
+            response = await client.get(f"/roasts/{roast_id}/phases")
+        return roast_id if response.status_code == 200 else None
+
+    candidates = [roast["roast_id"] for roast in ctx.roasts[:CURVE_PROBES]]
+    found = await asyncio.gather(*(probe(roast_id) for roast_id in candidates))
+    ctx.curve_roast_ids = [roast_id for roast_id in found if roast_id]
+    return ctx
+
+def available(name, ctx):
+    if name in ("roast_curve", "roast_phases", "roast_curve_put"):
+        return bool(ctx.curve_roast_ids)
+    if name == "roasts_list_next_page":
+        return bool(ctx.roast_cursors)
+    return True
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def summarize(samples, elapsed):
+    # samples: [(seconds, status)]
+    if not samples:
+        return {"requests": 0}
+    ordered = sorted(seconds for seconds, _ in samples)
+    statuses = {}
+    for _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    errors = sum(count for status, count in statuses.items() if status == "0" or int(status) >= 400)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "statuses": statuses,
+        "throughput_rps": round(len(samples) / elapsed, 2),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+async def drive(client, ctx, names, concurrency, duration, rng, samples):
+    # Closed loop: each client sends its next request as soon as the previous one returns
+    weights = [WRITE_WEIGHT if OPERATIONS[name][1] else READ_WEIGHT for name in names]
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_rng):
+        while time.perf_counter() < deadline:
+            name = names[0] if len(names) == 1 else worker_rng.choices(names, weights)[0]
+            request = OPERATIONS[name][0](ctx, worker_rng)
+            started = time.perf_counter()
+            try:
+                response = await client.request(**request)
+                status = response.status_code
+            except Exception:
+                status = 0
+            if samples is not None:
+                samples.setdefault(name, []).append((time.perf_counter() - started, status))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(random.Random(rng.random())) for _ in range(concurrency)))
+    return time.perf_counter() - started
+
+async def run(args, client):
+    ctx = await discover(client, args.concurrency)
+    names = [
+        name for name, (_, writes) in OPERATIONS.items()
+        if (not args.only or name in args.only) and not (args.skip_writes and writes) and available(name, ctx)
+    ]
+    rng = random.Random(args.seed)
+    results = {}
+    if args.mode == "mixed":
+        await drive(client, ctx, names, args.concurrency, args.warmup, rng, None)
+        samples = {}
+        elapsed = await drive(client, ctx, names, args.concurrency, args.duration, rng, samples)
+        results = {name: summarize(samples.get(name, []), elapsed) for name in names}
+        results["all"] = summarize([sample for name in names for sample in samples.get(name, [])], elapsed)
+    else:
+        for name in names:
+            await drive(client, ctx, [name], args.concurrency, args.warmup, rng, None)
+            samples = {}
+            elapsed = await drive(client, ctx, [name], args.concurrency, args.duration, rng, samples)
+            results[name] = summarize(samples.get(name, []), elapsed)
+            print_row(name, results[name])
+    return results
+
+def print_header():
+    print(f"{'operation':<26} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+
+def print_row(name, result):
+    if not result["requests"]:
+        print(f"{name:<26} {0:>8}")
+        return
+    print(f"{name:<26} {result['requests']:>8} {result['errors']:>6} {result['throughput_rps']:>8.1f} "
+          f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f}")
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print(f"\ncompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('finished_at')}):")
+    print(f"{'operation':<26} {'p95 ms':>17} {'req/s':>19}")
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if not before or not before.get("requests") or not result.get("requests"):
+            continue
+        p95_change = result["p95_ms"] / before["p95_ms"] - 1
+        rps_change = result["throughput_rps"] / before["throughput_rps"] - 1
+        flag = ""
+        if p95_change > tolerance or rps_change < -tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<26} {before['p95_ms']:>8.2f} {p95_change:>+7.0%} {before['throughput_rps']:>10.1f} "
+              f"{rps_change:>+7.0%}{flag}")
+    return regressions
+
+async def in_process(args):
+    import httpx
+    from app import main
+
+    # Per-request INFO lines (httpx, databases) would be part of what is measured
+    logging.disable(logging.INFO)
+    await main.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=None) as client:
+            return await run(args, client)
+    finally:
+        await main.shutdown()
+
+async def remote(args):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        return await run(args, client)
+
+def main():
+    args = parse_args()
+    if not args.base_url and not os.getenv("DATABASE_URL"):
+        from benchmarks.seed import seed
+        path = os.path.join(tempfile.mkdtemp(), "load.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+        print("seeding a throwaway database with 10000 roasts")
+        seed(os.environ["DATABASE_URL"], 10_000, args.seed)
+
+    started_at = datetime.now(timezone.utc).isoformat()
+    if args.mode == "each":
+        print_header()
+    results = asyncio.run(remote(args) if args.base_url else in_process(args))
+    if args.mode == "mixed":
+        print_header()
+        for name, result in results.items():
+            print_row(name, result)
+
+    output = {
+        "meta": {
+            "commit": git_commit(),
+            "label": args.label,
+            "started_at": started_at,
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "target": args.base_url or "in-process",
+            "database": None if args.base_url else os.getenv("DATABASE_URL", "").split("://")[0],
+            "mode": args.mode,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Measure the cost of the /metrics request middleware.
+
+Usage:
+    python -m benchmarks.metrics_overhead --requests 2000 --calls 100000
+
+Two measurements:
+- the middleware alone, wrapped around an ASGI app that answers immediately (--calls
+  times), giving its cost per request in microseconds;
+- end to end, GET /roasts/?limit=20 and GET /health through the full app with and
+  without the middleware (--requests each, alternating rounds), as median latency.
+Runs against DATABASE_URL, or a throwaway SQLite file when it is not set.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--calls", type=int, default=100000)
+    return parser.parse_args()
+
+class FakeRoute:
+    path = "/roasts/"
+
+async def answer(scope, receive, send):
+    scope["route"] = FakeRoute
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"[]"})
+
+async def time_asgi(app, calls):
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    started = time.perf_counter()
+    for _ in range(calls):
+        scope = {"type": "http", "method": "GET", "path": "/roasts/", "headers": [(b"accept", b"*/*")]}
+        await app(scope, receive, send)
+    return (time.perf_counter() - started) / calls
+
+def set_middleware(app, enabled, middleware_class, all_middleware):
+    app.user_middleware = [m for m in all_middleware if enabled or m.cls is not middleware_class]
+    app.middleware_stack = None
+
+async def run(args):
+    import httpx
+    from app import main, metrics
+
+    bare = await time_asgi(answer, args.calls)
+    wrapped = await time_asgi(metrics.MetricsMiddleware(answer), args.calls)
+    print(f"middleware alone: {(wrapped - bare) * 1e6:.1f} us per request "
+          f"({bare * 1e6:.1f} us bare, {wrapped * 1e6:.1f} us wrapped)")
+
+    all_middleware = list(main.app.user_middleware)
+    await main.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for i in range(50):
+                await client.post("/roasts/", json={"coffee_name": f"Coffee {i}", "date": "2024-01-01", "agtron_ground": 60})
+            print(f"{'route':<16} {'without ms':>11} {'with ms':>9} {'overhead':>9}")
+            for path, params in (("/roasts/", {"limit": 20}), ("/health", {})):
+                samples = {False: [], True: []}
+                rounds = 10
+                for _ in range(rounds):
+                    for enabled in (False, True):
+                        set_middleware(main.app, enabled, metrics.MetricsMiddleware, all_middleware)
+                        for _ in range(args.requests // rounds):
+                            started = time.perf_counter()
+                            await client.get(path, params=params)
+                            samples[enabled].append(time.perf_counter() - started)
+                without, with_ = statistics.median(samples[False]), statistics.median(samples[True])
+                print(f"{path:<16} {without * 1000:>11.3f} {with_ * 1000:>9.3f} {(with_ / without - 1) * 100:>8.1f}%")
+    finally:
+        set_middleware(main.app, True, metrics.MetricsMiddleware, all_middleware)
+        await main.shutdown()
+
+def main():
+    args = parse_args()
+    if not os.getenv("DATABASE_URL"):
+        path = os.path.join(tempfile.mkdtemp(), "metrics_overhead.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
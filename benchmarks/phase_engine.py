@@ -0,0 +1,66 @@
+"""Time the phase detection engine over many synthetic roast curves.
+
+Usage:
+    python -m benchmarks.phase_engine --roasts 10000 --rate 2 --loop-sample 200
+
+Generates noisy curves of varying length, runs app.phases.analyze over all of them in
+batches of --batch roasts, and compares the per-roast cost with calling the engine one
+roast at a time on a sample of --loop-sample curves. No database is needed.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app import phases
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--roasts", type=int, default=10000)
+    parser.add_argument("--rate", type=float, default=2.0, help="sample rate of the synthetic curves, Hz")
+    parser.add_argument("--batch", type=int, default=500, help="roasts per engine pass (as in rebuild_phases)")
+    parser.add_argument("--loop-sample", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+def synthetic_curve(rng, rate):
+    # Probe starts hot, dips to a turning point and climbs to the drop temp
+    total_s = rng.uniform(600, 900)
+    drop_temp = rng.uniform(205, 218)
+    t = np.arange(0, total_s, 1 / rate)
+    bean_temp = 90 + (drop_temp - 90) * (t / total_s) ** 0.6 + 110 * np.exp(-t / 25)
+    return bean_temp + rng.normal(0, 0.3, len(t))
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+    bean_temps = [synthetic_curve(rng, args.rate) for _ in range(args.roasts)]
+    samples = sum(len(bt) for bt in bean_temps)
+
+    started = time.perf_counter()
+    found = 0
+    dtr = []
+    for start in range(0, args.roasts, args.batch):
+        batch = bean_temps[start:start + args.batch]
+        results = phases.analyze(batch, [args.rate] * len(batch))
+        found += int(np.count_nonzero(~np.isnan(results["first_crack_s"])))
+        dtr.append(results["dtr_ratio"])
+    batched = time.perf_counter() - started
+
+    sample = bean_temps[:args.loop_sample]
+    started = time.perf_counter()
+    for bean_temp in sample:
+        phases.analyze([bean_temp], [args.rate])
+    looped = time.perf_counter() - started
+
+    dtr = np.concatenate(dtr)
+    per_roast_batched = batched / args.roasts * 1000
+    per_roast_looped = looped / max(len(sample), 1) * 1000
+    print(f"{args.roasts} roasts, {samples} samples at {args.rate:g} Hz")
+    print(f"batched ({args.batch}/pass): {batched:.2f}s total, {per_roast_batched:.3f} ms/roast")
+    print(f"one at a time ({len(sample)} roasts): {per_roast_looped:.3f} ms/roast "
+          f"({per_roast_looped / per_roast_batched:.1f}x slower)")
+    print(f"first crack found for {found} roasts, median DTR {np.nanmedian(dtr):.3f}")
+
+if __name__ == "__main__":
+    main()
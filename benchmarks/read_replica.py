@@ -0,0 +1,108 @@
+"""Check read-replica routing and read-your-writes.
+
+Usage:
+    python -m benchmarks.read_replica
+    DATABASE_URL=postgresql://.../primary DATABASE_READ_URL=postgresql://.../standby python -m benchmarks.read_replica
+
+Without DATABASE_READ_URL it uses a throwaway SQLite primary and a snapshot of it as
+the replica: a roast written after the snapshot must be listed for the client that
+wrote it (read from the primary) but not for another client (read from the stale
+replica), and after the snapshot is refreshed the writer must read from the replica
+again. With two Postgres URLs (a streaming standby) it checks that the writer sees its
+roast at once and is moved back to the replica once it has replayed the write, within
+--timeout seconds. Exits non-zero on any failure.
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--timeout", type=float, default=10.0)
+    return parser.parse_args()
+
+def snapshot(primary_path, replica_path):
+    source, target = sqlite3.connect(primary_path), sqlite3.connect(replica_path)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+def listed(response, roast_id):
+    return any(row["roast_id"] == roast_id for row in response.json())
+
+async def run(args, paths):
+    import httpx
+    from app import main, replica
+
+    failures = []
+    await main.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+        writer = httpx.AsyncClient(transport=transport, base_url="http://writer")
+        other = httpx.AsyncClient(transport=transport, base_url="http://other")
+        if paths:
+            snapshot(*paths)
+
+        response = await writer.post("/roasts/", json={"coffee_name": "Replica check"})
+        roast_id = response.json()["roast_id"]
+        token = response.headers.get(replica.READ_AFTER_HEADER)
+        print(f"wrote roast {roast_id}, read-after token {token}")
+        if not token or replica.READ_AFTER_COOKIE not in writer.cookies:
+            failures.append("the write response has no read-after token")
+
+        params = {"coffee_name": "Replica check"}
+        before = dict(replica.reads)
+        if not listed(await writer.get("/roasts/", params=params), roast_id):
+            failures.append("the writer does not see its own roast")
+        if replica.reads["primary"] != before["primary"] + 1:
+            failures.append("the writer's read did not go to the primary")
+
+        if paths:
+            if listed(await other.get("/roasts/", params=params), roast_id):
+                failures.append("another client sees the roast on a replica snapshot taken before it")
+            snapshot(*paths)
+            caught_up = True
+        else:
+            deadline = time.monotonic() + args.timeout
+            while not await replica.replica_ready({"headers": [(replica.READ_AFTER_HEADER.encode(), token.encode())]}):
+                if time.monotonic() > deadline:
+                    break
+                await asyncio.sleep(0.1)
+            caught_up = await replica.replica_ready({"headers": [(replica.READ_AFTER_HEADER.encode(), token.encode())]})
+            if not caught_up:
+                failures.append(f"the replica did not replay the write within {args.timeout:g}s")
+
+        if caught_up:
+            before = dict(replica.reads)
+            if not listed(await writer.get("/roasts/", params=params), roast_id):
+                failures.append("the writer does not see its roast on the caught-up replica")
+            if replica.reads["replica"] != before["replica"] + 1:
+                failures.append("the writer's read did not go back to the replica once it caught up")
+        await writer.aclose()
+        await other.aclose()
+    finally:
+        await main.shutdown()
+
+    print(f"reads: {replica.reads}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return not failures
+
+def main():
+    args = parse_args()
+    paths = None
+    if not os.getenv("DATABASE_READ_URL"):
+        directory = tempfile.mkdtemp()
+        paths = (os.path.join(directory, "primary.db"), os.path.join(directory, "replica.db"))
+        os.environ["DATABASE_URL"] = f"sqlite:///{paths[0]}"
+        os.environ["DATABASE_READ_URL"] = f"sqlite:///{paths[1]}"
+    sys.exit(0 if asyncio.run(run(args, paths)) else 1)
+
+if __name__ == "__main__":
+    main()
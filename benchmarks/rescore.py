@@ -0,0 +1,65 @@
+"""Time the rescoring job on a seeded database.
+
+Usage:
+    DATABASE_URL=sqlite:///./benchmark.db python -m benchmarks.rescore --loop-sample 2000
+
+Saves a new version of the default scoring template (flavor counted twice), rescores
+every cupping with it (cold: nothing cached), runs the job again (warm: every result
+cached) and compares the engine's per-score cost with scoring one cupping at a time on
+a sample of --loop-sample rows. Seed the database first with benchmarks.seed.
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from app import scoring
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--loop-sample", type=int, default=2000)
+    return parser.parse_args()
+
+async def run(args):
+    from app import main
+    from app.models import ScoringTemplate
+    await main.startup()
+    try:
+        definition = dict(scoring.DEFAULT_TEMPLATE, weights={**scoring.DEFAULT_TEMPLATE["weights"], "flavor": 2.0})
+        created = await main.create_scoring_template(ScoringTemplate(
+            template_id="benchmark", **dict(definition, description="Benchmark: flavor counted twice"),
+        ))
+        template_key, template = await main.load_template(created["template_id"], created["version"])
+
+        started = time.perf_counter()
+        computed = await main.rescore(template_key, template)
+        cold = time.perf_counter() - started
+        started = time.perf_counter()
+        await main.rescore(template_key, template)
+        warm = time.perf_counter() - started
+        summary = await main.rescore_summary(template_key)
+
+        rows = await main.database.fetch_all(main.coffee_scores.select().limit(args.loop_sample))
+        started = time.perf_counter()
+        scoring.result_rows(rows, template)
+        batched = time.perf_counter() - started
+        started = time.perf_counter()
+        for row in rows:
+            scoring.result_rows([row], template)
+        looped = time.perf_counter() - started
+    finally:
+        await main.shutdown()
+
+    print(f"template {template_key[0]} v{template_key[1]}: {computed} scores")
+    print(f"cold run: {cold:.2f}s ({cold / max(computed, 1) * 1e6:.1f} us/score, including the database)")
+    print(f"warm run (all cached): {warm * 1000:.1f} ms")
+    print(f"{summary['changed']} totals would change, mean change {summary['mean_change']}")
+    print(f"engine only, {len(rows)} rows: {batched / max(len(rows), 1) * 1e6:.2f} us/score batched, "
+          f"{looped / max(len(rows), 1) * 1e6:.2f} us/score one at a time")
+
+def main():
+    logging.disable(logging.INFO)
+    asyncio.run(run(parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Time /search over a large number of notes.
+
+Usage:
+    python -m benchmarks.search --notes 300000 --repeat 20
+
+Loads --notes roasts, scores and green beans (split 50/40/10) with generated tasting
+notes straight into the database (the index triggers fill the text index), then reports
+the median and p95 latency of a set of queries through the endpoint. Runs against
+DATABASE_URL, or a throwaway SQLite file when it is not set. Exits non-zero if results
+are not best match first, checked with one note that repeats "jasmine".
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+DESCRIPTORS = [
+    "jasmine", "bergamot", "stone fruit", "blueberry", "cocoa", "caramel", "brown sugar", "citrus",
+    "black tea", "honey", "red apple", "hazelnut", "winey", "syrupy body", "bright acidity",
+]
+DEFECTS = ["baked", "scorched", "tipped", "underdeveloped", "grassy", "flat", "ashy", "sour"]
+# Outranks every generated note for "jasmine"
+BEST_MATCH = "jasmine jasmine jasmine"
+QUERIES = ["jasmine", "scorched", "baked flat", '"stone fruit"', "tipped OR ashy", "caramel honey", "bergamot"]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=300000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    return parser.parse_args()
+
+def note():
+    words = random.sample(DESCRIPTORS, random.randint(2, 4))
+    if random.random() < 0.15:
+        words.append(random.choice(DEFECTS))
+    return "Notes of " + ", ".join(words) + "."
+
+async def fill(database, table, id_column, count):
+    async with database.transaction():
+        for start in range(0, count, 5000):
+            rows = [{id_column: str(uuid.uuid4()), "notes": note()} for _ in range(min(5000, count - start))]
+            await database.execute_many(table.insert(), rows)
+
+async def run(args):
+    import httpx
+    from app import main
+
+    failures = []
+    await main.startup()
+    try:
+        started = time.perf_counter()
+        await fill(main.database, main.coffee_roasts, "roast_id", args.notes * 5 // 10)
+        await fill(main.database, main.coffee_scores, "score_id", args.notes * 4 // 10)
+        await fill(main.database, main.green_beans, "bean_id", args.notes // 10)
+        best_id = str(uuid.uuid4())
+        await main.database.execute(main.coffee_roasts.insert().values(roast_id=best_id, notes=BEST_MATCH))
+        print(f"loaded {args.notes} notes in {time.perf_counter() - started:.1f}s ({main.SEARCH_BACKEND})")
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            print(f"{'query':<18} {'hits':>5} {'median ms':>10} {'p95 ms':>8}")
+            for query in QUERIES:
+                samples = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    response = await client.get("/search", params={"q": query, "limit": args.limit})
+                    samples.append((time.perf_counter() - started) * 1000)
+                samples.sort()
+                p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+                print(f"{query:<18} {len(response.json()):>5} {statistics.median(samples):>10.1f} {p95:>8.1f}")
+
+            results = (await client.get("/search", params={"q": "jasmine", "limit": args.limit})).json()
+            ranks = [result["rank"] for result in results]
+            if ranks != sorted(ranks, reverse=True):
+                failures.append(f"results are not in descending rank order: {ranks}")
+            if not results or results[0]["id"] != best_id:
+                failures.append(f"the note {BEST_MATCH!r} is not the first result for jasmine")
+    finally:
+        await main.shutdown()
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return not failures
+
+def main():
+    args = parse_args()
+    if not os.getenv("DATABASE_URL"):
+        path = os.path.join(tempfile.mkdtemp(), "search.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    sys.exit(0 if asyncio.run(run(args)) else 1)
+
+if __name__ == "__main__":
+    main()
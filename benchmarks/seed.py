@@ -0,0 +1,378 @@
+"""Seed a database with realistic synthetic green beans, roasts and scores.
+
+Usage:
+    python -m benchmarks.seed --size 100k
+    DATABASE_URL=postgresql://... python -m benchmarks.seed --size 1M
+
+--size is the number of roasts (10k, 100k, 1M or any number). Each roast gets a cupping
+score on average, one green bean exists per 500 roasts (at least 20) with a stock
+ledger that balances, and every --curve-every-th roast gets a roast profile curve.
+Every 1000 roasts add a cupping session: 8 cuppers, each with a bias of their own,
+scoring 12 of them (its calibration is left to be computed on first read). The
+same --seed gives the same data. Rows are bulk loaded (COPY on Postgres, executemany in
+one transaction on SQLite) rather than through the API. The derived data (phase metrics
+and the roast times they fill in, statistics, table versions) is computed with the
+app's own code as the rows are generated; roast costs come from a replay of the stock
+ledger afterwards.
+Seeds DATABASE_URL, or ./benchmark.db when it is not set; the database must not
+already contain roasts.
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+
+import numpy as np
+import sqlalchemy
+
+from app import curves, phases, scoring
+from app.stats import StatsBatch
+from benchmarks.phase_engine import synthetic_curve
+from benchmarks.search import DEFECTS, DESCRIPTORS
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+ROASTS_PER_BEAN = 500
+MIN_BEANS = 20
+CHUNK_ROWS = 50_000
+CURVE_RATE_HZ = 1.0
+
+ORIGINS = {
+    "Ethiopia": ["Yirgacheffe", "Guji", "Sidamo", "Limu"],
+    "Kenya": ["Nyeri", "Kirinyaga", "Embu"],
+    "Colombia": ["Huila", "Nariño", "Cauca", "Tolima"],
+    "Guatemala": ["Antigua", "Huehuetenango", "Acatenango"],
+    "Brazil": ["Cerrado", "Sul de Minas", "Mogiana"],
+    "Costa Rica": ["Tarrazú", "West Valley"],
+    "Rwanda": ["Nyamasheke", "Huye"],
+    "Indonesia": ["Aceh", "Toraja"],
+}
+PROCESSING = ["Washed", "Natural", "Honey", "Anaerobic", "Wet-hulled"]
+VARIETIES = ["Heirloom", "SL28", "Caturra", "Bourbon", "Gesha", "Typica", "Catuai", "Pacamara"]
+ROAST_STYLES = ["", " Filter", " Espresso"]
+SUPPLIERS = ["Red Fox", "Cafe Imports", "Sweet Maria's", "Nordic Approach", "Covoya"]
+# Cuppings are scored with the default template, as POST /scores/ would on a new database
+SCORING_TEMPLATE = scoring.compile_template(scoring.DEFAULT_TEMPLATE)
+# One cupping session per SESSION_EVERY roasts, SESSION_CUPPERS x SESSION_SAMPLES sheets
+SESSION_EVERY = 1000
+SESSION_CUPPERS = 8
+SESSION_SAMPLES = 12
+CUPPERS = [f"Cupper {i}" for i in range(1, 21)]
+FIRST_DAY = date(2019, 1, 1)
+DAYS = 7 * 365
+
+def parse_size(text):
+    if text.lower() in SIZES:
+        return SIZES[text.lower()]
+    return int(text)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=parse_size, default=SIZES["10k"], help="roasts: 10k, 100k, 1M or a number")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--curve-every", type=int, default=50, help="store a roast curve for every Nth roast (0: none)")
+    return parser.parse_args()
+
+class Generator:
+    def __init__(self, size, seed, curve_every):
+        self.rng = random.Random(seed)
+        self.curve_rng = np.random.default_rng(seed)
+        # Sessions draw from their own generator so the other rows stay the same
+        self.session_rng = random.Random(seed + 1)
+        self.curve_every = curve_every
+        self.beans = [self.bean() for _ in range(max(MIN_BEANS, size // ROASTS_PER_BEAN))]
+        # bean_id -> kg roasted, to size each bean's purchase so the ledger balances
+        self.used = {bean["bean_id"]: 0.0 for bean in self.beans}
+        # Statistics accumulated as rows are generated, instead of re-reading them all
+        self.stats = StatsBatch()
+
+    def uuid(self):
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def day(self):
+        return (FIRST_DAY + timedelta(days=self.rng.randrange(DAYS))).isoformat()
+
+    def notes(self):
+        words = self.rng.sample(DESCRIPTORS, self.rng.randint(2, 4))
+        if self.rng.random() < 0.15:
+            words.append(self.rng.choice(DEFECTS))
+        return "Notes of " + ", ".join(words) + "."
+
+    def bean(self):
+        origin = self.rng.choice(list(ORIGINS))
+        region = self.rng.choice(ORIGINS[origin])
+        return {
+            "bean_id": self.uuid(),
+            "name": f"{origin} {region} {self.rng.choice(VARIETIES)}",
+            "origin": origin,
+            "processing": self.rng.choice(PROCESSING),
+            "variety": self.rng.choice(VARIETIES),
+            "altitude": f"{self.rng.randrange(1200, 2300, 50)} masl",
+            "purchase_date": FIRST_DAY.isoformat(),
+            "price_per_kg": round(self.rng.uniform(6, 25), 2),
+            "supplier": self.rng.choice(SUPPLIERS),
+            "notes": self.notes(),
+        }
+
+    def roast(self):
+        bean = self.rng.choice(self.beans) if self.rng.random() < 0.95 else None
+        total_time = self.rng.uniform(9, 14)
+        development_time = self.rng.uniform(1, 3)
+        amount = round(self.rng.uniform(0.2, 1.2), 3) if bean else None
+        if bean:
+            self.used[bean["bean_id"]] += amount
+        return {
+            "roast_id": self.uuid(),
+            "bean_id": bean["bean_id"] if bean else None,
+            "date": self.day(),
+            "coffee_name": (bean["name"] if bean else "House Blend") + self.rng.choice(ROAST_STYLES),
+            "agtron_whole": self.rng.randint(45, 95) if self.rng.random() < 0.7 else None,
+            "agtron_ground": self.rng.randint(45, 95),
+            "drop_temp": round(self.rng.uniform(200, 225), 1),
+            "development_time": round(development_time, 2),
+            "total_time": round(total_time, 2),
+            "dtr_ratio": round(development_time / total_time, 3),
+            "amount_used_kg": amount,
+            "notes": self.notes(),
+        }
+
+    def scores(self, roast):
+        # 0-2 scores per roast, one on average, around a per-roast quality
+        quality = self.rng.gauss(7.8, 0.4)
+        rows = []
+        for _ in range(self.rng.choice((0, 1, 1, 2))):
+            attributes = {name: round(min(10, max(6, self.rng.gauss(quality, 0.3))), 2) for name in scoring.ATTRIBUTES}
+            defect_cups = 0 if self.rng.random() < 0.9 else self.rng.choice((1, 1, 2))
+            rows.append({
+                "score_id": self.uuid(),
+                "roast_id": roast["roast_id"],
+                "date": roast["date"],
+                **attributes,
+                "defects": None,
+                "defect_cups": defect_cups,
+                "defect_type": self.rng.choice(("taint", "fault")),
+                "total_score": None,
+                "template_id": scoring.DEFAULT_TEMPLATE_ID,
+                "template_version": 1,
+                "notes": self.notes(),
+                "cupper": None,
+                "session_id": None,
+            })
+        return rows
+
+    def session(self, roasts):
+        # A cupping session row, the roasts it cupped and one sheet per cupper and roast
+        rng = self.session_rng
+        session_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        samples = rng.sample(roasts, SESSION_SAMPLES)
+        day = max(roast["date"] for roast in samples)
+        quality = [rng.gauss(7.8, 0.4) for _ in samples]
+        sheets = []
+        for cupper in rng.sample(CUPPERS, SESSION_CUPPERS):
+            bias = rng.gauss(0, 0.2)
+            for roast, level in zip(samples, quality):
+                attributes = {name: round(min(10, max(6, rng.gauss(level + bias, 0.25))), 2) for name in scoring.ATTRIBUTES}
+                sheets.append({
+                    "score_id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                    "roast_id": roast["roast_id"],
+                    "date": day,
+                    **attributes,
+                    "defects": None,
+                    "defect_cups": 0,
+                    "defect_type": None,
+                    "total_score": None,
+                    "template_id": scoring.DEFAULT_TEMPLATE_ID,
+                    "template_version": 1,
+                    "notes": None,
+                    "cupper": cupper,
+                    "session_id": session_id,
+                })
+        session = {
+            "session_id": session_id,
+            "name": f"Calibration {day}",
+            "date": day,
+            "notes": None,
+            "cupper_count": SESSION_CUPPERS,
+            "sample_count": SESSION_SAMPLES,
+            "sheet_count": len(sheets),
+            "created_at": f"{day}T12:00:00+00:00",
+            "calibration": None,
+        }
+        return session, samples, sheets
+
+    def movement(self, bean_id, change_kg, reason, day, roast_id=None, at="12:00:00"):
+        return {
+            "movement_id": self.uuid(),
+            "bean_id": bean_id,
+            "roast_id": roast_id,
+            "change_kg": change_kg,
+            "reason": reason,
+            "created_at": f"{day}T{at}+00:00",
+        }
+
+    def curve(self, roast, bean_temp):
+        return {
+            "roast_id": roast["roast_id"],
+            "sample_rate_hz": CURVE_RATE_HZ,
+            "sample_count": len(bean_temp),
+            "encoding": curves.CURVE_ENCODING,
+            "bean_temp": curves.encode_series(bean_temp, curves.TEMP_SCALE),
+            "env_temp": None,
+            "burner_times": curves.encode_series([0.0], curves.TIME_SCALE),
+            "burner_values": curves.encode_series([80.0], curves.TEMP_SCALE),
+            "updated_at": f"{roast['date']}T12:00:00+00:00",
+        }
+
+    def chunks(self, size):
+        # Yields {table name: rows} for CHUNK_ROWS roasts at a time
+        for start in range(0, size, CHUNK_ROWS):
+            tables = {
+                "coffee_roasts": [], "coffee_scores": [], "green_bean_stock_movements": [],
+                "roast_curves": [], "roast_phase_metrics": [], "cupping_sessions": [],
+            }
+            profiled, bean_temps, scored = [], [], []
+            for i in range(start, min(size, start + CHUNK_ROWS)):
+                roast = self.roast()
+                tables["coffee_roasts"].append(roast)
+                for score in self.scores(roast):
+                    tables["coffee_scores"].append(score)
+                    scored.append(roast)
+                if roast["bean_id"]:
+                    tables["green_bean_stock_movements"].append(self.movement(
+                        roast["bean_id"], -roast["amount_used_kg"], "roast", roast["date"], roast["roast_id"]
+                    ))
+                if self.curve_every and i % self.curve_every == 0:
+                    bean_temp = synthetic_curve(self.curve_rng, CURVE_RATE_HZ).round(2).tolist()
+                    tables["roast_curves"].append(self.curve(roast, bean_temp))
+                    profiled.append(roast)
+                    bean_temps.append(bean_temp)
+            for _ in range(len(tables["coffee_roasts"]) // SESSION_EVERY):
+                session, samples, sheets = self.session(tables["coffee_roasts"])
+                tables["cupping_sessions"].append(session)
+                tables["coffee_scores"].extend(sheets)
+                scored.extend(samples * SESSION_CUPPERS)
+            if profiled:
+                # Phase metrics as a curve upload would derive them, before the roast
+                # statistics are taken
+                results = phases.analyze(bean_temps, [CURVE_RATE_HZ] * len(bean_temps))
+                for roast, metrics in zip(profiled, phases.metrics_rows(results)):
+                    roast.update(phases.roast_columns(metrics) or {})
+                    tables["roast_phase_metrics"].append(dict(
+                        metrics, roast_id=roast["roast_id"], curve_updated_at=f"{roast['date']}T12:00:00+00:00",
+                    ))
+            for score, result in zip(tables["coffee_scores"], scoring.result_rows(tables["coffee_scores"], SCORING_TEMPLATE)):
+                score.update(result)
+            for score, roast in zip(tables["coffee_scores"], scored):
+                self.stats.add_score(score, roast)
+            for roast in tables["coffee_roasts"]:
+                self.stats.add_roast(roast)
+            yield tables
+
+    def final_tables(self):
+        # Written last, once every roast is known: each bean's purchase covers its usage
+        # plus a surplus
+        movements = []
+        for bean in self.beans:
+            surplus = round(self.rng.uniform(5, 50), 3)
+            bean["initial_stock_kg"] = round(self.used[bean["bean_id"]] + surplus, 3)
+            bean["current_stock_kg"] = round(bean["initial_stock_kg"] - self.used[bean["bean_id"]], 6)
+            # Before any roast of the first day, so the ledger replays in order
+            movements.append(self.movement(
+                bean["bean_id"], bean["initial_stock_kg"], "purchase", FIRST_DAY.isoformat(), at="00:00:00",
+            ))
+        return {
+            "green_beans": self.beans,
+            "green_bean_stock_movements": movements,
+            "coffee_stats": self.stats.summary_rows(),
+            "coffee_stats_bins": self.stats.bin_rows(),
+        }
+
+def csv_value(value):
+    if isinstance(value, bytes):
+        return "\\x" + value.hex()
+    return value
+
+def copy_rows(cursor, table, rows):
+    # Postgres: COPY ... FROM STDIN (CSV, where an empty unquoted field is NULL)
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([csv_value(row[column]) for column in columns])
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def insert_rows(cursor, table, rows):
+    columns = list(rows[0])
+    placeholders = ", ".join("?" for _ in columns)
+    cursor.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+        [tuple(row[column] for column in columns) for row in rows],
+    )
+
+def load(url, generator, size):
+    engine = sqlalchemy.create_engine(url)
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        postgres = engine.dialect.name == "postgresql"
+        if not postgres:
+            # One transaction, no fsync per page: a crash mid-seed just means seeding again.
+            # The larger page cache keeps the random-key index inserts off the disk.
+            cursor.execute("PRAGMA synchronous = OFF")
+            cursor.execute("PRAGMA cache_size = -262144")
+        cursor.execute("SELECT count(*) FROM coffee_roasts")
+        if cursor.fetchone()[0]:
+            sys.exit("The database already has roasts; seed an empty database")
+        write = copy_rows if postgres else insert_rows
+        counts = {}
+        for tables in generator.chunks(size):
+            for table, rows in tables.items():
+                if rows:
+                    write(cursor, table, rows)
+                    counts[table] = counts.get(table, 0) + len(rows)
+            print(f"  {counts['coffee_roasts']} roasts", flush=True)
+        for table, rows in generator.final_tables().items():
+            write(cursor, table, rows)
+            counts[table] = counts.get(table, 0) + len(rows)
+        cursor.execute("UPDATE table_versions SET version = version + 1")
+        connection.commit()
+        cursor.execute("ANALYZE")
+        connection.commit()
+    finally:
+        connection.close()
+        engine.dispose()
+    return counts
+
+def cost_ledger(url):
+    # Roast costs and bean cost layers, by the same ledger replay as app.rebuild_costs
+    from app import costing
+    engine = sqlalchemy.create_engine(url)
+    try:
+        with engine.begin() as connection:
+            return costing.rebuild(connection)
+    finally:
+        engine.dispose()
+
+def seed(url, size, seed=1, curve_every=50):
+    from app.migrations import migrate
+    migrate(url)
+    started = time.perf_counter()
+    counts = load(url, Generator(size, seed, curve_every), size)
+    cost_ledger(url)
+    return counts, time.perf_counter() - started
+
+def main():
+    args = parse_args()
+    if not os.getenv("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = "sqlite:///./benchmark.db"
+    url = os.environ["DATABASE_URL"]
+    counts, elapsed = seed(url, args.size, args.seed, args.curve_every)
+    print(f"loaded in {elapsed:.1f}s: " + ", ".join(f"{count} {table}" for table, count in counts.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Time similar-roast queries on the in-memory index at a large number of roasts.
+
+Usage:
+    python -m benchmarks.similar --roasts 1000000 --queries 200 --budget-ms 10
+
+Builds the index of /roasts/{roast_id}/similar from --roasts synthetic roasts (the
+ranges benchmarks.seed generates, 30% without agtron_whole, a few origins and
+processing methods), then reports the build time and the median and p95 latency of
+--queries queries for the --k nearest, unrestricted and restricted to the same origin
+and processing. Every tenth query is checked against a brute-force search. Exits
+non-zero on a wrong result or a p95 over --budget-ms.
+"""
+import argparse
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from app.similar import CATEGORIES, FEATURES, RoastIndex
+
+ORIGINS = ["Ethiopia", "Kenya", "Colombia", "Guatemala", "Brazil", "Rwanda", None]
+PROCESSING = ["Washed", "Natural", "Honey", "Anaerobic"]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--roasts", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+def synthetic_roasts(rng, count):
+    total_time = rng.uniform(9, 14, count)
+    development_time = rng.uniform(1, 3, count)
+    values = np.column_stack([
+        np.where(rng.random(count) < 0.7, rng.integers(45, 96, count), np.nan),
+        rng.integers(45, 96, count),
+        np.round(rng.uniform(200, 225, count), 1),
+        np.round(development_time, 2),
+        np.round(total_time, 2),
+        np.round(development_time / total_time, 3),
+    ])
+    categories = [
+        [ORIGINS[i] for i in rng.integers(0, len(ORIGINS), count)],
+        [PROCESSING[i] for i in rng.integers(0, len(PROCESSING), count)],
+    ]
+    return [f"roast-{i}" for i in range(count)], values, categories
+
+def brute_force(index, values, categories, position, k, same):
+    scaled = np.where(np.isnan(values), 0.0, (values - index.mean) / index.scale)
+    used = ~np.isnan(values[position])
+    distances = np.sqrt((((scaled - scaled[position]) ** 2) * used).sum(axis=1))
+    distances[position] = np.inf
+    for category in same:
+        labels = categories[CATEGORIES.index(category)]
+        distances[[label != labels[position] for label in labels]] = np.inf
+    nearest = np.argsort(distances, kind="stable")[:k]
+    return distances[nearest][np.isfinite(distances[nearest])]
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+    ids, values, categories = synthetic_roasts(rng, args.roasts)
+    started = time.perf_counter()
+    index = RoastIndex(ids, values, categories)
+    print(f"Indexed {index.size} roasts ({len(FEATURES)} features) in {time.perf_counter() - started:.2f}s")
+
+    failures = []
+    with_origin = [i for i in range(args.roasts) if categories[0][i] is not None]
+    for same in ((), ("origin",), ("origin", "processing")):
+        positions = rng.choice(with_origin, args.queries)
+        latencies = []
+        for n, position in enumerate(positions):
+            started = time.perf_counter()
+            result = index.query(ids[position], args.k, same)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if n % 10 == 0:
+                expected = brute_force(index, values, categories, position, args.k, same)
+                if not np.allclose([distance for _, distance in result], expected, atol=1e-3):
+                    failures.append(f"{ids[position]} (same {', '.join(same) or 'nothing'}): wrong neighbours")
+        p95 = sorted(latencies)[int(len(latencies) * 0.95)]
+        label = "same " + " and ".join(same) if same else "unrestricted"
+        print(f"{label:>30}: median {statistics.median(latencies):.2f} ms, p95 {p95:.2f} ms")
+        if p95 > args.budget_ms:
+            failures.append(f"{label}: p95 {p95:.2f} ms over the {args.budget_ms:g} ms budget")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
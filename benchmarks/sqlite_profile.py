@@ -0,0 +1,138 @@
+"""Compare SQLite's default setup with the WAL single-writer profile under mixed traffic.
+
+Usage:
+    python -m benchmarks.sqlite_profile --requests 3000 --concurrency 32 --write-ratio 0.3
+
+Runs the same workload once per profile, each in a fresh process on a throwaway SQLite
+file preloaded with --roasts roasts: --requests requests with --concurrency in flight,
+--write-ratio of them writes (roasts that deduct green stock, cuppings and stock
+adjustments) and the rest list, search and stats reads. Reports successful reads and
+writes per second, errors and latency for each profile. "default" is SQLITE_PROFILE=default
+as the app runs without settings; "wal" is SQLITE_PROFILE=wal, which also turns the write
+queue on. Other SQLITE_* and WRITE_QUEUE_* settings are passed through.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+PROFILES = ("default", "wal")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--write-ratio", type=float, default=0.3)
+    parser.add_argument("--roasts", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--profile", choices=PROFILES, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+def workload(rng, args, bean_id, roast_ids):
+    reads = [
+        lambda: ("GET", "/roasts/", {"params": {"limit": 50}}),
+        lambda: ("GET", "/roasts/", {"params": {"coffee_name": rng.choice(("Kenya", "Ethiopia", "Colombia"))}}),
+        lambda: ("GET", "/green-beans/", {}),
+        lambda: ("GET", "/stats/", {}),
+        lambda: ("GET", "/search", {"params": {"q": "berry"}}),
+    ]
+    writes = [
+        lambda: ("POST", "/roasts/", {"json": {"coffee_name": "Kenya", "bean_id": bean_id, "amount_used_kg": 0.1,
+                                               "notes": "berry and citrus"}}),
+        lambda: ("POST", "/scores/", {"json": {"roast_id": rng.choice(roast_ids),
+                                               **{name: rng.uniform(6, 9) for name in ("flavor", "acidity", "body")}}}),
+        lambda: ("PUT", f"/green-beans/{bean_id}/update-stock", {"params": {"amount_used": 0.05}}),
+    ]
+    for _ in range(args.requests):
+        kind = "write" if rng.random() < args.write_ratio else "read"
+        yield (kind,) + rng.choice(writes if kind == "write" else reads)()
+
+async def run(args):
+    import httpx
+    from app import main
+
+    rng = random.Random(args.seed)
+    await main.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            bean_id = (await client.post("/green-beans/", json={
+                "name": "Profile check", "initial_stock_kg": args.requests * 1.0, "price_per_kg": 8.0,
+            })).json()["bean_id"]
+            preload = [{"coffee_name": rng.choice(("Kenya", "Ethiopia", "Colombia")), "notes": "berry, cocoa"}
+                       for _ in range(args.roasts)]
+            roast_ids = (await client.post("/roasts/bulk", json=preload)).json()["ids"][:100]
+            requests = list(workload(rng, args, bean_id, roast_ids))
+
+            slots = asyncio.Semaphore(args.concurrency)
+            latencies = {"read": [], "write": []}
+            statuses = {"read": Counter(), "write": Counter()}
+
+            async def send(kind, method, path, options):
+                async with slots:
+                    started = time.perf_counter()
+                    response = await client.request(method, path, **options)
+                    latencies[kind].append(time.perf_counter() - started)
+                    statuses[kind][response.status_code] += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*[send(*request) for request in requests])
+            elapsed = time.perf_counter() - started
+    finally:
+        await main.shutdown()
+    return {
+        kind: {
+            "ok": statuses[kind][200],
+            "rate": statuses[kind][200] / elapsed,
+            "errors": {str(status): count for status, count in statuses[kind].items() if status != 200},
+            "p50_ms": percentile(latencies[kind], 0.5) * 1000,
+            "p95_ms": percentile(latencies[kind], 0.95) * 1000,
+        }
+        for kind in ("read", "write")
+    }
+
+def run_profile(args, profile):
+    env = dict(os.environ, SQLITE_PROFILE=profile,
+               DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'profile.db')}")
+    env.pop("DATABASE_READ_URL", None)
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.sqlite_profile", "--profile", profile,
+         "--requests", str(args.requests), "--concurrency", str(args.concurrency),
+         "--write-ratio", str(args.write_ratio), "--roasts", str(args.roasts), "--seed", str(args.seed)],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+def main():
+    args = parse_args()
+    if args.profile:
+        logging.disable(logging.WARNING)
+        print(json.dumps(asyncio.run(run(args))))
+        return
+
+    print(f"{args.requests} requests ({args.write_ratio:.0%} writes), {args.concurrency} in flight, "
+          f"{args.roasts} roasts preloaded")
+    baseline = {}
+    for profile in PROFILES:
+        result = run_profile(args, profile)
+        for kind in ("read", "write"):
+            numbers = result[kind]
+            baseline.setdefault(kind, numbers["rate"] or 1)
+            errors = ", ".join(f"{count} x {status}" for status, count in sorted(numbers["errors"].items())) or "none"
+            print(f"{profile:>8} {kind:>5}s: {numbers['rate']:7.0f}/s ({numbers['rate'] / baseline[kind]:.1f}x), "
+                  f"{numbers['ok']} ok, errors: {errors}, "
+                  f"latency p50 {numbers['p50_ms']:.1f} ms, p95 {numbers['p95_ms']:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Fire hundreds of concurrent roasts at one green bean and check the stock ledger.
+
+Usage:
+    python -m benchmarks.stock_concurrency --roasts 300 --stock-kg 20 --amount-kg 0.1
+
+Runs against DATABASE_URL, or a throwaway SQLite file when it is not set, with
+--sqlite-profile (default: "default", SQLite's own settings). Exits non-zero if any roast
+was lost or double-counted, or failed for any reason other than a 409 stock refusal
+(e.g. "database is locked" on SQLite).
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--roasts", type=int, default=300)
+    parser.add_argument("--stock-kg", type=float, default=20.0)
+    parser.add_argument("--amount-kg", type=float, default=0.1)
+    parser.add_argument("--sqlite-profile", choices=("default", "wal"), default="default")
+    return parser.parse_args()
+
+async def run(args):
+    import httpx
+    from app.main import app, startup, shutdown
+
+    await startup()
+    try:
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.post("/green-beans/", json={
+                "name": "Concurrency check",
+                "initial_stock_kg": args.stock_kg,
+            })
+            bean_id = response.json()["bean_id"]
+
+            roast = {"coffee_name": "Concurrency check", "bean_id": bean_id, "amount_used_kg": args.amount_kg}
+            started = time.perf_counter()
+            responses = await asyncio.gather(*[
+                client.post("/roasts/", json=roast) for _ in range(args.roasts)
+            ])
+            elapsed = time.perf_counter() - started
+
+            statuses = [response.status_code for response in responses]
+            bean = (await client.get(f"/green-beans/{bean_id}")).json()
+            movements = (await client.get(f"/green-beans/{bean_id}/movements")).json()
+            roasts = (await client.get("/roasts/", params={"bean_id": bean_id, "limit": 1000})).json()
+    finally:
+        await shutdown()
+
+    accepted = statuses.count(200)
+    refused = statuses.count(409)
+    other_errors = len(statuses) - accepted - refused
+    expected_accepted = min(args.roasts, int(round(args.stock_kg / args.amount_kg, 6)))
+    ledger_total = sum(movement["change_kg"] for movement in movements)
+    expected_stock = args.stock_kg - accepted * args.amount_kg
+
+    print(f"{args.roasts} roasts in {elapsed:.2f}s: {accepted} accepted, "
+          f"{refused} refused for stock, {other_errors} other errors")
+    print(f"stock {bean['current_stock_kg']:.6f}kg, ledger total {ledger_total:.6f}kg, "
+          f"expected {expected_stock:.6f}kg")
+
+    failures = []
+    if other_errors:
+        failures.append(f"{other_errors} roasts failed with errors other than a stock refusal")
+    if accepted + other_errors < expected_accepted:
+        failures.append(f"only {accepted} of {expected_accepted} roasts accepted; stock was refused too early")
+    if not other_errors and accepted != expected_accepted:
+        failures.append(f"expected {expected_accepted} accepted roasts, got {accepted}")
+    if len(roasts) != accepted:
+        failures.append(f"{len(roasts)} roast rows stored for {accepted} accepted roasts")
+    if abs(bean["current_stock_kg"] - max(expected_stock, 0)) > 1e-6:
+        failures.append("current stock does not match accepted roasts")
+    if abs(bean["current_stock_kg"] - ledger_total) > 1e-6:
+        failures.append("current stock does not match the ledger")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return not failures
+
+def main():
+    args = parse_args()
+    if not os.getenv("DATABASE_URL"):
+        path = os.path.join(tempfile.mkdtemp(), "stock_concurrency.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+        os.environ["SQLITE_PROFILE"] = args.sqlite_profile
+    sys.exit(0 if asyncio.run(run(args)) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Compare per-request commits with the group-commit write queue under concurrent writes.
+
+Usage:
+    python -m benchmarks.write_queue --writes 2000 --concurrency 64
+
+Posts --writes single cuppings and roasts (half each; roasts deduct green stock) with
+--concurrency requests in flight, once with every request committing on its own and
+once through the write queue, and reports accepted writes per second, errors and
+latency for each. Runs against DATABASE_URL, or a throwaway SQLite file when it is not
+set; WRITE_QUEUE_MAX_BATCH and WRITE_QUEUE_MAX_DELAY_MS tune the queue.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writes", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+async def post_all(client, requests, concurrency):
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def post(path, body):
+        async with slots:
+            started = time.perf_counter()
+            response = await client.post(path, json=body)
+            latencies.append(time.perf_counter() - started)
+            return response.status_code
+
+    started = time.perf_counter()
+    statuses = await asyncio.gather(*[post(path, body) for path, body in requests])
+    return Counter(statuses), latencies, time.perf_counter() - started
+
+async def run(args):
+    import httpx
+    from app import main
+
+    rng = random.Random(args.seed)
+    await main.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            bean_id = (await client.post("/green-beans/", json={
+                "name": "Write queue check", "initial_stock_kg": args.writes * 1.0, "price_per_kg": 8.0,
+            })).json()["bean_id"]
+            roast_ids = [(await client.post("/roasts/", json={"coffee_name": f"Cupping {i}"})).json()["roast_id"]
+                         for i in range(20)]
+
+            def requests():
+                for i in range(args.writes):
+                    if i % 2:
+                        yield "/roasts/", {"coffee_name": "Write queue check", "bean_id": bean_id,
+                                           "amount_used_kg": 0.5}
+                    else:
+                        yield "/scores/", {"roast_id": rng.choice(roast_ids),
+                                           **{name: rng.uniform(6, 9) for name in ("flavor", "acidity", "body")}}
+
+            results = {}
+            for mode in ("per-request", "write queue"):
+                if mode == "write queue":
+                    await main.write_queue.start()
+                main.write_queue.reset()
+                results[mode] = await post_all(client, list(requests()), args.concurrency)
+                queue = main.write_queue.report()
+                await main.write_queue.stop()
+                results[mode] += (queue,)
+    finally:
+        await main.shutdown()
+
+    print(f"{args.writes} writes, {args.concurrency} in flight, {main.database.url.dialect}")
+    baseline = None
+    for mode, (statuses, latencies, elapsed, queue) in results.items():
+        accepted = statuses.pop(200, 0)
+        rate = accepted / elapsed
+        baseline = baseline or rate
+        errors = ", ".join(f"{count} x {status}" for status, count in sorted(statuses.items())) or "none"
+        print(f"{mode:>12}: {rate:7.0f} writes/s ({rate / baseline:.1f}x), {accepted} accepted, errors: {errors}, "
+              f"latency p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p95 {percentile(latencies, 0.95) * 1000:.1f} ms")
+        if queue["batches"]:
+            print(f"{'':>12}  {queue['batches']} commits, mean batch {queue['mean_batch']}, "
+                  f"largest {queue['largest_batch']}, commit p95 {queue['commit_ms']['p95']} ms")
+
+def main():
+    logging.disable(logging.INFO)
+    args = parse_args()
+    if not os.getenv("DATABASE_URL"):
+        path = os.path.join(tempfile.mkdtemp(), "write_queue.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
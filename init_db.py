@@ -1,14 +1,8 @@
-import sqlite3
+from app.migrations import migrate
 
 def init_db():
-    conn = sqlite3.connect("coffee_scores.db")
-    cursor = conn.cursor()
-    
-    with open('app/init_db.sql') as f:
-        cursor.executescript(f.read())
-    
-    conn.commit()
-    conn.close()
+    # Create or upgrade the schema of DATABASE_URL (./coffee_scores.db when it is unset)
+    return migrate()
 
 if __name__ == "__main__":
-    init_db() 
\ No newline at end of file
+    init_db()